@@ -0,0 +1,141 @@
+"""
+Batch ingestion API for DemoERP
+Headless ASGI app (Starlette) for RPA clients: batch insert, upsert and query of records,
+with the same validation rules as the entry form. Shares TableManager with the Streamlit app.
+
+Run with `uvicorn api:app --port 8000` or `python api.py`.
+"""
+import os
+import secrets
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import Request
+from starlette.responses import JSONResponse, PlainTextResponse
+from starlette.routing import Route
+from config import API_CONFIG, APP_INFO, LIMITS
+from database import COLUMN_SCHEMA, get_table_manager
+from modules.ingest import IngestError, insert_records, records_payload, upsert_records
+from modules.instrumentation import metrics
+
+# URL slugs -> section/subsection names used by TableManager
+SECTIONS = {'customers': 'Customers', 'suppliers': 'Suppliers'}
+SUBSECTIONS = {'orders': 'Orders', 'delivery-notes': 'Delivery Notes', 'invoices': 'Invoices'}
+
+def error(status: int, message: str, **extra) -> JSONResponse:
+    return JSONResponse({'error': message, **extra}, status_code=status)
+
+def _authorized(request: Request) -> bool:
+    api_key = os.getenv('ERP_API_KEY', '')
+    return not api_key or secrets.compare_digest(request.headers.get('x-api-key', ''), api_key)
+
+def _writes_enabled() -> bool:
+    """Writes need an API key, unless unauthenticated writes were explicitly allowed (ERP_API_INSECURE=1)"""
+    return bool(os.getenv('ERP_API_KEY')) or os.getenv('ERP_API_INSECURE', '').lower() in ('1', 'true', 'yes')
+
+def _table(request: Request):
+    """(section, subsection) from the URL, or None for unknown slugs"""
+    section = SECTIONS.get(request.path_params['section'])
+    subsection = SUBSECTIONS.get(request.path_params['subsection'])
+    return (section, subsection) if section and subsection else None
+
+def _flag(request: Request, name: str) -> bool:
+    return request.query_params.get(name, '').lower() in ('1', 'true', 'yes')
+
+async def _batch(request: Request):
+    """Records of a write request: a JSON list, or an object with a 'records' list"""
+    try:
+        body = await request.json()
+    except ValueError:
+        raise IngestError("Body must be valid JSON")
+    records = body.get('records') if isinstance(body, dict) else body
+    if not isinstance(records, list):
+        raise IngestError("Body must be a list of records or {\"records\": [...]}")
+    if len(records) > API_CONFIG['max_batch_size']:
+        raise IngestError(f"At most {API_CONFIG['max_batch_size']} records per request")
+    return records
+
+async def health(request: Request) -> JSONResponse:
+    return JSONResponse({'status': 'ok', 'app': APP_INFO['name'], 'version': APP_INFO['version']})
+
+async def schema(request: Request) -> JSONResponse:
+    """Accepted fields: column names, and the schema field names they can also be sent as"""
+    return JSONResponse({'fields': list(COLUMN_SCHEMA.values()), 'aliases': COLUMN_SCHEMA,
+                         'sections': list(SECTIONS), 'subsections': list(SUBSECTIONS)})
+
+async def write_records(request: Request) -> JSONResponse:
+    """
+    POST inserts the batch, PUT upserts it by order line (Cod_Emisor, Num_Pedido, Cod_Art_EAN).
+    Valid records are written in one go and invalid ones are reported per row
+    (`?all_or_nothing=1` writes nothing if any record is invalid).
+    """
+    if not _authorized(request):
+        return error(401, "Invalid or missing X-API-Key")
+    if not _writes_enabled():
+        return error(403, "Writes are disabled: set ERP_API_KEY (or ERP_API_INSECURE=1 on a trusted host)")
+    table = _table(request)
+    if table is None:
+        return error(404, "Unknown section or subsection")
+    write = upsert_records if request.method == 'PUT' else insert_records
+    try:
+        records = await _batch(request)
+        report = await run_in_threadpool(write, get_table_manager(), *table, records,
+                                         all_or_nothing=_flag(request, 'all_or_nothing'))
+    except IngestError as e:
+        return error(400, str(e))
+    except IOError as e:
+        return error(500, str(e))
+    # 207: part of the batch was rejected
+    status = 200 if not report['rejected'] else (422 if report['rejected'] == report['received'] else 207)
+    return JSONResponse(report, status_code=status)
+
+async def query_records(request: Request) -> JSONResponse:
+    """
+    GET a page of records. Any column name is a case-insensitive 'contains' filter;
+    order_by (prefix '-' for descending), offset and limit control the page.
+    """
+    if not _authorized(request):
+        return error(401, "Invalid or missing X-API-Key")
+    table = _table(request)
+    if table is None:
+        return error(404, "Unknown section or subsection")
+    params = request.query_params
+    filters = {col: params[col] for col in COLUMN_SCHEMA.values() if params.get(col)}
+    order_by = params.get('order_by') or None
+    if order_by and order_by.lstrip('-') not in COLUMN_SCHEMA.values():
+        return error(400, f"Unknown order_by column: {order_by.lstrip('-')}")
+    try:
+        offset = max(int(params.get('offset', 0)), 0)
+        limit = min(max(int(params.get('limit', LIMITS['max_records_display'])), 0), API_CONFIG['max_query_limit'])
+    except ValueError:
+        return error(400, "offset and limit must be integers")
+    page, total = await run_in_threadpool(get_table_manager().query, *table, filters, order_by, offset, limit)
+    return JSONResponse({'total': int(total), 'offset': offset, 'limit': limit, 'records': records_payload(page)})
+
+async def duplicate_records(request: Request) -> JSONResponse:
+    """GET the records sharing their order line with another record, grouped by line, with a 'Copies' count"""
+    if not _authorized(request):
+        return error(401, "Invalid or missing X-API-Key")
+    table = _table(request)
+    if table is None:
+        return error(404, "Unknown section or subsection")
+    report = await run_in_threadpool(get_table_manager().find_duplicates, *table)
+    return JSONResponse({'total': len(report), 'records': records_payload(report)})
+
+async def metrics_text(request: Request):
+    """GET the process metrics (span timings, row/byte counters) in the Prometheus text format"""
+    if not _authorized(request):
+        return error(401, "Invalid or missing X-API-Key")
+    return PlainTextResponse(metrics.to_prometheus(), media_type='text/plain; version=0.0.4')
+
+app = Starlette(routes=[
+    Route('/health', health),
+    Route('/metrics', metrics_text),
+    Route('/api/v1/schema', schema),
+    Route('/api/v1/{section}/{subsection}', write_records, methods=['POST', 'PUT']),
+    Route('/api/v1/{section}/{subsection}', query_records, methods=['GET']),
+    Route('/api/v1/{section}/{subsection}/duplicates', duplicate_records, methods=['GET'])
+])
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(app, host=os.getenv('API_HOST', API_CONFIG['host']), port=int(os.getenv('API_PORT', API_CONFIG['port'])))
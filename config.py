@@ -40,7 +40,70 @@ MESSAGES = {
 DATABASE_CONFIG = {
     'csv_dir': 'data',
     'backup_enabled': True,
-    'auto_backup_interval': 24  # hours
+    'auto_backup_interval': 24,  # hours
+    # PostgreSQL connection pool, shared by all sessions of the process
+    # (each value can be overridden with the PG_POOL_SIZE, PG_MAX_OVERFLOW,
+    # PG_POOL_PRE_PING and PG_POOL_RECYCLE environment variables)
+    'pg_pool_size': 5,
+    'pg_max_overflow': 10,
+    'pg_pool_pre_ping': True,
+    'pg_pool_recycle': 300,  # seconds, below Neon's idle connection timeout
+    'pg_query_cache_size': 500,  # compiled SQL statements kept per engine
+    # Create missing tables/indexes when the process first connects (PG_AUTO_MIGRATE=0 leaves it
+    # to `python manage.py pg-migrate`, saving the schema checks on cold start)
+    'pg_auto_migrate': True,
+    # CSV write-ahead journal (disable with CSV_JOURNAL=0): saves append to <table>.csv.wal
+    # and a background thread folds it into the CSV once it grows past these limits
+    'csv_journal': True,
+    'journal_compact_interval': 10,  # seconds between compaction checks
+    'journal_compact_entries': 1000,
+    'journal_compact_bytes': 8 * 1024 * 1024
+}
+
+# KPI rollups (materialized per table, updated on every save/append)
+KPI_CONFIG = {
+    'on_time_days': 7,  # an order line is on time if delivered within this many days of the order date
+    'grains': ['day', 'week', 'month']
+}
+
+# Duplicate order lines (same sender code, order number and EAN code)
+DEDUP_CONFIG = {
+    'subsections': ['Orders'],  # tables where an order line may only be saved once
+    'bloom_threshold': 5_000_000,  # rows above which the key set becomes a Bloom filter
+    'false_positive_rate': 0.001  # Bloom filter false positives (confirmed against the table)
+}
+
+# Full-text search of the table view (in-memory inverted index for files, tsvector + GIN in PostgreSQL)
+SEARCH_CONFIG = {
+    'columns': ['Descripcion', 'Num_Pedido', 'Nombre_Emisor', 'Cod_Emisor', 'Cod_Art_EAN',
+                'Cod_Art_Comprador', 'Tipo', 'Tipo_Cliche', 'Papel', 'Cod_IPG'],  # free-text columns searched
+    'min_prefix_length': 2  # the last search word also matches longer words from this many characters
+}
+
+# Instrumentation: timing spans and row/byte counters of the hot paths.
+# The sidebar debug panel is shown with ERP_DEBUG=1 or by opening the app with ?debug=1
+INSTRUMENTATION_CONFIG = {
+    'enabled': True,
+    'debug_panel': False,
+    'recent_spans': 1000,  # durations kept per span for the p50/p95
+    'profile_top': 25,  # functions listed by the per-rerun cProfile capture
+    'memory_top': 10,  # allocation sites listed by the per-rerun tracemalloc capture
+    'dump_dir': 'metrics'  # where the JSON/Prometheus dumps are written
+}
+
+# Exports (CSV, XLSX, PDF order sheets), streamed from the backend in chunks
+EXPORT_CONFIG = {
+    'chunk_size': 50000,  # rows read and rendered at a time
+    'workers': None  # processes rendering CSV/PDF chunks (None: one per CPU, 1: no process pool)
+}
+
+# Batch ingestion API (api.py); set ERP_API_KEY to require an X-API-Key header.
+# Without a key, writes are refused unless ERP_API_INSECURE=1 (trusted local setups only)
+API_CONFIG = {
+    'host': '127.0.0.1',  # overridable with API_HOST (e.g. 0.0.0.0 in a container, with ERP_API_KEY set)
+    'port': 8000,
+    'max_batch_size': 10000,  # records per insert/upsert request
+    'max_query_limit': 10000  # records per query page
 }
 
 # System limits (display, file size, description length)
@@ -1,16 +1,28 @@
 """
 Database management module for DemoERP
-Handles both CSV persistence and optional PostgreSQL (Neon) connection
+Handles both CSV persistence and optional PostgreSQL (Neon) connection.
+The PostgreSQL backend (modules/pg_backend.py, SQLAlchemy) is only imported when it is selected.
 """
 import os
+import csv
+import io
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 import pandas as pd
-from typing import Dict, List, Any, Optional
+from typing import Callable, Dict, Iterable, Iterator, List, Any, Optional, Tuple, Union
 from pathlib import Path
-import sqlalchemy as sa
-from sqlalchemy import create_engine, Column, Integer, String, Date, Boolean, Text
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
-from datetime import datetime
+from config import DATABASE_CONFIG
+from modules import journal, table_index
+from modules.write_coordinator import append_coordinator, atomic_write, file_lock, holds_lock
+from modules.dates import DATE_COLUMNS, parse_dates, format_dates, format_date_columns
+from modules.rollups import changed_rows, rollup_store
+from modules.dedup import dedup_store, find_duplicates, is_unique_table
+from modules.changeset import ChangeSet
+from modules.reconciliation import KEY_COLUMNS, MISSING_KEY
+from modules.search import search_store, top_positions
+from modules.instrumentation import count, timed
 
 # Column configuration for all tables
 COLUMN_SCHEMA = {
@@ -30,85 +42,426 @@ COLUMN_SCHEMA = {
     'pdfLink': 'PDF_Link'
 }
 
-# SQLAlchemy Base for PostgreSQL
-Base = declarative_base()
+# Column types of the record tables: ('text', max length or None), ('date', None) or ('integer', None).
+# The PostgreSQL models, the Arrow schema and the validation rules are derived from it.
+COLUMN_TYPES = {
+    'numPedido': ('text', 50),
+    'nombreEmisor': ('text', 200),
+    'codEmisor': ('text', 50),
+    'fechaPedido': ('date', None),
+    'fechaEntrega': ('date', None),
+    'codArtEan': ('text', 50),
+    'codArtComprador': ('text', 50),
+    'descripcion': ('text', None),
+    'cantidad': ('integer', None),
+    'tipo': ('text', 100),
+    'tipoCliche': ('text', 100),
+    'papel': ('text', 100),
+    'codIpg': ('text', 50),
+    'pdfLink': ('text', 500)
+}
 
-class ERPRecord(Base):
-    """Base model for DemoERP records"""
-    __abstract__ = True
-    
-    id = Column(Integer, primary_key=True)
-    numPedido = Column(String(50))
-    nombreEmisor = Column(String(200))
-    codEmisor = Column(String(50))
-    fechaPedido = Column(Date)
-    fechaEntrega = Column(Date)
-    codArtEan = Column(String(50))
-    codArtComprador = Column(String(50))
-    descripcion = Column(Text)
-    cantidad = Column(Integer)
-    tipo = Column(String(100))
-    tipoCliche = Column(String(100))
-    papel = Column(String(100))
-    codIpg = Column(String(50))
-    pdfLink = Column(String(500))
+# Low-cardinality columns stored as dictionary-encoded (categorical) values
+CATEGORICAL_COLUMNS = ['Nombre_Emisor', 'Cod_Emisor', 'Tipo', 'Tipo_Cliche', 'Papel']
+
+def _text_dtype():
+    """Arrow-backed strings with NaN for missing values when pyarrow is installed, Python objects otherwise"""
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return object
+    try:
+        return pd.StringDtype('pyarrow', na_value=np.nan)
+    except TypeError:  # pandas < 2.3
+        pass
+    try:
+        return pd.StringDtype('pyarrow_numpy')
+    except ValueError:  # pandas 2.0: no Arrow strings with NaN semantics, keep Python objects
+        return object
+
+TEXT_DTYPE = _text_dtype()
+
+# In-memory table model: dtype of each column once loaded (see to_table_model)
+COLUMN_DTYPES = {
+    col: ('datetime64[ns]' if col in DATE_COLUMNS else
+          'int32' if col == 'Cantidad' else
+          'category' if col in CATEGORICAL_COLUMNS else
+          TEXT_DTYPE)
+    for col in COLUMN_SCHEMA.values()
+}
+
+def to_table_model(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Converts a table in place to the compact in-memory model (COLUMN_DTYPES): categoricals for
+    low-cardinality text, Arrow-backed strings for free text, int32 quantities and datetime64 dates.
+    Missing schema columns are added and empty strings become missing values.
+    """
+    for col, dtype in COLUMN_DTYPES.items():
+        if col not in df.columns:
+            df[col] = pd.Series(pd.NaT if col in DATE_COLUMNS else None, index=df.index, dtype=dtype if col in DATE_COLUMNS else object)
+        values = df[col]
+        if col in DATE_COLUMNS:
+            df[col] = parse_dates(values)
+        elif col == 'Cantidad':
+            df[col] = pd.to_numeric(values, errors='coerce').fillna(0).astype('int32')
+        elif dtype == 'category':
+            if not isinstance(values.dtype, pd.CategoricalDtype):
+                values = values.astype(TEXT_DTYPE).astype('category')
+            if '' in values.cat.categories:
+                values = values.cat.remove_categories([''])
+            df[col] = values
+        else:
+            values = values.astype(TEXT_DTYPE)
+            df[col] = values.where(values != '')
+    return df
+
+def to_display_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Plain, editable values for a page of a table: DD/MM/YYYY date text, int quantities and
+    text with '' for missing values (also for leftover 'nan'/quote-only cells of older CSV files).
+    """
+    df = format_date_columns(df.copy())
+    for col in df.columns:
+        if col == 'Cantidad':
+            df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0).astype(int)
+        elif col in COLUMN_DTYPES and col not in DATE_COLUMNS:
+            df[col] = df[col].astype(object).fillna('').astype(str).replace({'nan': '', '""': '', '"': '', "''": ''}).astype(object)
+    return df.fillna('')
+
+def memory_report(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Memory per column of a table in the compact model, next to the same data held as
+    Python str objects (object dtype, int64 quantities), in bytes.
+    """
+    rows = []
+    for col in df.columns:
+        values = df[col]
+        if col == 'Cantidad':
+            baseline = values.astype('int64')
+        elif col in DATE_COLUMNS or col not in COLUMN_DTYPES:
+            baseline = values
+        else:
+            baseline = values.astype(object)
+        rows.append({'Column': col, 'Dtype': str(values.dtype),
+                     'Bytes': int(values.memory_usage(deep=True, index=False)),
+                     'Object_Bytes': int(baseline.memory_usage(deep=True, index=False))})
+    report = pd.DataFrame(rows, columns=['Column', 'Dtype', 'Bytes', 'Object_Bytes'])
+    report.loc[len(report)] = ['Total', '', int(report['Bytes'].sum()), int(report['Object_Bytes'].sum())]
+    return report
 
-# Specific models for each table
-class OrdersCustomers(ERPRecord):
-    __tablename__ = 'pedidos_clientes'
+def filter_mask(df: pd.DataFrame, filters: Optional[Dict[str, str]]) -> pd.Series:
+    """Case-insensitive literal 'contains' mask for {column: text} filters (empty values are ignored)"""
+    mask = pd.Series(True, index=df.index)
+    for col, value in (filters or {}).items():
+        if value and col in df.columns:
+            values = df[col]
+            if isinstance(values.dtype, pd.CategoricalDtype):
+                # match each distinct value once, then map the codes
+                matches = values.cat.categories.astype(str).str.contains(value, case=False, regex=False)
+                codes = values.cat.codes.to_numpy()
+                mask &= np.append(np.asarray(matches, dtype=bool), False)[codes]
+            else:
+                mask &= values.astype(str).str.contains(value, case=False, regex=False, na=False)
+    return mask
+
+def sort_frame(df: pd.DataFrame, order_by: Optional[str]) -> pd.DataFrame:
+    """Sorts by a column name; a leading '-' sorts descending"""
+    if not order_by:
+        return df
+    column = order_by.lstrip('-')
+    if column not in df.columns:
+        return df
+    return df.sort_values(column, ascending=not order_by.startswith('-'), kind='stable')
+
+def match_positions(df: pd.DataFrame, filters: Optional[Dict[str, str]] = None, order_by: Optional[str] = None) -> np.ndarray:
+    """Row positions matching the filters, in the order of `order_by` (as sort_frame)"""
+    positions = np.flatnonzero(filter_mask(df, filters).to_numpy())
+    column = order_by.lstrip('-') if order_by else None
+    if column in df.columns:
+        values = df[column].iloc[positions].reset_index(drop=True)
+        positions = positions[values.sort_values(ascending=not order_by.startswith('-'), kind='stable').index.to_numpy()]
+    return positions
+
+def query_dataframe(df: pd.DataFrame, filters: Optional[Dict[str, str]] = None, order_by: Optional[str] = None,
+                    offset: int = 0, limit: Optional[int] = None):
+    """Filters, sorts and pages an in-memory DataFrame. Returns (page, total_matches)"""
+    positions = match_positions(df, filters, order_by)
+    stop = None if limit is None else offset + limit
+    return df.iloc[positions[offset:stop]].copy(), len(positions)
+
+def aggregate_frame(df: pd.DataFrame, keys: List[str], value: str, labels: Optional[List[str]] = None) -> pd.DataFrame:
+    """
+    Sums `value` per combination of the `keys` columns, keeping the first value of each `labels` column.
+    Vectorized hash aggregation: each key column is factorized and the codes are combined into
+    one group code per row, then summed with np.bincount. Empty key values are grouped under
+    MISSING_KEY, so rows with an incomplete key are kept. Returns one row per key, in order of first appearance.
+    """
+    labels = labels or []
+    key_values = {col: df[col].astype(object).fillna('').astype(str).str.strip().replace('', MISSING_KEY).to_numpy(dtype=object)
+                  for col in keys}
+    group = np.zeros(len(df), dtype=np.int64)
+    for values in key_values.values():
+        codes, uniques = pd.factorize(values)
+        group, _ = pd.factorize(group * len(uniques) + codes)
+    # Codes follow first appearance, so the first row of each group comes in code order
+    first = pd.Series(group).drop_duplicates().index.to_numpy()
+    quantity = pd.to_numeric(df[value], errors='coerce').fillna(0).to_numpy(dtype='float64')
+    result = pd.DataFrame({col: key_values[col][first] for col in keys})
+    result[value] = np.bincount(group, weights=quantity, minlength=len(first)).round().astype('int64')
+    for col in labels:
+        result[col] = df[col].astype(object).to_numpy()[first]
+    return result
+
+def order_line_keys(frame: pd.DataFrame) -> pd.Series:
+    """KEY_COLUMNS values of each row as one trimmed string ('' for missing parts)"""
+    key = None
+    for col in KEY_COLUMNS:
+        part = frame[col].astype(object).where(frame[col].notna(), '').astype(str).str.strip()
+        key = part if key is None else key + '\x1f' + part
+    return key
 
-class DeliveryNotesCustomers(ERPRecord):
-    __tablename__ = 'albaranes_clientes'
+def upsert_changes(current: pd.DataFrame, records: pd.DataFrame, fields: pd.DataFrame,
+                   insertable: Optional[np.ndarray] = None) -> Tuple[ChangeSet, np.ndarray]:
+    """
+    ChangeSet upserting records into a table keyed by row position (`current` holds at least its KEY_COLUMNS):
+    a record whose order line is saved updates the first row holding it with the fields it supplied (True in
+    `fields`, one column per updatable column), the others are inserted if `insertable` (default: all) allows it.
+    Returns it with the mask of the matched records.
+    """
+    existing = pd.Series(np.arange(len(current)), index=order_line_keys(current).to_numpy() if len(current) else [])
+    existing = existing[~existing.index.duplicated()]
+    targets = existing.reindex(order_line_keys(records).to_numpy()).to_numpy()
+    matched = ~np.isnan(targets)
+    if insertable is None:
+        insertable = np.ones(len(records), dtype=bool)
+    columns = list(fields.columns)
+    updates = {}
+    for target, values, given in zip(targets[matched], records.loc[matched, columns].to_dict(orient='records'),
+                                     fields.loc[matched].to_dict(orient='records')):
+        values = {col: value for col, value in values.items() if given[col]}
+        if values:
+            updates[int(target)] = values
+    return ChangeSet(updates=updates, inserts=records[~matched & insertable].reset_index(drop=True)), matched
 
-class InvoicesCustomers(ERPRecord):
-    __tablename__ = 'facturas_clientes'
+def _refuse_changes(table_name: str, changes, version, duplicate_mask=None) -> bool:
+    """
+    True (and logs why) if a ChangeSet must not be written: the table moved on from its base version,
+    or `duplicate_mask` flags one of its inserts. Called by the file backends under the write lock.
+    """
+    if changes.is_stale(version):
+        print(f"Not applying changes to {table_name}: the table changed since it was read")
+        return True
+    if duplicate_mask is not None and not changes.inserts.empty and duplicate_mask(changes.inserts).any():
+        print(f"Not applying changes to {table_name}: a new row repeats a saved order line")
+        return True
+    return False
 
-class OrdersSuppliers(ERPRecord):
-    __tablename__ = 'pedidos_proveedores'
+class _BoundedReader(io.RawIOBase):
+    """Raw reader over an open file that stops at a fixed size (the file's size when the read started)"""
 
-class DeliveryNotesSuppliers(ERPRecord):
-    __tablename__ = 'albaranes_proveedores'
+    def __init__(self, handle, size: int):
+        self._handle = handle
+        self._remaining = size
 
-class InvoicesSuppliers(ERPRecord):
-    __tablename__ = 'facturas_proveedores'
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        if self._remaining <= 0:
+            return 0
+        view = memoryview(buffer)[:self._remaining]
+        read = self._handle.readinto(view)
+        self._remaining -= read
+        return read
 
 class CSVBackend:
-    """Persistence backend using CSV files"""
+    """
+    Persistence backend using CSV files.
+    With the write-ahead journal enabled (default), appends and edits are written as
+    journal entries next to the CSV snapshot and folded into it in the background.
+    """
     
-    def __init__(self, data_dir: str = "data"):
+    # Rows per chunk for scans that do not load the whole file
+    chunk_size = 50000
+    
+    def __init__(self, data_dir: str = "data", use_journal: Optional[bool] = None):
         self.data_dir = Path(data_dir)
         self.data_dir.mkdir(exist_ok=True)
+        if use_journal is None:
+            setting = os.getenv('CSV_JOURNAL')
+            use_journal = DATABASE_CONFIG['csv_journal'] if setting is None else setting.lower() in ('1', 'true', 'yes')
+        self.use_journal = use_journal
     
     def get_empty_dataframe(self) -> pd.DataFrame:
         """Returns an empty DataFrame with the correct columns"""
         columns = list(COLUMN_SCHEMA.values())
         return pd.DataFrame(columns=columns)
     
+    @timed()
     def load_data(self, table_name: str) -> pd.DataFrame:
-        """Loads data from CSV or returns an empty DataFrame if not found"""
+        """Loads data from CSV (plus the journal tail) or returns an empty DataFrame if not found"""
         file_path = self.data_dir / f"{table_name}.csv"
         try:
-            if file_path.exists():
-                df = pd.read_csv(file_path, dtype=str)
-                # Convert dates to DD/MM/YYYY format
-                if 'Fecha_Pedido' in df.columns:
-                    df['Fecha_Pedido'] = pd.to_datetime(df['Fecha_Pedido'], errors='coerce', dayfirst=True).dt.strftime('%d/%m/%Y')
-                if 'Fecha_Entrega' in df.columns:
-                    df['Fecha_Entrega'] = pd.to_datetime(df['Fecha_Entrega'], errors='coerce', dayfirst=True).dt.strftime('%d/%m/%Y')
-                if 'Cantidad' in df.columns:
-                    df['Cantidad'] = pd.to_numeric(df['Cantidad'], errors='coerce').fillna(0).astype(int)
-                for col in COLUMN_SCHEMA.values():
-                    if col not in df.columns:
-                        df[col] = ""
-                return df
+            if file_path.exists() or journal.journal_size(file_path):
+                with file_lock(file_path, exclusive=False):
+                    df = journal.replay(self._read_snapshot(file_path), journal.read_entries(file_path))
+                    self._count_read(file_path, len(df))
+                return self._normalize(df)
             else:
                 return self.get_empty_dataframe()
         except Exception as e:
             print(f"Error loading {table_name}: {e}")
             return self.get_empty_dataframe()
+
+    @staticmethod
+    def _count_read(file_path: Path, rows: int):
+        """Counts a full read of the table: its rows, and the bytes of the snapshot plus the journal"""
+        size = file_path.stat().st_size if file_path.exists() else 0
+        count('rows_read', rows, backend='csv')
+        count('bytes_read', size + journal.journal_size(file_path), backend='csv')
+
+    def _read_snapshot(self, file_path: Path) -> pd.DataFrame:
+        """Reads the CSV file as text (empty table with the schema columns if it does not exist yet)"""
+        if file_path.exists():
+            return pd.read_csv(file_path, dtype=str)
+        return pd.DataFrame(columns=list(COLUMN_SCHEMA.values()), dtype=str)
     
+    def _normalize(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Applies the load-time conversions in place (compact table model, see to_table_model)"""
+        return to_table_model(df)
+
+    def normalize_dataframe(self, dataframe: pd.DataFrame) -> pd.DataFrame:
+        """Returns the DataFrame as load_data would read it back after save_data"""
+        df = dataframe.copy().reset_index(drop=True)
+        for col in df.columns:
+            if col not in ['Fecha_Pedido', 'Fecha_Entrega', 'Cantidad']:
+                df[col] = df[col].astype(object).astype(str).replace({'': None, 'nan': None, 'None': None})
+        return self._normalize(df)
+
+    @timed()
+    def query(self, table_name: str, filters: Optional[Dict[str, str]] = None, order_by: Optional[str] = None,
+              offset: int = 0, limit: Optional[int] = None):
+        """
+        Returns (page, total_matches) for the CSV file.
+        Filters on indexed columns are answered from the sidecar index and the page rows are read by seeking;
+        other queries use a chunked scan that only keeps the matching rows inside the requested page
+        (unless sorting is requested). The index of the page holds the row positions in the file.
+        """
+        file_path = self.data_dir / f"{table_name}.csv"
+        if not file_path.exists() and not journal.journal_size(file_path):
+            return self.get_empty_dataframe(), 0
+        try:
+            with file_lock(file_path, exclusive=False):
+                page, total = self._query_locked(file_path, filters, order_by, offset, limit)
+            count('rows_read', len(page), backend='csv')
+            return page, total
+        except Exception as e:
+            print(f"Error querying {table_name}: {e}")
+            return self.get_empty_dataframe(), 0
+
+    def _query_locked(self, file_path: Path, filters: Optional[Dict[str, str]], order_by: Optional[str],
+                      offset: int, limit: Optional[int]):
+        """Runs a query while the caller holds a shared lock on the file"""
+        entries = journal.read_entries(file_path)
+        if entries:
+            # Pending journal entries: the index and row offsets describe the snapshot only
+            df = journal.replay(self._read_snapshot(file_path), entries)
+            hits = sort_frame(df[filter_mask(df, filters)], order_by)
+            stop = None if limit is None else offset + limit
+            return self._normalize(hits.iloc[offset:stop].copy()), len(hits)
+        if not order_by:
+            result = self._query_index(file_path, filters, offset, limit)
+            if result is not None:
+                return result
+        kept = []
+        total = 0
+        stop = None if limit is None else offset + limit
+        for chunk in pd.read_csv(file_path, dtype=str, chunksize=self.chunk_size):
+            hits = chunk[filter_mask(chunk, filters)]
+            if order_by:
+                kept.append(hits)
+            else:
+                start = max(offset - total, 0)
+                end = len(hits) if stop is None else max(min(stop - total, len(hits)), 0)
+                if start < end:
+                    kept.append(hits.iloc[start:end])
+            total += len(hits)
+        page = pd.concat(kept) if kept else pd.read_csv(file_path, dtype=str, nrows=0)
+        if order_by:
+            page = sort_frame(page, order_by).iloc[offset:stop]
+        return self._normalize(page), total
+
+    def _query_index(self, file_path: Path, filters: Optional[Dict[str, str]], offset: int, limit: Optional[int]):
+        """Answers a query from the sidecar index, or returns None if the filters are not indexed"""
+        index = table_index.get_index(file_path)
+        if index is None:
+            return None
+        positions = index.search(filters)
+        if positions is None:
+            return None
+        stop = None if limit is None else offset + limit
+        page_positions = positions[offset:stop]
+        rows = index.read_rows(file_path, page_positions)
+        page = pd.DataFrame(rows, columns=index.header, index=page_positions, dtype=str).replace('', None)
+        return self._normalize(page), len(positions)
+
+    def iter_chunks(self, table_name: str, filters: Optional[Dict[str, str]] = None,
+                    chunk_size: Optional[int] = None) -> Iterator[pd.DataFrame]:
+        """
+        Yields the rows matching `filters` in file order, at most chunk_size rows at a time.
+        The scan reads the CSV file as it was when the scan started: the file is opened under the
+        shared lock and read up to its size at that moment, so later appends are left out and a
+        concurrent save (atomic rename) does not affect it. Pending journal entries are replayed
+        in memory first, as load_data does.
+        """
+        file_path = self.data_dir / f"{table_name}.csv"
+        chunk_size = chunk_size or self.chunk_size
+        if not file_path.exists() and not journal.journal_size(file_path):
+            return
+        with file_lock(file_path, exclusive=False):
+            entries = journal.read_entries(file_path)
+            if entries:
+                df = journal.replay(self._read_snapshot(file_path), entries)
+                self._count_read(file_path, len(df))
+            else:
+                snapshot = open(file_path, 'rb')
+                size = os.fstat(snapshot.fileno()).st_size
+        if entries:
+            hits = df[filter_mask(df, filters)]
+            for start in range(0, len(hits), chunk_size):
+                yield self._normalize(hits.iloc[start:start + chunk_size].copy())
+            return
+        with snapshot:
+            if not size:
+                return
+            count('bytes_read', size, backend='csv')
+            for chunk in pd.read_csv(io.BufferedReader(_BoundedReader(snapshot, size)), dtype=str, chunksize=chunk_size):
+                count('rows_read', len(chunk), backend='csv')
+                hits = chunk[filter_mask(chunk, filters)]
+                if len(hits):
+                    yield self._normalize(hits.copy())
+
+    def get_version(self, table_name: str):
+        """
+        Returns a cheap signature that changes whenever the table's rows change: the journal's logical
+        version when journaling (unchanged by compaction), otherwise (mtime, size, journal size)
+        """
+        file_path = self.data_dir / f"{table_name}.csv"
+        if self.use_journal:
+            version = journal.table_version(file_path)
+            if version is not None:
+                return version
+        journal_size = journal.journal_size(file_path)
+        try:
+            stat = file_path.stat()
+        except FileNotFoundError:
+            # rows may only be in the journal until the first compaction
+            return (None, None, journal_size) if journal_size else None
+        return (stat.st_mtime_ns, stat.st_size, journal_size)
+
+    @timed()
     def save_data(self, table_name: str, dataframe: pd.DataFrame) -> bool:
-        """Saves DataFrame to CSV file"""
+        """Saves DataFrame to CSV file (atomic replace under the file's exclusive lock)"""
         file_path = self.data_dir / f"{table_name}.csv"
         try:
             df_to_save = dataframe.copy()
@@ -116,81 +469,657 @@ class CSVBackend:
                 if col not in ['Fecha_Pedido', 'Fecha_Entrega', 'Cantidad']:
                     df_to_save[col] = df_to_save[col].astype(str)
             # Save dates in DD/MM/YYYY format
-            if 'Fecha_Pedido' in df_to_save.columns:
-                df_to_save['Fecha_Pedido'] = pd.to_datetime(df_to_save['Fecha_Pedido'], errors='coerce', dayfirst=True).dt.strftime('%d/%m/%Y')
-            if 'Fecha_Entrega' in df_to_save.columns:
-                df_to_save['Fecha_Entrega'] = pd.to_datetime(df_to_save['Fecha_Entrega'], errors='coerce', dayfirst=True).dt.strftime('%d/%m/%Y')
-            df_to_save.to_csv(file_path, index=False)
+            format_date_columns(df_to_save)
+            with file_lock(file_path):
+                self._write_snapshot(file_path, df_to_save)
+                # A full save supersedes any pending journal entries
+                if self.use_journal or journal.journal_size(file_path):
+                    journal.reset(file_path, changed=True)
+                count('bytes_written', file_path.stat().st_size, backend='csv')
+            count('rows_written', len(df_to_save), backend='csv')
             return True
         except Exception as e:
             print(f"Error saving {table_name}: {e}")
             return False
 
-class PgBackend:
-    """Persistence backend using PostgreSQL (Neon)"""
+    def _write_snapshot(self, file_path: Path, df: pd.DataFrame):
+        """Replaces the CSV file atomically and rebuilds its index; the caller holds the exclusive lock"""
+        atomic_write(file_path, lambda f: df.to_csv(f, index=False), newline='')
+        self._update_index(file_path)
+
+    def compact_journal(self, file_path: Path) -> int:
+        """Folds the journal into the CSV snapshot; returns the number of entries folded"""
+        return journal.compact_with(file_path, self._read_snapshot, self._write_snapshot)
+
+    def _text_records(self, records: pd.DataFrame) -> List[Dict[str, str]]:
+        """Records as text values in the CSV layout, for journal entries"""
+        df = self._prepare_append(records)
+        df['Cantidad'] = [self._format_value('Cantidad', value) for value in df['Cantidad']]
+        return df.astype(str).to_dict(orient='records')
+
+    def _update_index(self, file_path: Path, previous_size: Optional[int] = None):
+        """Keeps the sidecar index in sync after a write (incrementally for appends)"""
+        try:
+            if previous_size:
+                table_index.refresh_after_append(file_path, previous_size)
+            else:
+                table_index.rebuild_index(file_path)
+        except Exception as e:
+            print(f"Error updating index for {file_path.name}: {e}")
+
+    def _prepare_append(self, records: pd.DataFrame) -> pd.DataFrame:
+        """Formats records as text rows in the CSV layout (all schema columns, DD/MM/YYYY dates)"""
+        df_to_append = records.copy()
+        for col in COLUMN_SCHEMA.values():
+            if col not in df_to_append.columns:
+                df_to_append[col] = ""
+        for col in df_to_append.columns:
+            if col not in ['Fecha_Pedido', 'Fecha_Entrega', 'Cantidad']:
+                df_to_append[col] = df_to_append[col].astype(object).fillna("").astype(str)
+        return format_date_columns(df_to_append)
+
+    def _write_append(self, file_path: Path, df_to_append: pd.DataFrame):
+        """Appends prepared rows to the file; the caller holds the file's exclusive lock"""
+        previous_size = file_path.stat().st_size if file_path.exists() else 0
+        if previous_size > 0:
+            # Follow the column order of the existing header
+            with open(file_path, 'rb') as f:
+                header = pd.read_csv(f, nrows=0).columns.tolist()
+                f.seek(-1, os.SEEK_END)
+                needs_newline = f.read(1) != b'\n'
+            for col in header:
+                if col not in df_to_append.columns:
+                    df_to_append[col] = ""
+            with open(file_path, 'a', newline='') as f:
+                if needs_newline:
+                    f.write('\n')
+                df_to_append[header].to_csv(f, index=False, header=False)
+                f.flush()
+                os.fsync(f.fileno())
+        else:
+            atomic_write(file_path, lambda f: df_to_append[list(COLUMN_SCHEMA.values())].to_csv(f, index=False), newline='')
+        count('bytes_written', file_path.stat().st_size - previous_size, backend='csv')
+        self._update_index(file_path, previous_size)
+
+    def _flush_appends(self, file_path: Path, frames: List[pd.DataFrame]):
+        """Writes a batch of appends collected by the append coordinator in one go"""
+        self._write_append(file_path, pd.concat(frames, ignore_index=True))
+
+    @timed()
+    def append_records(self, table_name: str, records: pd.DataFrame) -> bool:
+        """
+        Appends records to the end of the CSV file without rewriting it.
+        The write goes through the process-wide append coordinator, which batches appends
+        submitted concurrently by other sessions into a single flush.
+        """
+        file_path = self.data_dir / f"{table_name}.csv"
+        try:
+            # a caller holding the file's lock (append_unique) cannot wait for the group commit: write directly
+            locked = holds_lock(file_path)
+            if self.use_journal:
+                size = journal.journal_size(file_path)
+                entries = [journal.make_entry(inserts=self._text_records(records))]
+                if locked:
+                    journal.append_entries_locked(file_path, entries)
+                else:
+                    journal.append_entries(file_path, entries)
+                count('bytes_written', journal.journal_size(file_path) - size, backend='csv')
+                journal.compactor.watch(file_path, self.compact_journal)
+            else:
+                self.compact_journal(file_path)
+                if locked:
+                    self._write_append(file_path, self._prepare_append(records))
+                else:
+                    append_coordinator.append(file_path, self._prepare_append(records), self._flush_appends)
+            count('rows_written', len(records), backend='csv')
+            return True
+        except Exception as e:
+            print(f"Error appending to {table_name}: {e}")
+            return False
+
+    def append_unique(self, table_name: str, records: pd.DataFrame, duplicate_mask: Callable[[pd.DataFrame], np.ndarray],
+                      all_or_nothing: bool = False) -> Optional[np.ndarray]:
+        """
+        Appends the records `duplicate_mask` does not flag (none of them if one is flagged, with
+        `all_or_nothing`), checking and writing under the file's exclusive lock so a concurrent writer
+        cannot save the same order line in between. Returns the mask of the flagged records, None if the write failed.
+        """
+        with file_lock(self.data_dir / f"{table_name}.csv"):
+            duplicate = duplicate_mask(records)
+            if duplicate.all() or (all_or_nothing and duplicate.any()):
+                return duplicate
+            if not self.append_records(table_name, records[~duplicate]):
+                return None
+        return duplicate
+
+    @staticmethod
+    def _format_value(column: str, value) -> str:
+        """Formats a single edited value the same way save_data writes it"""
+        if value is None or (not isinstance(value, str) and pd.isna(value)):
+            return ""
+        if column in DATE_COLUMNS:
+            return format_dates(pd.Series([value])).iloc[0]
+        if column == 'Cantidad':
+            number = pd.to_numeric(pd.Series([value]), errors='coerce').fillna(0).iloc[0]
+            return str(int(number))
+        return str(value)
+
+    @timed()
+    def apply_changes(self, table_name: str, changes,
+                      duplicate_mask: Optional[Callable[[pd.DataFrame], np.ndarray]] = None) -> bool:
+        """
+        Applies a ChangeSet to the CSV file.
+        With the journal enabled the whole ChangeSet becomes one journal entry. Otherwise, under the
+        exclusive lock, updated and deleted rows are patched while streaming the raw rows (no DataFrame
+        parsing) into a temp file that atomically replaces the table; inserts are appended to the end.
+        Returns False without writing if the table changed since `changes.base_version`, or if
+        `duplicate_mask` flags an insert (checked under the same lock).
+        """
+        file_path = self.data_dir / f"{table_name}.csv"
+        try:
+            if self.use_journal:
+                updates = {key: {col: self._format_value(col, value) for col, value in values.items()}
+                           for key, values in changes.updates.items()}
+                inserts = self._text_records(changes.inserts) if not changes.inserts.empty else None
+                entries = [journal.make_entry(updates, changes.deletes, inserts)]
+                size = journal.journal_size(file_path)
+                if changes.base_version is None and duplicate_mask is None and not holds_lock(file_path):
+                    journal.append_entries(file_path, entries)
+                else:
+                    # positions are only valid for the version they were read at: check and write under one lock
+                    with file_lock(file_path):
+                        if _refuse_changes(table_name, changes, self.get_version(table_name), duplicate_mask):
+                            return False
+                        journal.append_entries_locked(file_path, entries)
+                count('bytes_written', journal.journal_size(file_path) - size, backend='csv')
+                journal.compactor.watch(file_path, self.compact_journal)
+                count('rows_written', len(changes.updates) + len(changes.inserts), backend='csv')
+                return True
+            with file_lock(file_path):
+                if _refuse_changes(table_name, changes, self.get_version(table_name), duplicate_mask):
+                    return False
+                self.compact_journal(file_path)
+                if (changes.updates or changes.deletes) and file_path.exists():
+                    updates = {int(k): v for k, v in changes.updates.items()}
+                    deletes = {int(k) for k in changes.deletes}
+
+                    def patch(dst):
+                        with open(file_path, newline='') as src:
+                            reader = csv.reader(src)
+                            writer = csv.writer(dst, lineterminator=os.linesep)
+                            header = next(reader)
+                            writer.writerow(header)
+                            positions = {col: i for i, col in enumerate(header)}
+                            row_pos = 0
+                            for row in reader:
+                                if not row:
+                                    continue
+                                if row_pos not in deletes:
+                                    for col, value in updates.get(row_pos, {}).items():
+                                        if col in positions:
+                                            row[positions[col]] = self._format_value(col, value)
+                                    writer.writerow(row)
+                                row_pos += 1
+
+                    atomic_write(file_path, patch, newline='')
+                    count('bytes_written', file_path.stat().st_size, backend='csv')
+                    self._update_index(file_path)
+                if not changes.inserts.empty:
+                    self._write_append(file_path, self._prepare_append(changes.inserts))
+            count('rows_written', len(changes.updates) + len(changes.inserts), backend='csv')
+            return True
+        except Exception as e:
+            print(f"Error applying changes to {table_name}: {e}")
+            return False
+
+    @timed()
+    def upsert_records(self, table_name: str, records: pd.DataFrame, fields: pd.DataFrame,
+                       insertable: Optional[np.ndarray] = None, all_or_nothing: bool = False) -> np.ndarray:
+        """
+        Updates the first row holding each record's order line with the fields it supplied (see
+        upsert_changes), and inserts the unmatched records `insertable` allows (default: all). With
+        `all_or_nothing`, nothing is written if an unmatched record is not insertable. The order lines are
+        matched and the changes written under the file's exclusive lock, so concurrent upserts of a line
+        cannot both insert it.
+        Returns a mask of the matched (updated) records.
+        """
+        file_path = self.data_dir / f"{table_name}.csv"
+        with file_lock(file_path):
+            current = journal.replay(self._read_snapshot(file_path), journal.read_entries(file_path))
+            changes, matched = upsert_changes(current, records, fields, insertable)
+            if all_or_nothing and insertable is not None and (~matched & ~insertable).any():
+                return matched
+            changes.base_version = self.get_version(table_name)
+            if not changes.is_empty() and not self.apply_changes(table_name, changes):
+                raise IOError(f"Could not upsert into {table_name}")
+        return matched
+
+class ColumnarBackend:
+    """
+    Persistence backend using typed Arrow IPC (Feather v2) files.
+    Column types are derived from COLUMN_TYPES: date32 for dates, int64 for
+    quantities, dictionary-encoded strings for CATEGORICAL_COLUMNS and plain strings otherwise.
+    Files are written uncompressed so they can be memory-mapped on read.
+    """
     
-    def __init__(self):
-        # Environment variables for connection
-        self.host = os.getenv('PGHOST')
-        self.user = os.getenv('PGUSER') 
-        self.password = os.getenv('PGPASSWORD')
-        self.database = os.getenv('PGDATABASE')
-        
-        if not all([self.host, self.user, self.password, self.database]):
-            raise ValueError("Missing environment variables for PostgreSQL connection")
-        
-        # Create engine and session
-        self.engine = create_engine(
-            f"postgresql://{self.user}:{self.password}@{self.host}/{self.database}"
-        )
-        Base.metadata.create_all(self.engine)
-        Session = sessionmaker(bind=self.engine)
-        self.session = Session()
-    
-    def get_model_class(self, table_name: str):
-        """Returns the model class corresponding to the table name"""
-        model_map = {
-            'pedidos_clientes': OrdersCustomers,
-            'albaranes_clientes': DeliveryNotesCustomers,
-            'facturas_clientes': InvoicesCustomers,
-            'pedidos_proveedores': OrdersSuppliers,
-            'albaranes_proveedores': DeliveryNotesSuppliers,
-            'facturas_proveedores': InvoicesSuppliers
-        }
-        return model_map.get(table_name)
+    def __init__(self, data_dir: str = "data"):
+        import pyarrow  # noqa: F401 - fail early if the optional dependency is missing
+        self.data_dir = Path(data_dir)
+        self.data_dir.mkdir(exist_ok=True)
+    
+    def _file_path(self, table_name: str) -> Path:
+        return self.data_dir / f"{table_name}.arrow"
+    
+    @staticmethod
+    def arrow_schema():
+        """Builds the Arrow schema from COLUMN_SCHEMA and COLUMN_TYPES"""
+        import pyarrow as pa
+        fields = []
+        for db_col, col in COLUMN_SCHEMA.items():
+            kind, _ = COLUMN_TYPES[db_col]
+            if kind == 'date':
+                arrow_type = pa.date32()
+            elif kind == 'integer':
+                arrow_type = pa.int64()
+            elif col in CATEGORICAL_COLUMNS:
+                arrow_type = pa.dictionary(pa.int32(), pa.string())
+            else:
+                arrow_type = pa.string()
+            fields.append(pa.field(col, arrow_type))
+        return pa.schema(fields)
+    
+    def to_arrow(self, dataframe: pd.DataFrame):
+        """Converts a display DataFrame into a typed Arrow table"""
+        import pyarrow as pa
+        arrays = []
+        for schema_field in self.arrow_schema():
+            col = schema_field.name
+            series = dataframe[col] if col in dataframe.columns else pd.Series([None] * len(dataframe), dtype=object)
+            series = series.reset_index(drop=True)
+            if pa.types.is_date32(schema_field.type):
+                parsed = parse_dates(series)
+                arrays.append(pa.array(parsed, type=pa.timestamp('ns'), from_pandas=True).cast(pa.date32()))
+            elif pa.types.is_integer(schema_field.type):
+                arrays.append(pa.array(pd.to_numeric(series, errors='coerce').fillna(0).astype('int64')))
+            else:
+                missing = (series.isna() | (series.astype(str) == '')).to_numpy()
+                array = pa.array(series.astype(str).to_numpy(dtype=object), mask=missing, type=pa.string())
+                if pa.types.is_dictionary(schema_field.type):
+                    array = array.dictionary_encode()
+                arrays.append(array)
+        return pa.Table.from_arrays(arrays, schema=self.arrow_schema())
+    
+    @staticmethod
+    def from_arrow(table) -> pd.DataFrame:
+        """Converts an Arrow table into a DataFrame (date32 columns become datetime64, no text parsing)"""
+        df = table.to_pandas(date_as_object=False)
+        return to_table_model(df)
+    
+    def get_empty_dataframe(self) -> pd.DataFrame:
+        """Returns an empty DataFrame with the correct columns"""
+        columns = list(COLUMN_SCHEMA.values())
+        return pd.DataFrame(columns=columns)
+    
+    def get_version(self, table_name: str):
+        """Returns a cheap signature (mtime, size) that changes whenever the file changes"""
+        try:
+            stat = self._file_path(table_name).stat()
+            return (stat.st_mtime_ns, stat.st_size)
+        except FileNotFoundError:
+            return None
+    
+    def normalize_dataframe(self, dataframe: pd.DataFrame) -> pd.DataFrame:
+        """Returns the DataFrame as load_data would read it back after save_data"""
+        return self.from_arrow(self.to_arrow(dataframe))
+    
+    def load_table(self, table_name: str):
+        """Memory-maps the Arrow file and returns the typed Arrow table (None if not found)"""
+        import pyarrow.feather as feather
+        file_path = self._file_path(table_name)
+        if not file_path.exists():
+            return None
+        # memory-mapped: counts the mapped file, pages are only read as columns are touched
+        count('bytes_read', file_path.stat().st_size, backend='columnar')
+        return feather.read_table(str(file_path), memory_map=True)
     
+    @timed()
     def load_data(self, table_name: str) -> pd.DataFrame:
-        """Loads data from PostgreSQL"""
+        """Loads data from the Arrow file or returns an empty DataFrame if not found"""
         try:
-            query = f"SELECT * FROM {table_name}"
-            df = pd.read_sql(query, self.engine)
-            # Rename columns to display format
-            column_rename = {k: v for k, v in COLUMN_SCHEMA.items() if k in df.columns}
-            df = df.rename(columns=column_rename)
-            return df
+            table = self.load_table(table_name)
+            if table is None:
+                return self.get_empty_dataframe()
+            count('rows_read', table.num_rows, backend='columnar')
+            return self.from_arrow(table)
         except Exception as e:
-            print(f"Error loading from PostgreSQL {table_name}: {e}")
-            return pd.DataFrame(columns=list(COLUMN_SCHEMA.values()))
+            print(f"Error loading {table_name}: {e}")
+            return self.get_empty_dataframe()
+    
+    @timed()
+    def query(self, table_name: str, filters: Optional[Dict[str, str]] = None, order_by: Optional[str] = None,
+              offset: int = 0, limit: Optional[int] = None):
+        """
+        Returns (page, total_matches) filtering the memory-mapped Arrow table with Arrow compute kernels.
+        Only the requested page is converted to pandas; its index holds the row positions.
+        """
+        import pyarrow.compute as pc
+        try:
+            table = self.load_table(table_name)
+            if table is None:
+                return self.get_empty_dataframe(), 0
+            mask = self._filter_mask(table, filters)
+            positions = np.arange(table.num_rows)
+            if mask is not None:
+                positions = positions[mask.to_numpy(zero_copy_only=False)]
+            column = order_by.lstrip('-') if order_by else None
+            if column in table.column_names:
+                order = 'descending' if order_by.startswith('-') else 'ascending'
+                sort_keys = pc.sort_indices(table.take(positions), sort_keys=[(column, order)])
+                positions = positions[sort_keys.to_numpy()]
+            stop = None if limit is None else offset + limit
+            page_positions = positions[offset:stop]
+            page = self.from_arrow(table.take(page_positions))
+            page.index = page_positions
+            count('rows_read', len(page), backend='columnar')
+            return page, len(positions)
+        except Exception as e:
+            print(f"Error querying {table_name}: {e}")
+            return self.get_empty_dataframe(), 0
+    
+    @staticmethod
+    def _filter_mask(data, filters: Optional[Dict[str, str]]):
+        """Boolean Arrow mask of the case-insensitive 'contains' filters on a table or record batch (None if no filter applies)"""
+        import pyarrow as pa
+        import pyarrow.compute as pc
+        mask = None
+        for col, value in (filters or {}).items():
+            if not value or col not in data.schema.names:
+                continue
+            column = data.column(col)
+            if not pa.types.is_string(column.type):
+                column = column.cast(pa.string())
+            hits = pc.fill_null(pc.match_substring(column, pattern=value, ignore_case=True), False)
+            mask = hits if mask is None else pc.and_(mask, hits)
+        return mask
+
+    def iter_chunks(self, table_name: str, filters: Optional[Dict[str, str]] = None,
+                    chunk_size: Optional[int] = None) -> Iterator[pd.DataFrame]:
+        """
+        Yields the rows matching `filters` in file order, at most chunk_size rows at a time.
+        The record batches are slices of the memory-mapped file: only one chunk is converted to pandas at a time.
+        """
+        import pyarrow as pa
+        table = self.load_table(table_name)
+        if table is None:
+            return
+        for batch in table.to_batches(max_chunksize=chunk_size or CSVBackend.chunk_size):
+            mask = self._filter_mask(batch, filters)
+            if mask is not None:
+                batch = batch.filter(mask)
+            if batch.num_rows:
+                count('rows_read', batch.num_rows, backend='columnar')
+                yield self.from_arrow(pa.Table.from_batches([batch]))
+
+    def write_table(self, table_name: str, table) -> None:
+        """
+        Writes an Arrow table atomically (temp file + rename), uncompressed for memory-mapping.
+        Callers hold the file's exclusive lock.
+        """
+        import pyarrow.feather as feather
+        file_path = self._file_path(table_name)
+        tmp_path = file_path.with_suffix('.arrow.tmp')
+        feather.write_feather(table, str(tmp_path), compression='uncompressed')
+        count('bytes_written', tmp_path.stat().st_size, backend='columnar')
+        os.replace(tmp_path, file_path)
     
+    @timed()
     def save_data(self, table_name: str, dataframe: pd.DataFrame) -> bool:
-        """Saves DataFrame to PostgreSQL"""
+        """Saves DataFrame to the Arrow file"""
         try:
-            # Rename display columns to DB names
-            reverse_mapping = {v: k for k, v in COLUMN_SCHEMA.items()}
-            df_to_save = dataframe.rename(columns=reverse_mapping)
-            # Clear table and insert new data
-            model_class = self.get_model_class(table_name)
-            if model_class:
-                self.session.query(model_class).delete()
-                df_to_save.to_sql(table_name, self.engine, if_exists='append', index=False)
-                self.session.commit()
-                return True
+            with file_lock(self._file_path(table_name)):
+                self.write_table(table_name, self.to_arrow(dataframe))
+            count('rows_written', len(dataframe), backend='columnar')
+            return True
+        except Exception as e:
+            print(f"Error saving {table_name}: {e}")
             return False
+    
+    @timed()
+    def append_records(self, table_name: str, records: pd.DataFrame) -> bool:
+        """Appends records by concatenating typed Arrow tables (no text parsing of existing rows)"""
+        import pyarrow as pa
+        try:
+            new_table = self.to_arrow(records)
+            with file_lock(self._file_path(table_name)):
+                current = self.load_table(table_name)
+                if current is not None:
+                    new_table = pa.concat_tables([current, new_table]).unify_dictionaries()
+                self.write_table(table_name, new_table)
+            count('rows_written', len(records), backend='columnar')
+            return True
         except Exception as e:
-            print(f"Error saving to PostgreSQL {table_name}: {e}")
-            if self.session:
-                self.session.rollback()
+            print(f"Error appending to {table_name}: {e}")
             return False
+    
+    def append_unique(self, table_name: str, records: pd.DataFrame, duplicate_mask: Callable[[pd.DataFrame], np.ndarray],
+                      all_or_nothing: bool = False) -> Optional[np.ndarray]:
+        """Appends the records `duplicate_mask` does not flag under the file's exclusive lock, as CSVBackend.append_unique"""
+        with file_lock(self._file_path(table_name)):
+            duplicate = duplicate_mask(records)
+            if duplicate.all() or (all_or_nothing and duplicate.any()):
+                return duplicate
+            if not self.append_records(table_name, records[~duplicate]):
+                return None
+        return duplicate
+    
+    @timed()
+    def apply_changes(self, table_name: str, changes,
+                      duplicate_mask: Optional[Callable[[pd.DataFrame], np.ndarray]] = None) -> bool:
+        """
+        Applies a ChangeSet keyed on row position, under the file's exclusive lock.
+        Returns False without writing if the table changed since `changes.base_version`, or if
+        `duplicate_mask` flags an insert.
+        """
+        try:
+            with file_lock(self._file_path(table_name)):
+                if _refuse_changes(table_name, changes, self.get_version(table_name), duplicate_mask):
+                    return False
+                df = self.load_data(table_name)
+                for col in CATEGORICAL_COLUMNS:
+                    df[col] = df[col].astype(object)
+                for key, values in changes.updates.items():
+                    for col, value in values.items():
+                        if col in DATE_COLUMNS:
+                            value = parse_dates(pd.Series([value])).iloc[0]
+                        if col in df.columns:
+                            df.loc[int(key), col] = value
+                if changes.deletes:
+                    df = df.drop(index=[int(k) for k in changes.deletes])
+                if not changes.inserts.empty:
+                    df = pd.concat([df, changes.inserts], ignore_index=True)
+                return self.save_data(table_name, df)
+        except Exception as e:
+            print(f"Error applying changes to {table_name}: {e}")
+            return False
+
+    @timed()
+    def upsert_records(self, table_name: str, records: pd.DataFrame, fields: pd.DataFrame,
+                       insertable: Optional[np.ndarray] = None, all_or_nothing: bool = False) -> np.ndarray:
+        """
+        Upserts records as CSVBackend.upsert_records, matching and writing under the file's
+        exclusive lock. Returns a mask of the matched (updated) records.
+        """
+        with file_lock(self._file_path(table_name)):
+            table = self.load_table(table_name)
+            current = table.select(KEY_COLUMNS).to_pandas() if table is not None else pd.DataFrame(columns=KEY_COLUMNS)
+            changes, matched = upsert_changes(current, records, fields, insertable)
+            if all_or_nothing and insertable is not None and (~matched & ~insertable).any():
+                return matched
+            changes.base_version = self.get_version(table_name)
+            if not changes.is_empty() and not self.apply_changes(table_name, changes):
+                raise IOError(f"Could not upsert into {table_name}")
+        return matched
+
+class AsyncRunner:
+    """
+    Event loop running in a daemon thread, shared by the whole process.
+    Lets synchronous callers (Streamlit scripts, CLI) run coroutines while async engine
+    pools stay bound to a single loop.
+    """
+
+    def __init__(self):
+        self._loop = None
+        self._lock = threading.Lock()
+
+    def run(self, coroutine):
+        """Runs a coroutine on the shared loop and blocks until it returns"""
+        import asyncio
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, name="async-runner", daemon=True).start()
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop).result()
+
+async_runner = AsyncRunner()
+
+class TableCache:
+    """
+    Process-wide cache of loaded tables, shared by all Streamlit sessions.
+    Entries are validated against the backend version probe (journal version or file mtime/size
+    for CSV, change counter for PostgreSQL) plus a local write counter bumped on every write.
+    The row positions matched by recent queries are kept per table version, so paging and
+    re-rendering a filtered view only slice them.
+    """
+    
+    # Row positions kept for recent queries, in total over all tables (least recently used dropped first)
+    max_memo_rows = 5_000_000
+    
+    def __init__(self):
+        self._entries = {}
+        self._write_counters = {}
+        self._matches = OrderedDict()
+        self._memo_rows = 0
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def _key(backend, table_name: str):
+        return (type(backend).__name__, str(getattr(backend, 'data_dir', '')), table_name)
+    
+    def signature(self, backend, table_name: str):
+        """Current version of a table: backend probe plus the local write counter"""
+        key = self._key(backend, table_name)
+        return (backend.get_version(table_name), self._write_counters.get(key, 0))
+    
+    async def get_async(self, backend, table_name: str) -> pd.DataFrame:
+        """get() for backends with an async probe and loader (get_version_async/load_data_async)"""
+        key = self._key(backend, table_name)
+        signature = (await backend.get_version_async(table_name), self._write_counters.get(key, 0))
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is not None and entry[0] == signature:
+            count('cache_hits', 1, table=table_name)
+            return entry[1].copy()
+        count('cache_misses', 1, table=table_name)
+        df = await backend.load_data_async(table_name)
+        with self._lock:
+            self._entries[key] = (signature, df)
+        return df.copy()
+    
+    def get(self, backend, table_name: str) -> pd.DataFrame:
+        """Returns a copy of the cached table, reloading it if the backend reports a change"""
+        return self.current(backend, table_name)[1].copy()
+    
+    def current(self, backend, table_name: str) -> Tuple[Any, pd.DataFrame]:
+        """
+        (signature, table) of the cached table, reloading it if the backend reports a change.
+        The table is not copied: callers must not modify it.
+        """
+        key = self._key(backend, table_name)
+        signature = self.signature(backend, table_name)
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is not None and entry[0] == signature:
+            count('cache_hits', 1, table=table_name)
+            return entry
+        count('cache_misses', 1, table=table_name)
+        df = backend.load_data(table_name)
+        with self._lock:
+            self._entries[key] = (signature, df)
+        return signature, df
+    
+    def peek(self, backend, table_name: str) -> Optional[pd.DataFrame]:
+        """Returns the cached table without copying if it is still valid, otherwise None (never loads)"""
+        key = self._key(backend, table_name)
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is not None and entry[0] == self.signature(backend, table_name):
+            return entry[1]
+        return None
+    
+    def query(self, backend, table_name: str, filters: Optional[Dict[str, str]] = None, order_by: Optional[str] = None,
+              offset: int = 0, limit: Optional[int] = None):
+        """
+        query_dataframe on the cached table, or None if the table is not cached (never loads).
+        The matching row positions are memoized per table version, filters and order.
+        """
+        key = self._key(backend, table_name)
+        signature = self.signature(backend, table_name)
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None or entry[0] != signature:
+            return None
+        df = entry[1]
+        if not any((filters or {}).values()) and not order_by:
+            return query_dataframe(df, None, None, offset, limit)
+        query_key = (key, signature, tuple(sorted((col, value) for col, value in filters.items() if value)) if filters else (), order_by)
+        with self._lock:
+            positions = self._matches.get(query_key)
+            if positions is not None:
+                self._matches.move_to_end(query_key)
+        if positions is None:
+            count('query_memo_misses', 1, table=table_name)
+            positions = match_positions(df, filters, order_by)
+            with self._lock:
+                self._matches[query_key] = positions
+                self._memo_rows += len(positions)
+                while self._memo_rows > self.max_memo_rows and len(self._matches) > 1:
+                    self._memo_rows -= len(self._matches.popitem(last=False)[1])
+        else:
+            count('query_memo_hits', 1, table=table_name)
+        stop = None if limit is None else offset + limit
+        return df.iloc[positions[offset:stop]].copy(), len(positions)
+    
+    def _forget_queries(self, key):
+        """Drops the memoized queries of a table; the caller holds the lock"""
+        for query_key in [query_key for query_key in self._matches if query_key[0] == key]:
+            self._memo_rows -= len(self._matches.pop(query_key))
+    
+    def put(self, backend, table_name: str, dataframe: pd.DataFrame):
+        """Stores a freshly written table so the next read does not hit the backend"""
+        key = self._key(backend, table_name)
+        with self._lock:
+            self._write_counters[key] = self._write_counters.get(key, 0) + 1
+            self._forget_queries(key)
+        signature = self.signature(backend, table_name)
+        with self._lock:
+            self._entries[key] = (signature, dataframe)
+    
+    def invalidate(self, backend, table_name: str):
+        """Drops a table from the cache after a write that cannot update it in place"""
+        key = self._key(backend, table_name)
+        with self._lock:
+            self._write_counters[key] = self._write_counters.get(key, 0) + 1
+            self._entries.pop(key, None)
+            self._forget_queries(key)
+
+# Shared by every TableManager in the process
+table_cache = TableCache()
+
+# Data derived from the tables (KPI rollups, order-line keys, search indexes), updated by every write with the rows it changed
+_derived_stores = (rollup_store, dedup_store, search_store)
+
+# Worker threads for concurrent file table loads (load_many)
+_load_executor = ThreadPoolExecutor(max_workers=6, thread_name_prefix="table-loader")
 
 class TableManager:
     """Main manager for DemoERP table operations"""
@@ -198,28 +1127,302 @@ class TableManager:
     def __init__(self):
         # Select backend based on environment variable
         self.use_neon = os.getenv('USE_NEON', '').lower() in ('1', 'true', 'yes')
+        self.use_columnar = os.getenv('USE_COLUMNAR', '').lower() in ('1', 'true', 'yes')
         
         if self.use_neon:
             try:
+                from modules.pg_backend import PgBackend
                 self.backend = PgBackend()
                 print("✅ Connected to PostgreSQL (Neon)")
             except Exception as e:
                 print(f"⚠️ Error connecting to PostgreSQL, using CSV: {e}")
                 self.backend = CSVBackend()
                 self.use_neon = False  # Update state
+            self.use_columnar = False
+        elif self.use_columnar:
+            try:
+                self.backend = ColumnarBackend()
+                print("🗄️ Using columnar (Arrow) persistence")
+            except Exception as e:
+                print(f"⚠️ Error loading columnar backend, using CSV: {e}")
+                self.backend = CSVBackend()
+                self.use_columnar = False  # Update state
         else:
             self.backend = CSVBackend()
             print("📁 Using CSV persistence")
     
+    @staticmethod
+    def _table_name(table: Union[str, Tuple[str, str]]) -> str:
+        """Backend table name from a (section, subsection) pair, or a table name given as is"""
+        if isinstance(table, str):
+            return table
+        section, subsection = table
+        return f"{subsection}_{section}".lower()
+
+    @timed()
+    def load_many(self, tables: Iterable[Union[str, Tuple[str, str]]]) -> Dict[Any, pd.DataFrame]:
+        """
+        Loads several tables concurrently and returns {table: DataFrame} in the order given.
+        Tables are (section, subsection) pairs or backend table names (e.g. 'pedidos_clientes').
+        Runs on the shared event loop, so it can be called from synchronous code.
+        """
+        return async_runner.run(self.load_many_async(tables))
+
+    async def load_many_async(self, tables: Iterable[Union[str, Tuple[str, str]]]) -> Dict[Any, pd.DataFrame]:
+        """
+        Async variant of load_many. PostgreSQL tables are exported concurrently through the async
+        engine (asyncpg) when available; file tables are read in a thread pool. All go through the shared cache.
+        """
+        import asyncio
+        tables = list(tables)
+        if self.use_neon and self.backend.supports_async:
+            loads = [table_cache.get_async(self.backend, self._table_name(table)) for table in tables]
+        else:
+            loop = asyncio.get_running_loop()
+            loads = [loop.run_in_executor(_load_executor, table_cache.get, self.backend, self._table_name(table))
+                     for table in tables]
+        return dict(zip(tables, await asyncio.gather(*loads)))
+    
+    @timed()
     def get_dataframe(self, section: str, subsection: str) -> pd.DataFrame:
         """Gets DataFrame for a specific section/subsection"""
         table_name = f"{subsection}_{section}".lower()
-        return self.backend.load_data(table_name)
+        return table_cache.get(self.backend, table_name)
     
+    @timed()
     def save_dataframe(self, section: str, subsection: str, dataframe: pd.DataFrame) -> bool:
         """Saves DataFrame for a specific section/subsection"""
         table_name = f"{subsection}_{section}".lower()
-        return self.backend.save_data(table_name, dataframe)
+        saved = self.backend.save_data(table_name, dataframe)
+        if saved and hasattr(self.backend, 'normalize_dataframe'):
+            normalized = self.backend.normalize_dataframe(dataframe)
+            table_cache.put(self.backend, table_name, normalized)
+            after = self.get_version(section, subsection)
+            for store in _derived_stores:
+                store.replace(self.backend, table_name, after, normalized)
+        else:
+            table_cache.invalidate(self.backend, table_name)
+            for store in _derived_stores:
+                store.invalidate(self.backend, table_name)
+        return saved
+    
+    @timed()
+    def query(self, section: str, subsection: str, filters: Optional[Dict[str, str]] = None,
+              order_by: Optional[str] = None, offset: int = 0, limit: Optional[int] = None):
+        """
+        Returns (page, total_matches) for a specific section/subsection.
+        Filters are case-insensitive 'contains' matches; order_by is a column name ('-' prefix for descending).
+        File backends answer from the shared cache when it is warm (matches are memoized per table version);
+        PostgreSQL always runs the query in SQL.
+        """
+        table_name = f"{subsection}_{section}".lower()
+        if not self.use_neon:
+            result = table_cache.query(self.backend, table_name, filters, order_by, offset, limit)
+            if result is not None:
+                return result
+        return self.backend.query(table_name, filters, order_by, offset, limit)
+    
+    @timed()
+    def search(self, section: str, subsection: str, text: str, filters: Optional[Dict[str, str]] = None,
+               offset: int = 0, limit: Optional[int] = None):
+        """
+        Returns (page, total_matches) of the rows containing every word of `text` in their free-text
+        columns (SEARCH_CONFIG), best matches first; `filters` narrow the matches as in query.
+        PostgreSQL searches its tsvector column; file backends the process-wide index of modules.search.
+        """
+        table_name = self._table_name((section, subsection))
+        if self.use_neon:
+            return self.backend.search(table_name, text, filters, offset, limit)
+        # the index searched reflects the same table version as the (uncopied) cached frame
+        version, df = table_cache.current(self.backend, table_name)
+        rows, scores = search_store.search(self, section, subsection, text, table=(version, df))
+        if filters and any(filters.values()):
+            keep = filter_mask(df.iloc[rows], filters).to_numpy()
+            rows, scores = rows[keep], scores[keep]
+        return df.iloc[top_positions(rows, scores, offset, limit)], len(rows)
+
+    def iter_chunks(self, section: str, subsection: str, filters: Optional[Dict[str, str]] = None,
+                    chunk_size: Optional[int] = None) -> Iterator[pd.DataFrame]:
+        """
+        Yields the rows of a section/subsection matching `filters` (as query) in table order,
+        at most chunk_size rows at a time, for scans that must not hold the whole table (exports).
+        File backends slice the shared cache when it is warm; otherwise the backend streams the table.
+        """
+        table_name = self._table_name((section, subsection))
+        if not self.use_neon:
+            df = table_cache.peek(self.backend, table_name)
+            if df is not None:
+                positions = match_positions(df, filters)
+                chunk_size = chunk_size or CSVBackend.chunk_size
+                for start in range(0, len(positions), chunk_size):
+                    yield df.iloc[positions[start:start + chunk_size]]
+                return
+        yield from self.backend.iter_chunks(table_name, filters, chunk_size)
+
+    @timed()
+    def export(self, section: str, subsection: str, fmt: str, path, filters: Optional[Dict[str, str]] = None,
+               **options) -> int:
+        """
+        Streams a section/subsection to a CSV, XLSX or PDF file (see modules.export.export_table
+        for the options); returns the number of rows exported.
+        """
+        from modules.export import export_table
+        return export_table(self, section, subsection, fmt, path, filters, **options)
+
+    def get_version(self, section: str, subsection: str):
+        """Version signature of a table, changing with every write (used to skip unchanged tables)"""
+        return table_cache.signature(self.backend, self._table_name((section, subsection)))
+
+    def base_version(self, section: str, subsection: str):
+        """
+        Backend version of a table, read before loading rows for editing: a ChangeSet built from
+        those rows carries it, and apply_changes refuses the ChangeSet once the table has changed.
+        """
+        return self.backend.get_version(self._table_name((section, subsection)))
+
+    @timed()
+    def aggregate(self, section: str, subsection: str, keys: List[str], value: str,
+                  labels: Optional[List[str]] = None) -> pd.DataFrame:
+        """
+        Sums `value` per key combination for a specific section/subsection (see aggregate_frame).
+        PostgreSQL runs the GROUP BY in SQL; file backends aggregate the cached table.
+        """
+        table_name = self._table_name((section, subsection))
+        if self.use_neon:
+            return self.backend.aggregate(table_name, keys, value, labels)
+        df = table_cache.peek(self.backend, table_name)
+        if df is None:
+            df = table_cache.get(self.backend, table_name)
+        return aggregate_frame(df, keys, value, labels)
+    
+    @timed()
+    def append_records(self, section: str, subsection: str, records) -> bool:
+        """Appends new records (DataFrame or list of dicts) to a specific section/subsection"""
+        table_name = f"{subsection}_{section}".lower()
+        if not isinstance(records, pd.DataFrame):
+            records = pd.DataFrame(list(records))
+        if records.empty:
+            return True
+        before = self.get_version(section, subsection)
+        appended = self.backend.append_records(table_name, records)
+        table_cache.invalidate(self.backend, table_name)
+        after = self.get_version(section, subsection)
+        for store in _derived_stores:
+            if appended:
+                store.apply(self.backend, table_name, before, after, added=records)
+            else:
+                store.invalidate(self.backend, table_name)
+        return appended
+    
+    @timed()
+    def apply_changes(self, section: str, subsection: str, changes) -> bool:
+        """
+        Persists only the rows touched by a ChangeSet for a specific section/subsection.
+        Returns False if the write failed, the table changed since `changes.base_version`, or (in tables
+        where an order line is saved once) an insert repeats a saved line; the backend checks the
+        version and the lines under the lock it writes with.
+        """
+        table_name = f"{subsection}_{section}".lower()
+        if changes.is_empty():
+            return True
+        before = self.get_version(section, subsection)
+        # rows replaced by the change set, taken from the cached table before it is written
+        in_use = any(store.is_current(self.backend, table_name, before) for store in _derived_stores)
+        current = table_cache.peek(self.backend, table_name) if in_use else None
+        if not is_unique_table(subsection) or changes.inserts.empty:
+            applied = self.backend.apply_changes(table_name, changes)
+        elif self.use_neon:
+            applied = self.backend.apply_changes(table_name, changes, unique_lines=True)
+        else:
+            applied = self.backend.apply_changes(
+                table_name, changes, lambda batch: dedup_store.duplicate_mask(self, section, subsection, batch))
+        table_cache.invalidate(self.backend, table_name)
+        if applied and current is not None:
+            removed, added = changed_rows(current, changes)
+            after = self.get_version(section, subsection)
+            for store in _derived_stores:
+                store.apply(self.backend, table_name, before, after, added, removed)
+        else:
+            for store in _derived_stores:
+                store.invalidate(self.backend, table_name)
+        return applied
+
+    @timed()
+    def append_new_records(self, section: str, subsection: str, records, all_or_nothing: bool = False) -> Optional[np.ndarray]:
+        """
+        Appends the records (DataFrame or list of dicts) whose order line is not saved yet and does not
+        repeat an earlier record of the batch; with `all_or_nothing`, nothing is written if one does.
+        The backend checks and writes under its write lock (a file lock, or one PostgreSQL transaction),
+        so concurrent writers cannot both save a line; tables that allow repeated lines get every record.
+        Returns the mask of the duplicate records, None if the write failed.
+        """
+        if not isinstance(records, pd.DataFrame):
+            records = pd.DataFrame(list(records))
+        if not is_unique_table(subsection) or records.empty:
+            return np.zeros(len(records), dtype=bool) if self.append_records(section, subsection, records) else None
+        table_name = self._table_name((section, subsection))
+        before = self.get_version(section, subsection)
+        if self.use_neon:
+            duplicate = self.backend.append_unique(table_name, records, all_or_nothing)
+        else:
+            duplicate = self.backend.append_unique(
+                table_name, records, lambda batch: dedup_store.duplicate_mask(self, section, subsection, batch), all_or_nothing)
+        if duplicate is not None and (duplicate.all() or (all_or_nothing and duplicate.any())):
+            return duplicate
+        table_cache.invalidate(self.backend, table_name)
+        after = self.get_version(section, subsection)
+        for store in _derived_stores:
+            if duplicate is not None:
+                store.apply(self.backend, table_name, before, after, added=records[~duplicate])
+            else:
+                store.invalidate(self.backend, table_name)
+        return duplicate
+
+    @timed()
+    def duplicate_mask(self, section: str, subsection: str, records) -> np.ndarray:
+        """
+        True for records whose order line (sender code, order number, EAN code) is already saved or
+        repeats an earlier record of the batch; all False for tables that allow repeated lines.
+        """
+        if not isinstance(records, pd.DataFrame):
+            records = pd.DataFrame(list(records))
+        if not is_unique_table(subsection) or records.empty:
+            return np.zeros(len(records), dtype=bool)
+        return dedup_store.duplicate_mask(self, section, subsection, records)
+
+    @timed()
+    def find_duplicates(self, section: str, subsection: str) -> pd.DataFrame:
+        """Rows of a section/subsection sharing their order line with another row, with a 'Copies' count"""
+        table_name = self._table_name((section, subsection))
+        if self.use_neon:
+            return self.backend.find_duplicates(table_name)
+        return find_duplicates(table_cache.get(self.backend, table_name))
+
+    @timed()
+    def upsert_records(self, section: str, subsection: str, records: pd.DataFrame, fields: pd.DataFrame,
+                       insertable: Optional[np.ndarray] = None, all_or_nothing: bool = False) -> np.ndarray:
+        """
+        Updates records by order line (each line at most once per batch) with the fields each one supplied
+        (True in `fields`, one column per updatable column) and inserts the unmatched ones
+        `insertable` allows (default: all); with `all_or_nothing`, nothing is written if an unmatched record
+        is not insertable. The backend matches the lines and writes under its write lock (a file lock, or
+        one PostgreSQL transaction). Returns a mask of the matched (updated) records; raises IOError if the
+        write failed.
+        """
+        table_name = self._table_name((section, subsection))
+        if insertable is None:
+            insertable = np.ones(len(records), dtype=bool)
+        before = self.get_version(section, subsection)
+        matched = self.backend.upsert_records(table_name, records, fields, insertable, all_or_nothing)
+        if all_or_nothing and (~matched & ~insertable).any():
+            return matched
+        table_cache.invalidate(self.backend, table_name)
+        # updated rows keep their order line; their old values (needed by the rollups) are unknown
+        dedup_store.apply(self.backend, table_name, before, self.get_version(section, subsection),
+                          added=records[~matched & insertable])
+        rollup_store.invalidate(self.backend, table_name)
+        search_store.invalidate(self.backend, table_name)
+        return matched
     
     def get_empty_dataframe(self) -> pd.DataFrame:
         """Returns an empty DataFrame with the correct structure"""
@@ -227,3 +1430,15 @@ class TableManager:
             return self.backend.get_empty_dataframe()
         else:
             return pd.DataFrame(columns=list(COLUMN_SCHEMA.values()))
+
+# One TableManager (and backend) for the whole process, shared by every session and API request
+_table_manager = None
+_table_manager_lock = threading.Lock()
+
+def get_table_manager() -> TableManager:
+    """Returns the process-wide TableManager, creating it (and connecting the backend) on first use"""
+    global _table_manager
+    with _table_manager_lock:
+        if _table_manager is None:
+            _table_manager = TableManager()
+        return _table_manager
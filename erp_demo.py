@@ -9,17 +9,26 @@ Handles sidebar navigation, section selection, and main workflow.
 import streamlit as st
 import pandas as pd
 from datetime import datetime, date
-from database import TableManager
+from database import get_table_manager
 from modules.ui_layout import set_page_config, main_header, sidebar_logo
 from modules.form_entry import show_entry_form
 from modules.table_view import show_existing_records
+from modules.reconciliation_view import show_reconciliation
+from modules.kpi_view import show_kpis
 from modules.demo_data import create_demo_data
+from modules.debug_view import capture_options, debug_enabled, show_debug_panel
+from modules.instrumentation import span, trace
 
 set_page_config()
 
-# Initialize the main table manager in session state
+# The table manager (backend, connection pool) is shared by all sessions of the process
 if 'table_manager' not in st.session_state:
-    st.session_state.table_manager = TableManager()
+    st.session_state.table_manager = get_table_manager()
+
+@st.cache_data
+def demo_records() -> pd.DataFrame:
+    """Demo form fixtures, built once per process (each call gets its own copy)"""
+    return create_demo_data()
 
 def main():
     """
@@ -45,7 +54,12 @@ def main():
         )
         st.markdown("---")
         st.markdown("### ℹ️ System Info")
-        backend_info = "PostgreSQL (Neon)" if st.session_state.table_manager.use_neon else "Local CSV"
+        if st.session_state.table_manager.use_neon:
+            backend_info = "PostgreSQL (Neon)"
+        elif st.session_state.table_manager.use_columnar:
+            backend_info = "Local Columnar (Arrow)"
+        else:
+            backend_info = "Local CSV"
         st.info(f"**Backend:** {backend_info}")
         st.info(f"**Active Section:** {section}")
         st.info(f"**Type:** {subsection}")
@@ -58,7 +72,7 @@ def main():
         if demo_button_clicked:
             # Only available for Customers - Orders
             if section == "Customers" and subsection == "Orders":
-                demo_data_df = create_demo_data()
+                demo_data_df = demo_records()
                 total = len(demo_data_df)
                 # Advance the counter and wrap around
                 st.session_state.demo_counter = (st.session_state.demo_counter + 1) % total
@@ -81,11 +95,15 @@ def main():
     # Main content area: show form and table for Customers-Orders, or placeholder for other sections
     if section == "Customers" and subsection == "Orders":
         st.markdown(f"## 📦 {section} - {subsection} Management")
-        tab1, tab2 = st.tabs(["📝 New Record", "📊 View/Edit Records"])
+        tab1, tab2, tab3, tab4 = st.tabs(["📝 New Record", "📊 View/Edit Records", "🔗 Reconciliation", "📈 Reports"])
         with tab1:
             show_entry_form(section, subsection, st.session_state.table_manager)
         with tab2:
             show_existing_records(section, subsection, st.session_state.table_manager)
+        with tab3:
+            show_reconciliation(section, st.session_state.table_manager)
+        with tab4:
+            show_kpis(section, subsection, st.session_state.table_manager)
     else:
         st.markdown(f"## 🚧 {section} - {subsection}")
         st.info(f"📋 Section **{subsection}** for **{section}** is under construction.")
@@ -99,4 +117,11 @@ def main():
         """)
 
 if __name__ == "__main__":
-    main()
+    # Each rerun is traced; the debug panel shows its timings after the page is rendered
+    debugging = debug_enabled()
+    with trace(**(capture_options() if debugging else {})) as rerun:
+        with span('app.rerun'):
+            main()
+    if debugging:
+        with st.sidebar:
+            show_debug_panel(rerun)
@@ -0,0 +1,380 @@
+"""
+Command-line maintenance tasks for DemoERP
+Run `python manage.py --help` to list the available commands.
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+from config import DATABASE_CONFIG
+
+def migrate_columnar(args) -> int:
+    """
+    One-shot migration of every CSV table in the data directory to Arrow IPC files.
+    Existing CSV files are left untouched.
+    """
+    from database import CSVBackend, ColumnarBackend
+    csv_backend = CSVBackend(args.data_dir)
+    columnar_backend = ColumnarBackend(args.data_dir)
+    csv_files = sorted(Path(args.data_dir).glob("*.csv"))
+    if not csv_files:
+        print(f"ℹ️ No CSV tables found in {args.data_dir}")
+        return 0
+    failed = 0
+    for file_path in csv_files:
+        table_name = file_path.stem
+        df = csv_backend.load_data(table_name)
+        if columnar_backend.save_data(table_name, df):
+            print(f"✅ {table_name}: {len(df)} rows migrated")
+        else:
+            print(f"❌ {table_name}: migration failed")
+            failed += 1
+    return 1 if failed else 0
+
+def pg_migrate(args) -> int:
+    """Creates the missing PostgreSQL tables and indexes (the app does it on first connection unless PG_AUTO_MIGRATE=0)"""
+    from modules.pg_backend import PgBackend, migrate
+    started = time.perf_counter()
+    migrate(PgBackend(args.url).url)
+    print(f"✅ Schema up to date in {time.perf_counter() - started:.1f}s")
+    return 0
+
+def pg_import(args) -> int:
+    """Bulk loads a CSV file (CSVBackend layout) into a PostgreSQL table with COPY, chunk by chunk"""
+    import pandas as pd
+    from modules.pg_backend import PgBackend
+    backend = PgBackend()
+    started = time.perf_counter()
+    chunks = pd.read_csv(args.file, dtype=str, chunksize=args.chunk_size)
+    rows = backend.copy_from(args.table, chunks, replace=args.replace)
+    elapsed = time.perf_counter() - started
+    print(f"✅ {rows} rows imported into {args.table} in {elapsed:.1f}s ({rows / max(elapsed, 1e-9):,.0f} rows/s)")
+    return 0
+
+def pg_export(args) -> int:
+    """Streams a PostgreSQL table to a CSV file (CSVBackend layout) with COPY"""
+    from modules.pg_backend import PgBackend
+    backend = PgBackend()
+    started = time.perf_counter()
+    with open(args.file, 'w', newline='') as f:
+        rows = backend.copy_to(args.table, f)
+    elapsed = time.perf_counter() - started
+    print(f"✅ {rows} rows exported from {args.table} in {elapsed:.1f}s ({rows / max(elapsed, 1e-9):,.0f} rows/s)")
+    return 0
+
+def import_csv(args) -> int:
+    """Streams a large CSV dump into a section/subsection through the active backend"""
+    from database import TableManager
+    from modules.importer import import_csv as run_import
+    table_manager = TableManager()
+
+    def progress(report):
+        print(f"  {report['read']:,} rows read, {report['imported']:,} imported, "
+              f"{report['rejected']:,} rejected ({report['rows_per_second']:,.0f} rows/s)")
+
+    report = run_import(table_manager, args.section, args.subsection, args.file,
+                        chunk_size=args.chunk_size, rejected_path=args.rejected, progress=progress)
+    print(f"✅ {report['imported']:,} of {report['read']:,} rows imported in {report['seconds']:.1f}s "
+          f"({report['rows_per_second']:,.0f} rows/s)")
+    if report['rejected']:
+        print(f"⚠️ {report['rejected']:,} rows rejected ({report['duplicates']:,} duplicate order lines)"
+              + (f", see {args.rejected}" if args.rejected else ""))
+    if report['failed']:
+        print(f"❌ {report['failed']:,} rows could not be written")
+        return 1
+    return 0
+
+def bench_dates(args) -> int:
+    """
+    Compares the legacy date round-trip (dayfirst inference + strftime) with the shared
+    format-pinned parser on a synthetic column of `--rows` DD/MM/YYYY dates.
+    """
+    import numpy as np
+    import pandas as pd
+    from modules.dates import format_dates, parse_dates
+    days = pd.Timestamp('2020-01-01') + pd.to_timedelta(np.random.default_rng(0).integers(0, 2000, args.rows), unit='D')
+    text = pd.Series(days.strftime('%d/%m/%Y'))
+
+    def timed(func):
+        started = time.perf_counter()
+        result = func()
+        return result, time.perf_counter() - started
+
+    legacy_parsed, legacy_parse = timed(lambda: pd.to_datetime(text, errors='coerce', dayfirst=True))
+    legacy_text, legacy_format = timed(lambda: legacy_parsed.dt.strftime('%d/%m/%Y'))
+    parsed, parse = timed(lambda: parse_dates(text))
+    formatted, fmt = timed(lambda: format_dates(parsed))
+    if not (parsed.equals(legacy_parsed.astype('datetime64[ns]')) and (formatted == legacy_text.astype(object)).all()):
+        print("❌ Results differ from the legacy round-trip")
+        return 1
+    print(f"{args.rows:,} dates")
+    print(f"  parse : legacy {legacy_parse:.3f}s, pinned {parse:.3f}s ({legacy_parse / max(parse, 1e-9):.0f}x)")
+    print(f"  format: legacy {legacy_format:.3f}s, pinned {fmt:.3f}s ({legacy_format / max(fmt, 1e-9):.0f}x)")
+    return 0
+
+def bench_validation(args) -> int:
+    """Times the schema-driven validator on `--rows` synthetic records (about 15% of them invalid)"""
+    import numpy as np
+    import pandas as pd
+    from modules.importer import normalize_chunk
+    from modules.validation import validate_frame, validate_records
+    rng = np.random.default_rng(0)
+    rows = args.rows
+    dates = pd.Series(pd.Timestamp('2024-01-01') + pd.to_timedelta(rng.integers(0, 700, rows), unit='D')).dt.strftime('%d/%m/%Y')
+    chunk = normalize_chunk(pd.DataFrame({
+        'Num_Pedido': pd.Series(np.arange(rows)).astype(str).radd('PO-'),
+        'Nombre_Emisor': np.where(rng.random(rows) < 0.05, '', 'ACME Labels'),
+        'Fecha_Pedido': dates.where(rng.random(rows) >= 0.05, '31/02/2025'),
+        'Descripcion': 'Adhesive labels 100x50',
+        'Cantidad': rng.integers(0, 20, rows)
+    }))
+    started = time.perf_counter()
+    matrix = validate_frame(chunk)
+    matrix_seconds = time.perf_counter() - started
+    started = time.perf_counter()
+    errors = validate_records(chunk)
+    messages_seconds = time.perf_counter() - started
+    print(f"{rows:,} records, {int((errors != '').sum()):,} invalid, {matrix.shape[1]} checks")
+    print(f"  error matrix : {matrix_seconds:.3f}s ({rows / max(matrix_seconds, 1e-9):,.0f} rows/s)")
+    print(f"  with messages: {messages_seconds:.3f}s")
+    return 0
+
+def _print_comparison(baseline: dict, current: dict, tolerance: float) -> int:
+    """Prints the benchmarks that got slower or faster than the baseline; returns 1 if any regressed"""
+    from modules.benchmark import compare
+    rows = compare(baseline, current, tolerance)
+    regressions = [row for row in rows if row['regression']]
+    for row in rows:
+        if row['regression'] or row['ratio'] < 1 / (1 + tolerance):
+            mark = "❌" if row['regression'] else "✅"
+            print(f"{mark} {row['backend']:<9} {row['rows']:>9,} {row['operation']:<14} "
+                  f"{row['baseline']:.4f}s -> {row['current']:.4f}s ({row['ratio']:.2f}x)")
+    print(f"{len(rows)} benchmarks compared, {len(regressions)} slower by more than {tolerance:.0%}")
+    return 1 if regressions else 0
+
+def bench(args) -> int:
+    """Times the backend and in-memory paths on synthetic orders and writes the results as JSON"""
+    import json
+    from modules.benchmark import run_benchmarks
+    if 'postgres' in args.backends and not args.pg_url:
+        print("❌ The postgres benchmarks need --pg-url pointing to a scratch database (its tables are overwritten)")
+        return 1
+
+    def progress(result):
+        print(f"  {result['backend']:<9} {result['rows']:>9,} {result['operation']:<14} "
+              f"{result['seconds']:>9.4f}s {result['rows_per_second']:>13,} rows/s")
+
+    run = run_benchmarks(args.sizes, args.backends, args.repeat, args.pg_url, progress)
+    with open(args.output, 'w') as f:
+        json.dump(run, f, indent=2)
+    print(f"Results written to {args.output}")
+    if args.compare:
+        with open(args.compare) as f:
+            return _print_comparison(json.load(f), run, args.tolerance)
+    return 0
+
+def bench_compare(args) -> int:
+    """Compares two saved benchmark runs"""
+    import json
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+    return _print_comparison(baseline, current, args.tolerance)
+
+def bench_startup(args) -> int:
+    """Times cold imports and the first render of a new session in fresh interpreters, as benchmark JSON"""
+    import json
+    from modules.benchmark import run_startup_benchmarks
+
+    def progress(result):
+        print(f"  {result['operation']:<16} {result['seconds']:>9.4f}s")
+
+    run = run_startup_benchmarks(args.repeat, progress)
+    with open(args.output, 'w') as f:
+        json.dump(run, f, indent=2)
+    print(f"Results written to {args.output}")
+    if args.compare:
+        with open(args.compare) as f:
+            return _print_comparison(json.load(f), run, args.tolerance)
+    return 0
+
+def export(args) -> int:
+    """Streams a section/subsection to a CSV, XLSX or PDF file through the active backend, chunk by chunk"""
+    from database import TableManager
+    fmt = args.format or Path(args.file).suffix.lstrip('.').lower()
+    if fmt not in ('csv', 'xlsx', 'pdf'):
+        print("❌ Unknown export format: use a .csv, .xlsx or .pdf file name or --format")
+        return 1
+    filters = {}
+    for item in args.filter or []:
+        column, _, value = item.partition('=')
+        filters[column] = value
+    started = time.perf_counter()
+
+    def progress(rows):
+        print(f"  {rows:,} rows written ({rows / max(time.perf_counter() - started, 1e-9):,.0f} rows/s)")
+
+    rows = TableManager().export(args.section, args.subsection, fmt, args.file, filters,
+                                 chunk_size=args.chunk_size, workers=args.workers, progress=progress)
+    elapsed = time.perf_counter() - started
+    print(f"✅ {rows:,} rows exported to {args.file} in {elapsed:.1f}s ({rows / max(elapsed, 1e-9):,.0f} rows/s)")
+    return 0
+
+def search(args) -> int:
+    """Full-text search of a section/subsection through the active backend, printing the best matches"""
+    from database import TableManager
+    table_manager = TableManager()
+    # the first search of a file table also builds its index
+    started = time.perf_counter()
+    table_manager.search(args.section, args.subsection, args.text, limit=args.limit)
+    first = time.perf_counter() - started
+    started = time.perf_counter()
+    page, total = table_manager.search(args.section, args.subsection, args.text, limit=args.limit)
+    elapsed = time.perf_counter() - started
+    print(f"🔎 {total:,} matches in {elapsed * 1000:.1f} ms (first search: {first * 1000:.1f} ms)")
+    if not page.empty:
+        print(page[['Num_Pedido', 'Nombre_Emisor', 'Cod_Art_EAN', 'Descripcion']].to_string())
+    return 0
+
+def find_duplicates(args) -> int:
+    """Lists the rows of a table sharing their order line (sender code, order number, EAN code) with another row"""
+    from database import TableManager
+    report = TableManager().find_duplicates(args.section, args.subsection)
+    if report.empty:
+        print(f"✅ {args.section} - {args.subsection}: no duplicate order lines")
+        return 0
+    lines = int(round((1 / report['Copies']).sum()))
+    print(f"⚠️ {args.section} - {args.subsection}: {len(report):,} rows share {lines:,} order lines")
+    if args.output:
+        report.to_csv(args.output, index_label='Row')
+        print(f"Report written to {args.output}")
+    else:
+        print(report[['Cod_Emisor', 'Num_Pedido', 'Cod_Art_EAN', 'Copies']].head(args.limit).to_string())
+    return 0
+
+def memory_report(args) -> int:
+    """Loads every table through the active backend and prints its memory in the compact model vs Python str objects"""
+    from database import TableManager, memory_report as table_memory
+    table_manager = TableManager()
+    tables = [(section, subsection) for section in ("Customers", "Suppliers")
+              for subsection in ("Orders", "Delivery Notes", "Invoices")]
+    total_bytes = total_object_bytes = 0
+    for (section, subsection), df in table_manager.load_many(tables).items():
+        report = table_memory(df)
+        bytes_, object_bytes = report.iloc[-1][['Bytes', 'Object_Bytes']]
+        total_bytes += bytes_
+        total_object_bytes += object_bytes
+        print(f"{section} - {subsection}: {len(df):,} rows, {bytes_ / 2**20:.1f} MiB "
+              f"(as str objects {object_bytes / 2**20:.1f} MiB, {object_bytes / max(bytes_, 1):.1f}x)")
+        if args.columns:
+            print(report.iloc[:-1].to_string(index=False))
+    print(f"Total: {total_bytes / 2**20:.1f} MiB (as str objects {total_object_bytes / 2**20:.1f} MiB)")
+    return 0
+
+def build_parser() -> argparse.ArgumentParser:
+    """Builds the argument parser with one sub-command per task"""
+    parser = argparse.ArgumentParser(description="DemoERP maintenance commands")
+    parser.add_argument("--metrics-dir", help="Write the command's timings and I/O counters (metrics.json, metrics.prom) here")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    migrate = subparsers.add_parser("migrate-columnar", help="Convert CSV tables to Arrow IPC files")
+    migrate.add_argument("--data-dir", default=DATABASE_CONFIG['csv_dir'], help="Directory holding the CSV tables")
+    migrate.set_defaults(func=migrate_columnar)
+
+    schema = subparsers.add_parser("pg-migrate", help="Create the missing PostgreSQL tables and indexes")
+    schema.add_argument("--url", help="SQLAlchemy URL of the database (default: the PG* environment variables)")
+    schema.set_defaults(func=pg_migrate)
+
+    copy_in = subparsers.add_parser("pg-import", help="Bulk load a CSV file into a PostgreSQL table (COPY)")
+    copy_in.add_argument("table", help="Table name, e.g. pedidos_clientes")
+    copy_in.add_argument("file", help="CSV file with the DemoERP column names")
+    copy_in.add_argument("--replace", action="store_true", help="Truncate the table before loading")
+    copy_in.add_argument("--chunk-size", type=int, default=100000, help="Rows per COPY buffer")
+    copy_in.set_defaults(func=pg_import)
+
+    copy_out = subparsers.add_parser("pg-export", help="Export a PostgreSQL table to a CSV file (COPY)")
+    copy_out.add_argument("table", help="Table name, e.g. pedidos_clientes")
+    copy_out.add_argument("file", help="Output CSV file")
+    copy_out.set_defaults(func=pg_export)
+
+    importer = subparsers.add_parser("import-csv", help="Stream a large CSV dump into a table with validation")
+    importer.add_argument("file", help="CSV file with the DemoERP column names")
+    importer.add_argument("--section", default="Customers", choices=["Customers", "Suppliers"])
+    importer.add_argument("--subsection", default="Orders", choices=["Orders", "Delivery Notes", "Invoices"])
+    importer.add_argument("--chunk-size", type=int, default=50000, help="Rows read and written per chunk")
+    importer.add_argument("--rejected", help="Write rows failing validation to this CSV file")
+    importer.set_defaults(func=import_csv)
+
+    dates = subparsers.add_parser("bench-dates", help="Benchmark date parsing/formatting against the legacy path")
+    dates.add_argument("--rows", type=int, default=1_000_000, help="Number of synthetic dates")
+    dates.set_defaults(func=bench_dates)
+
+    validation = subparsers.add_parser("bench-validation", help="Benchmark the vectorized record validator")
+    validation.add_argument("--rows", type=int, default=1_000_000, help="Number of synthetic records")
+    validation.set_defaults(func=bench_validation)
+
+    suite = subparsers.add_parser("bench", help="Benchmark load/save/append/filter per backend on synthetic orders")
+    suite.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000], help="Table sizes (rows)")
+    suite.add_argument("--backends", nargs="+", default=["csv", "columnar"], choices=["csv", "columnar", "postgres"])
+    suite.add_argument("--pg-url", help="SQLAlchemy URL of a scratch PostgreSQL database for the postgres backend")
+    suite.add_argument("--repeat", type=int, default=3, help="Runs per benchmark (the fastest is kept)")
+    suite.add_argument("--output", default="bench_results.json", help="JSON file for the results")
+    suite.add_argument("--compare", help="Baseline JSON file to check the results against")
+    suite.add_argument("--tolerance", type=float, default=0.25, help="Slowdown reported as a regression (0.25 = 25%%)")
+    suite.set_defaults(func=bench)
+
+    compare = subparsers.add_parser("bench-compare", help="Compare two benchmark JSON files")
+    compare.add_argument("baseline", help="Baseline results")
+    compare.add_argument("current", help="Results to check")
+    compare.add_argument("--tolerance", type=float, default=0.25, help="Slowdown reported as a regression (0.25 = 25%%)")
+    compare.set_defaults(func=bench_compare)
+
+    startup = subparsers.add_parser("bench-startup", help="Benchmark cold imports and the first render of a session")
+    startup.add_argument("--repeat", type=int, default=5, help="Fresh interpreters per benchmark (the fastest is kept)")
+    startup.add_argument("--output", default="startup_results.json", help="JSON file for the results")
+    startup.add_argument("--compare", help="Baseline JSON file to check the results against")
+    startup.add_argument("--tolerance", type=float, default=0.25, help="Slowdown reported as a regression (0.25 = 25%%)")
+    startup.set_defaults(func=bench_startup)
+
+    exporter = subparsers.add_parser("export", help="Export a table to CSV, XLSX or PDF order sheets (streamed in chunks)")
+    exporter.add_argument("file", help="Output file; the format follows its extension unless --format is given")
+    exporter.add_argument("--format", choices=["csv", "xlsx", "pdf"], help="Output format")
+    exporter.add_argument("--section", default="Customers", choices=["Customers", "Suppliers"])
+    exporter.add_argument("--subsection", default="Orders", choices=["Orders", "Delivery Notes", "Invoices"])
+    exporter.add_argument("--filter", action="append", metavar="COLUMN=TEXT",
+                          help="Only rows whose column contains the text (case-insensitive), e.g. Nombre_Emisor=acme; repeatable")
+    exporter.add_argument("--chunk-size", type=int, help="Rows read and rendered at a time (default: EXPORT_CONFIG)")
+    exporter.add_argument("--workers", type=int, help="Processes rendering CSV/PDF chunks (default: one per CPU)")
+    exporter.set_defaults(func=export)
+
+    searcher = subparsers.add_parser("search", help="Full-text search of a table, best matches first")
+    searcher.add_argument("text", help="Words to find in descriptions, codes and names (the last one may be a prefix)")
+    searcher.add_argument("--section", default="Customers", choices=["Customers", "Suppliers"])
+    searcher.add_argument("--subsection", default="Orders", choices=["Orders", "Delivery Notes", "Invoices"])
+    searcher.add_argument("--limit", type=int, default=20, help="Matches printed")
+    searcher.set_defaults(func=search)
+
+    duplicates = subparsers.add_parser("find-duplicates", help="List rows repeating an order line")
+    duplicates.add_argument("--section", default="Customers", choices=["Customers", "Suppliers"])
+    duplicates.add_argument("--subsection", default="Orders", choices=["Orders", "Delivery Notes", "Invoices"])
+    duplicates.add_argument("--output", help="Write the full report to this CSV file")
+    duplicates.add_argument("--limit", type=int, default=50, help="Rows printed when no output file is given")
+    duplicates.set_defaults(func=find_duplicates)
+
+    memory = subparsers.add_parser("memory-report", help="Memory per table in the compact in-memory model")
+    memory.add_argument("--columns", action="store_true", help="Also print the memory of each column")
+    memory.set_defaults(func=memory_report)
+
+    return parser
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+    status = args.func(args)
+    if args.metrics_dir:
+        from modules.instrumentation import dump
+        print(f"Metrics written to {', '.join(str(path) for path in dump(args.metrics_dir))}")
+    return status
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,181 @@
+"""
+Benchmark module for DemoERP
+Times the load, save, append and filter paths of each backend, and the in-memory conversions,
+on synthetic orders (demo_data.create_synthetic_orders), and the cold start of the app.
+Results are plain JSON so runs can be compared for regressions.
+"""
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional
+import pandas as pd
+
+from config import LIMITS
+from modules.dates import format_dates, parse_dates
+from modules.demo_data import create_synthetic_orders
+
+SIZES = [10_000, 100_000, 1_000_000]
+BACKENDS = ['csv', 'columnar', 'postgres']
+
+# Table written by the benchmarks: in a temporary directory, or in the scratch PostgreSQL database
+TABLE = 'pedidos_clientes'
+# Rows per appended batch
+APPEND_ROWS = 1000
+# Filter used by the query benchmarks (the 5th busiest sender of the synthetic data)
+FILTERS = {'Nombre_Emisor': 'Demo Company 005'}
+ORDER_BY = '-Fecha_Pedido'
+
+# Startup benchmarks: each snippet runs in a fresh interpreter and prints {operation: seconds} as JSON
+ROOT = Path(__file__).resolve().parent.parent
+STARTUP_SCRIPTS = [
+    # import of the data layer, then the shared TableManager of the selected backend
+    """
+import json, time
+started = time.perf_counter()
+import database
+imported = time.perf_counter()
+database.get_table_manager()
+print(json.dumps({'import_database': imported - started, 'table_manager': time.perf_counter() - started}))
+""",
+    # first render of the app (imports included), then a new session in the now warm process
+    """
+import json, sys, time
+from streamlit.testing.v1 import AppTest
+timings = {}
+for operation in ('first_session', 'new_session'):
+    started = time.perf_counter()
+    AppTest.from_file(sys.argv[1], default_timeout=120).run()
+    timings[operation] = time.perf_counter() - started
+print(json.dumps(timings))
+"""
+]
+
+def best_time(func: Callable[[], Any], repeat: int) -> float:
+    """Fastest of `repeat` runs in seconds (the run least disturbed by other load)"""
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - started)
+    return min(times)
+
+def make_backend(name: str, data_dir: str, pg_url: Optional[str] = None):
+    """Backend under test: file backends write to `data_dir`, PostgreSQL to the database at `pg_url`"""
+    from database import CSVBackend, ColumnarBackend
+    if name == 'csv':
+        return CSVBackend(data_dir)
+    if name == 'columnar':
+        return ColumnarBackend(data_dir)
+    if name == 'postgres':
+        if not pg_url:
+            raise ValueError("PostgreSQL benchmarks need the URL of a scratch database (its tables are overwritten)")
+        from modules.pg_backend import PgBackend
+        return PgBackend(pg_url)
+    raise ValueError(f"Unknown backend: {name}")
+
+def bench_memory(df: pd.DataFrame, repeat: int) -> Iterable[tuple]:
+    """(operation, seconds, rows) of the in-memory paths: load-time conversion, dates, cached filter/sort"""
+    from database import query_dataframe, to_table_model
+    limit = LIMITS['max_records_display']
+    table = to_table_model(df.copy())
+    parsed = parse_dates(df['Fecha_Pedido'])
+    yield 'table_model', best_time(lambda: to_table_model(df.copy()), repeat), len(df)
+    yield 'parse_dates', best_time(lambda: parse_dates(df['Fecha_Pedido']), repeat), len(df)
+    yield 'format_dates', best_time(lambda: format_dates(parsed), repeat), len(df)
+    yield 'filter_cached', best_time(lambda: query_dataframe(table, FILTERS, None, 0, limit), repeat), len(df)
+    yield 'sort_cached', best_time(lambda: query_dataframe(table, None, ORDER_BY, 0, limit), repeat), len(df)
+
+def bench_backend(backend, df: pd.DataFrame, extra: pd.DataFrame, repeat: int) -> Iterable[tuple]:
+    """(operation, seconds, rows) of the backend paths, in the order save, load, filter, sort, append"""
+    limit = LIMITS['max_records_display']
+    yield 'save', best_time(lambda: backend.save_data(TABLE, df), repeat), len(df)
+    yield 'load', best_time(lambda: backend.load_data(TABLE), repeat), len(df)
+    yield 'filter', best_time(lambda: backend.query(TABLE, FILTERS, None, 0, limit), repeat), len(df)
+    yield 'sort', best_time(lambda: backend.query(TABLE, None, ORDER_BY, 0, limit), repeat), len(df)
+    # every run appends new order lines (a table with unique order lines rejects repeats)
+    batches = iter([extra.iloc[start:start + APPEND_ROWS] for start in range(0, len(extra), APPEND_ROWS)])
+    yield 'append', best_time(lambda: backend.append_records(TABLE, next(batches)), repeat), APPEND_ROWS
+
+def environment() -> Dict[str, Any]:
+    """Versions and machine details stored with the results (runs are only comparable on the same setup)"""
+    try:
+        import pyarrow
+        pyarrow_version = pyarrow.__version__
+    except ImportError:
+        pyarrow_version = None
+    return {'python': platform.python_version(), 'pandas': pd.__version__, 'pyarrow': pyarrow_version,
+            'platform': platform.platform(), 'cpus': os.cpu_count()}
+
+def run_benchmarks(sizes: Iterable[int] = SIZES, backends: Iterable[str] = BACKENDS, repeat: int = 3,
+                   pg_url: Optional[str] = None, progress: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+    """
+    Runs every benchmark at every table size and returns the JSON-ready results:
+    {'created', 'repeat', 'environment', 'results': [{'backend', 'rows', 'operation', 'seconds', 'rows_per_second'}]}.
+    In-memory paths are reported under the backend name 'memory'. `progress` is called with each result.
+    """
+    results = []
+
+    def record(backend_name, rows, operation, seconds, processed):
+        result = {'backend': backend_name, 'rows': rows, 'operation': operation, 'seconds': round(seconds, 6),
+                  'rows_per_second': round(processed / max(seconds, 1e-9))}
+        results.append(result)
+        if progress:
+            progress(result)
+
+    for rows in sizes:
+        df = create_synthetic_orders(rows)
+        # orders numbered after the table's own, so appended lines never repeat a saved one
+        extra = create_synthetic_orders(APPEND_ROWS * repeat, seed=1, first_order=100001 + rows)
+        for operation, seconds, processed in bench_memory(df, repeat):
+            record('memory', rows, operation, seconds, processed)
+        for name in backends:
+            with tempfile.TemporaryDirectory() as data_dir:
+                backend = make_backend(name, data_dir, pg_url)
+                for operation, seconds, processed in bench_backend(backend, df, extra, repeat):
+                    record(name, rows, operation, seconds, processed)
+    return {'created': datetime.now().isoformat(timespec='seconds'), 'repeat': repeat,
+            'environment': environment(), 'results': results}
+
+def run_startup_benchmarks(repeat: int = 5, progress: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+    """
+    Cold start of the app with the backend selected by the environment: STARTUP_SCRIPTS run `repeat`
+    times each in fresh interpreters (empty data directory) and the fastest time of each operation is kept.
+    Same JSON layout as run_benchmarks, under the backend name 'startup' (rows is 0).
+    """
+    best: Dict[str, float] = {}
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [str(ROOT), os.getenv('PYTHONPATH')])))
+    for script in STARTUP_SCRIPTS:
+        for _ in range(repeat):
+            with tempfile.TemporaryDirectory() as work_dir:
+                output = subprocess.run([sys.executable, '-c', script, str(ROOT / 'erp_demo.py')], cwd=work_dir, env=env,
+                                        capture_output=True, text=True, check=True).stdout
+            for operation, seconds in json.loads(output.strip().splitlines()[-1]).items():
+                best[operation] = min(seconds, best.get(operation, seconds))
+    results = []
+    for operation, seconds in best.items():
+        results.append({'backend': 'startup', 'rows': 0, 'operation': operation, 'seconds': round(seconds, 6)})
+        if progress:
+            progress(results[-1])
+    return {'created': datetime.now().isoformat(timespec='seconds'), 'repeat': repeat,
+            'environment': environment(), 'results': results}
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any], tolerance: float = 0.25) -> List[Dict[str, Any]]:
+    """
+    Benchmarks present in both runs, with the time ratio current / baseline, slowest first.
+    'regression' is True when a benchmark got slower by more than `tolerance` (0.25 = 25%).
+    """
+    def by_key(run):
+        return {(r['backend'], r['rows'], r['operation']): r['seconds'] for r in run['results']}
+    before, after = by_key(baseline), by_key(current)
+    rows = []
+    for key in before.keys() & after.keys():
+        ratio = after[key] / max(before[key], 1e-9)
+        rows.append({'backend': key[0], 'rows': key[1], 'operation': key[2], 'baseline': before[key],
+                     'current': after[key], 'ratio': round(ratio, 3), 'regression': ratio > 1 + tolerance})
+    return sorted(rows, key=lambda row: row['ratio'], reverse=True)
@@ -0,0 +1,69 @@
+"""
+Change-set module for DemoERP
+Turns table edits into minimal row-level updates, inserts and deletes.
+"""
+import pandas as pd
+from dataclasses import dataclass, field
+from typing import Any, Dict, List
+
+@dataclass
+class ChangeSet:
+    """
+    Row-level changes for one table.
+    Rows are identified by their key: the row position in CSV mode, or the `id` column in PostgreSQL.
+    `base_version` is the backend version of the table when those rows were read: backends refuse
+    the changes if the table was written since (None skips the check).
+    """
+    updates: Dict[Any, Dict[str, Any]] = field(default_factory=dict)
+    inserts: pd.DataFrame = field(default_factory=pd.DataFrame)
+    deletes: List[Any] = field(default_factory=list)
+    base_version: Any = None
+
+    def is_empty(self) -> bool:
+        """Returns True when there is nothing to persist"""
+        return not self.updates and self.inserts.empty and not self.deletes
+
+    def is_stale(self, current_version) -> bool:
+        """True if the table changed since the rows were read (the keys may point to other rows now)"""
+        return self.base_version is not None and current_version != self.base_version
+
+def changeset_from_editor_state(source: pd.DataFrame, editor_state: Dict[str, Any], base_version: Any = None) -> ChangeSet:
+    """
+    Builds a ChangeSet from the `st.data_editor` session state.
+    `source` is the DataFrame shown in the editor; its index holds the row keys.
+    The editor reports rows by display position, so they are mapped back to keys here.
+    `base_version` is the table version `source` was read at.
+    """
+    keys = list(source.index)
+    deletes = [keys[pos] for pos in editor_state.get('deleted_rows', [])]
+    deleted = set(deletes)
+    updates = {}
+    for pos, values in editor_state.get('edited_rows', {}).items():
+        key = keys[int(pos)]
+        if key in deleted:
+            continue
+        changed = {col: val for col, val in values.items() if col in source.columns and source.at[key, col] != val}
+        if changed:
+            updates[key] = changed
+    added = [row for row in editor_state.get('added_rows', []) if any(v not in (None, '') for v in row.values())]
+    inserts = pd.DataFrame(added, columns=[c for c in source.columns])
+    return ChangeSet(updates=updates, inserts=inserts, deletes=deletes, base_version=base_version)
+
+def diff_frames(before: pd.DataFrame, after: pd.DataFrame) -> ChangeSet:
+    """
+    Builds a ChangeSet by comparing two DataFrames keyed on their index.
+    Rows missing from `after` are deleted, new index values are inserted and
+    only the cells that differ are reported as updates.
+    """
+    deletes = [key for key in before.index if key not in after.index]
+    inserts = after.loc[~after.index.isin(before.index)]
+    common = after.index[after.index.isin(before.index)]
+    columns = [c for c in after.columns if c in before.columns]
+    old = before.loc[common, columns].astype(str)
+    new = after.loc[common, columns].astype(str)
+    changed_mask = old.ne(new)
+    updates = {}
+    for key in changed_mask.index[changed_mask.any(axis=1)]:
+        cols = changed_mask.columns[changed_mask.loc[key]]
+        updates[key] = {col: after.at[key, col] for col in cols}
+    return ChangeSet(updates=updates, inserts=inserts.reset_index(drop=True), deletes=deletes)
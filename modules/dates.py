@@ -0,0 +1,74 @@
+"""
+Date normalization module for DemoERP
+Shared, vectorized parsing and formatting of the date columns.
+Dates are kept as datetime64 columns internally and formatted as DD/MM/YYYY only at the UI/file edge.
+"""
+import numpy as np
+import pandas as pd
+from typing import Iterable
+
+DATE_COLUMNS = ['Fecha_Pedido', 'Fecha_Entrega']
+DISPLAY_FORMAT = '%d/%m/%Y'
+ISO_FORMAT = '%Y-%m-%d'
+
+def _parse_uniques(uniques: pd.Series, formats: Iterable[str], fallback: bool) -> pd.Series:
+    """Parses distinct values with each pinned format in turn; leftovers use dayfirst inference if allowed"""
+    parsed = pd.Series(pd.NaT, index=uniques.index, dtype='datetime64[ns]')
+    text = uniques.astype(str).str.strip()
+    pending = text != ''
+    for fmt in formats:
+        if not pending.any():
+            break
+        attempt = pd.to_datetime(text[pending], format=fmt, errors='coerce')
+        parsed[attempt.index] = attempt
+        pending &= parsed.isna()
+    if fallback and pending.any():
+        parsed[pending] = pd.to_datetime(text[pending], errors='coerce', dayfirst=True, format='mixed')
+    return parsed
+
+def parse_dates(values, formats: Iterable[str] = (DISPLAY_FORMAT, ISO_FORMAT), fallback: bool = True) -> pd.Series:
+    """
+    Parses a column of dates into datetime64[ns] (NaT for empty/invalid values).
+    datetime64 input is returned as-is. Text is parsed once per distinct value (dates repeat a lot),
+    trying the pinned formats first (DD/MM/YYYY, then ISO) and dayfirst inference only for the rest.
+    """
+    values = pd.Series(values) if not isinstance(values, pd.Series) else values
+    if pd.api.types.is_datetime64_any_dtype(values.dtype):
+        return values.astype('datetime64[ns]')
+    codes, uniques = pd.factorize(values)
+    if len(uniques) == 0:
+        return pd.Series(pd.NaT, index=values.index, dtype='datetime64[ns]')
+    uniques = pd.Series(uniques, dtype=object)
+    is_text = uniques.map(lambda value: isinstance(value, str)).astype(bool)
+    parsed = pd.Series(pd.NaT, index=uniques.index, dtype='datetime64[ns]')
+    if is_text.any():
+        parsed[is_text] = _parse_uniques(uniques[is_text], formats, fallback)
+    if not is_text.all():
+        # date/datetime objects (e.g. from a database driver, or edited rows concatenated to a typed table)
+        parsed[~is_text] = pd.to_datetime(uniques[~is_text], errors='coerce')
+    result = parsed.to_numpy(dtype='datetime64[ns]').take(codes)
+    result[codes < 0] = np.datetime64('NaT')
+    return pd.Series(result, index=values.index, name=values.name)
+
+def format_dates(values, fmt: str = DISPLAY_FORMAT) -> pd.Series:
+    """Formats a date column as text (empty string for missing dates), once per distinct date"""
+    dates = parse_dates(values)
+    codes, uniques = pd.factorize(dates)
+    formatted = pd.Index(uniques).strftime(fmt).to_numpy(dtype=object)
+    result = formatted.take(codes) if len(formatted) else np.full(len(codes), '', dtype=object)
+    result[codes < 0] = ''
+    return pd.Series(result, index=dates.index, name=dates.name, dtype=object)
+
+def normalize_date_columns(df: pd.DataFrame, columns: Iterable[str] = DATE_COLUMNS) -> pd.DataFrame:
+    """Converts the date columns of a DataFrame to datetime64 in place"""
+    for col in columns:
+        if col in df.columns:
+            df[col] = parse_dates(df[col])
+    return df
+
+def format_date_columns(df: pd.DataFrame, columns: Iterable[str] = DATE_COLUMNS, fmt: str = DISPLAY_FORMAT) -> pd.DataFrame:
+    """Formats the date columns of a DataFrame as DD/MM/YYYY text in place"""
+    for col in columns:
+        if col in df.columns:
+            df[col] = format_dates(df[col], fmt)
+    return df
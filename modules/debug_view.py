@@ -0,0 +1,61 @@
+"""
+Debug view module for DemoERP
+Sidebar panel with the timings and counters of the last rerun, the process-wide percentiles and
+optional cProfile/tracemalloc captures (see modules.instrumentation).
+"""
+import json
+import os
+import pandas as pd
+import streamlit as st
+from config import INSTRUMENTATION_CONFIG
+from modules.instrumentation import Trace, dump, metrics
+
+def debug_enabled() -> bool:
+    """True with ERP_DEBUG=1, INSTRUMENTATION_CONFIG['debug_panel'] or the ?debug=1 query parameter"""
+    if os.getenv('ERP_DEBUG', '').lower() in ('1', 'true', 'yes') or INSTRUMENTATION_CONFIG['debug_panel']:
+        return True
+    return st.query_params.get('debug', '') in ('1', 'true', 'yes')
+
+def capture_options() -> dict:
+    """Captures requested in the panel for the next rerun: {'profile': bool, 'memory': bool}"""
+    return {'profile': st.session_state.get('debug_profile', False),
+            'memory': st.session_state.get('debug_memory', False)}
+
+def show_debug_panel(rerun: Trace):
+    """
+    Render the debug panel for a finished rerun.
+    The profile/memory checkboxes apply from the next rerun on, which they trigger themselves.
+    """
+    st.markdown("---")
+    st.markdown("### 🐞 Debug")
+    st.caption(f"Last rerun: {rerun.seconds * 1000:.1f} ms")
+    if rerun.spans:
+        spans = pd.DataFrame(rerun.spans)
+        spans['Span'] = ['· ' * depth + name for depth, name in zip(spans['depth'], spans['name'])]
+        spans['ms'] = (spans['seconds'] * 1000).round(2)
+        with st.expander("⏱️ Spans (this rerun)", expanded=True):
+            st.dataframe(spans[['Span', 'ms']], use_container_width=True, hide_index=True)
+    if rerun.counters:
+        with st.expander("🔢 Counters (this rerun)"):
+            st.dataframe(pd.DataFrame(sorted(rerun.counters.items()), columns=['Counter', 'Value']),
+                         use_container_width=True, hide_index=True)
+    snapshot = metrics.snapshot()
+    with st.expander("📊 Process (all sessions)"):
+        if snapshot['spans']:
+            process = pd.DataFrame.from_dict(snapshot['spans'], orient='index').rename_axis('Span').reset_index()
+            process[['p50_ms', 'p95_ms']] = (process[['p50_seconds', 'p95_seconds']] * 1000).round(2)
+            st.dataframe(process[['Span', 'count', 'p50_ms', 'p95_ms']], use_container_width=True, hide_index=True)
+        st.caption(f"Since {snapshot['started']}")
+    st.checkbox("Profile next rerun (cProfile)", key="debug_profile")
+    st.checkbox("Trace memory next rerun (tracemalloc)", key="debug_memory")
+    if rerun.profile:
+        with st.expander("🧮 Profile (this rerun)"):
+            st.code(rerun.profile, language=None)
+    if rerun.memory:
+        with st.expander(f"🧠 Memory (peak {rerun.memory['peak_bytes'] / 1024 ** 2:.1f} MB)"):
+            st.dataframe(pd.DataFrame(rerun.memory['top']), use_container_width=True, hide_index=True)
+    st.download_button("⬇️ metrics.json", json.dumps(snapshot, indent=2), file_name="metrics.json", mime="application/json")
+    st.download_button("⬇️ metrics.prom", metrics.to_prometheus(), file_name="metrics.prom", mime="text/plain")
+    if st.button("💾 Write metrics dump"):
+        paths = dump()
+        st.success(f"Written: {', '.join(str(path) for path in paths)}")
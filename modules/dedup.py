@@ -0,0 +1,177 @@
+"""
+Duplicate detection module for DemoERP
+An order line (sender code, order number, EAN code) may only be saved once per orders table.
+Each table gets an in-memory set of its line keys, built on first use and maintained on every
+write, so checking new records is one hash lookup per record instead of a table scan.
+"""
+import math
+import numpy as np
+import pandas as pd
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Union
+
+from config import DEDUP_CONFIG
+from modules.derived_store import DerivedStore
+from modules.reconciliation import KEY_COLUMNS
+
+# Error reported for records whose order line is already saved (or repeated within a batch)
+DUPLICATE_MESSAGE = "Order line already saved (sender code, order number, EAN code)"
+
+# Multiplier mixing the hashes of the key columns into one 64-bit key
+_MIX = np.uint64(0x100000001B3)
+
+def is_unique_table(subsection: str) -> bool:
+    """True for the subsections whose order lines must be unique (DEDUP_CONFIG['subsections'])"""
+    return subsection in DEDUP_CONFIG['subsections']
+
+def _column_hashes(values: pd.Series) -> np.ndarray:
+    """64-bit hash of each trimmed text value ('' for missing ones), hashing each distinct value once"""
+    codes, uniques = pd.factorize(values)
+    text = pd.Series(uniques, dtype=object).astype(str).str.strip().to_numpy(dtype=object)
+    # missing values get code -1, i.e. the hash of '' appended last
+    return pd.util.hash_array(np.append(text, ''), categorize=False)[codes]
+
+def key_hashes(frame: pd.DataFrame) -> np.ndarray:
+    """One 64-bit key per row from its KEY_COLUMNS (missing columns count as empty)"""
+    hashes = np.zeros(len(frame), dtype='uint64')
+    for col in KEY_COLUMNS:
+        values = frame[col] if col in frame.columns else pd.Series('', index=frame.index, dtype=object)
+        hashes = hashes * _MIX ^ _column_hashes(values)
+    return hashes
+
+class KeyCounts:
+    """Exact set of line keys, counting copies so removing one of two duplicates keeps the key"""
+    exact = True
+
+    def __init__(self, hashes: np.ndarray):
+        keys, counts = np.unique(hashes, return_counts=True)
+        self._counts: Dict[int, int] = dict(zip(keys.tolist(), counts.tolist()))
+
+    def __len__(self) -> int:
+        return len(self._counts)
+
+    def contains(self, hashes: np.ndarray) -> np.ndarray:
+        counts = self._counts
+        return np.fromiter((key in counts for key in hashes.tolist()), dtype=bool, count=len(hashes))
+
+    def add(self, hashes: np.ndarray):
+        counts = self._counts
+        for key in hashes.tolist():
+            counts[key] = counts.get(key, 0) + 1
+
+    def remove(self, hashes: np.ndarray):
+        counts = self._counts
+        for key in hashes.tolist():
+            left = counts.get(key, 0) - 1
+            if left > 0:
+                counts[key] = left
+            else:
+                counts.pop(key, None)
+
+    def saturated(self) -> bool:
+        return False
+
+class BloomFilter:
+    """
+    Bit array answering 'maybe present' or 'certainly absent' in about 1.8 bytes per key (at 0.1%
+    false positives). Bits cannot be cleared, so removed keys may still test positive:
+    positives are confirmed against the table by the caller.
+    """
+    exact = False
+    # Positions are set in batches of this many keys (bounds the k x batch position matrix)
+    batch_size = 1_000_000
+
+    def __init__(self, capacity: int, false_positive_rate: float):
+        self.capacity = max(int(capacity), 1)
+        self.size = max(int(math.ceil(-self.capacity * math.log(false_positive_rate) / math.log(2) ** 2)), 8)
+        self.hash_count = max(int(round(self.size / self.capacity * math.log(2))), 1)
+        self.count = 0
+        self._bits = np.zeros((self.size + 7) // 8, dtype='uint8')
+
+    def _positions(self, hashes: np.ndarray) -> np.ndarray:
+        # double hashing: k positions from the two 32-bit halves of each key
+        first = hashes & np.uint64(0xFFFFFFFF)
+        step = (hashes >> np.uint64(32)) | np.uint64(1)
+        rounds = np.arange(self.hash_count, dtype='uint64')
+        return (first[:, None] + rounds[None, :] * step[:, None]) % np.uint64(self.size)
+
+    def contains(self, hashes: np.ndarray) -> np.ndarray:
+        positions = self._positions(hashes)
+        return ((self._bits[positions >> np.uint64(3)] >> (positions & np.uint64(7)).astype('uint8')) & 1).all(axis=1)
+
+    def add(self, hashes: np.ndarray):
+        for start in range(0, len(hashes), self.batch_size):
+            positions = self._positions(hashes[start:start + self.batch_size]).ravel()
+            np.bitwise_or.at(self._bits, positions >> np.uint64(3), (1 << (positions & np.uint64(7))).astype('uint8'))
+        self.count += len(hashes)
+
+    def remove(self, hashes: np.ndarray):
+        """Bits are shared between keys and cannot be cleared"""
+
+    def saturated(self) -> bool:
+        # past its capacity the false positive rate climbs: rebuild from the table
+        return self.count > self.capacity
+
+def build_keys(hashes: np.ndarray) -> Union[KeyCounts, BloomFilter]:
+    """Exact key set, or a Bloom filter (sized for twice the rows) for tables above the configured threshold"""
+    if len(hashes) < DEDUP_CONFIG['bloom_threshold']:
+        return KeyCounts(hashes)
+    keys = BloomFilter(2 * len(hashes), DEDUP_CONFIG['false_positive_rate'])
+    keys.add(hashes)
+    return keys
+
+def find_duplicates(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Rows sharing their order line with another row, each line's rows together (in order of first
+    appearance) with a 'Copies' column. The index is kept (row positions, or ids with PostgreSQL).
+    """
+    codes, _ = pd.factorize(key_hashes(df))
+    copies = np.bincount(codes, minlength=1)[codes] if len(df) else np.zeros(0, dtype='int64')
+    repeated = copies > 1
+    order = np.argsort(codes[repeated], kind='stable')
+    report = df[repeated].iloc[order].copy()
+    report['Copies'] = copies[repeated][order]
+    return report
+
+@dataclass
+class TableKeys:
+    """Line keys of one table and the table version they reflect"""
+    version: Any
+    keys: Union[KeyCounts, BloomFilter]
+
+class DedupStore(DerivedStore):
+    """
+    Line key sets shared by all sessions of the process, one per orders table (see DerivedStore).
+    A table is hashed on first use; afterwards appends and record edits add/remove only the keys
+    of the written rows, and a full save rehashes the frame it saved.
+    """
+
+    def _build(self, version, dataframe: pd.DataFrame) -> TableKeys:
+        return TableKeys(version, build_keys(key_hashes(dataframe)))
+
+    def _delta(self, added: Optional[pd.DataFrame], removed: Optional[pd.DataFrame]):
+        return tuple(key_hashes(rows) if rows is not None and not rows.empty else None for rows in (added, removed))
+
+    def _update(self, entry: TableKeys, delta) -> bool:
+        added_hashes, removed_hashes = delta
+        if removed_hashes is not None:
+            entry.keys.remove(removed_hashes)
+        if added_hashes is not None:
+            entry.keys.add(added_hashes)
+        return not entry.keys.saturated()
+
+    def duplicate_mask(self, table_manager, section: str, subsection: str, records: pd.DataFrame) -> np.ndarray:
+        """True for records whose order line is already in the table or repeats an earlier record of the batch"""
+        hashes = key_hashes(records)
+        repeated = pd.Series(hashes).duplicated().to_numpy()
+        entry = self._current(table_manager, section, subsection)
+        with self._lock:
+            existing = entry.keys.contains(hashes)
+        if not entry.keys.exact and existing.any():
+            # Bloom filter positives: confirm against the table itself
+            saved = key_hashes(table_manager.get_dataframe(section, subsection))
+            existing[existing] = np.isin(hashes[existing], saved)
+        return repeated | existing
+
+# Shared by every TableManager in the process
+dedup_store = DedupStore()
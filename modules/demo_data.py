@@ -2,7 +2,9 @@
 Demo data module for DemoERP
 Provides sample data for demo/testing purposes.
 """
+import numpy as np
 import pandas as pd
+from modules.dates import format_dates
 
 def create_demo_data():
     """
@@ -68,4 +70,58 @@ def create_demo_data():
         if 'Fecha_Entrega' in d and '-' in d['Fecha_Entrega']:
             y, m, d_ = d['Fecha_Entrega'].split('-')
             d['Fecha_Entrega'] = f"{d_}/{m}/{y}"
-    return pd.DataFrame(demo_data) 
\ No newline at end of file
+    return pd.DataFrame(demo_data) 
+
+# Attribute values of the synthetic products
+PRODUCT_TYPES = ['Roll', 'Sheet', 'Box']
+CLICHE_TYPES = ['Standard', 'Custom', 'Premium']
+PAPERS = ['Kraft', 'White', 'Recycled', 'Couche']
+QUANTITIES = [100, 250, 500, 750, 1000, 2000, 5000]
+
+def _skewed_choice(rng, count: int, size: int, skew: float) -> np.ndarray:
+    """Indexes in [0, count) where index k has weight 1 / (k + 1) ** skew (skew 0 is uniform)"""
+    weights = 1.0 / np.arange(1, count + 1) ** skew
+    return rng.choice(count, size=size, p=weights / weights.sum())
+
+def create_synthetic_orders(rows: int, seed: int = 0, skew: float = 1.1, senders: int = 200,
+                            products: int = 5000, first_order: int = 100001) -> pd.DataFrame:
+    """
+    Returns `rows` order lines in the form layout (DD/MM/YYYY dates), for benchmarks and load tests.
+    Orders have 1-5 lines; senders and products are drawn with a Zipf-like `skew`, so a few customers
+    and articles account for most lines. Order numbers start at `first_order` and each
+    (sender code, order number, EAN code) line is unique.
+    """
+    rng = np.random.default_rng(seed)
+    lines_per_order = rng.integers(1, 6, size=rows)
+    order_of_line = np.repeat(np.arange(rows), lines_per_order)[:rows]
+    order_count = int(order_of_line[-1]) + 1 if rows else 0
+    line_number = np.arange(rows) - np.searchsorted(order_of_line, order_of_line)
+    sender = _skewed_choice(rng, senders, order_count, skew)[order_of_line]
+    # the lines of an order are consecutive products, so they never repeat an EAN code
+    product = (_skewed_choice(rng, products, order_count, skew)[order_of_line] + line_number) % products
+    ordered = pd.Series(pd.Timestamp('2024-01-01') + pd.to_timedelta(rng.integers(0, 730, order_count), unit='D'))
+    order_dates = format_dates(ordered).to_numpy()[order_of_line]
+    delivered = ordered.to_numpy()[order_of_line] + rng.integers(1, 15, rows).astype('timedelta64[D]')
+    delivery_dates = format_dates(pd.Series(delivered)).to_numpy(copy=True)
+    delivery_dates[rng.random(rows) < 0.1] = ''  # not delivered yet
+    sender_names = np.array([f"Demo Company {k + 1:03d}" for k in range(senders)], dtype=object)
+    sender_codes = np.array([f"{8400000000000 + 7919 * k:013d}" for k in range(senders)], dtype=object)
+    product_types = np.array(PRODUCT_TYPES, dtype=object)[np.arange(products) % len(PRODUCT_TYPES)]
+    papers = np.array(PAPERS, dtype=object)[np.arange(products) // len(PRODUCT_TYPES) % len(PAPERS)]
+    order_numbers = np.array([str(first_order + k) for k in range(order_count)], dtype=object)
+    return pd.DataFrame({
+        'Num_Pedido': order_numbers[order_of_line],
+        'Nombre_Emisor': sender_names[sender],
+        'Cod_Emisor': sender_codes[sender],
+        'Fecha_Pedido': order_dates,
+        'Fecha_Entrega': delivery_dates,
+        'Cod_Art_EAN': np.array([f"{1000000000000 + k:013d}" for k in range(products)], dtype=object)[product],
+        'Cod_Art_Comprador': np.array([f"{chr(65 + k % 26)}-{k:05d}" for k in range(products)], dtype=object)[product],
+        'Descripcion': np.array([f"{t} labels, {p} paper, ref {k:05d}" for k, (t, p) in enumerate(zip(product_types, papers))], dtype=object)[product],
+        'Cantidad': np.array(QUANTITIES)[_skewed_choice(rng, len(QUANTITIES), rows, 0.5)],
+        'Tipo': product_types[product],
+        'Tipo_Cliche': np.array(CLICHE_TYPES, dtype=object)[rng.integers(0, len(CLICHE_TYPES), rows)],
+        'Papel': papers[product],
+        'Cod_IPG': np.array([f"IPG{k:05d}" for k in range(products)], dtype=object)[product],
+        'PDF_Link': np.char.add(np.char.add('https://demoerp.com/orders/', order_numbers.astype(str)), '.pdf').astype(object)[order_of_line]
+    })
@@ -0,0 +1,93 @@
+"""
+Derived store module for DemoERP
+Base class of the in-memory structures derived from a table (KPI rollups, order line keys,
+search indexes): one entry per table, tagged with the table version it reflects, kept up to date
+from the rows of every write instead of being rebuilt from the whole table.
+"""
+import threading
+import pandas as pd
+from typing import Any, Dict, Optional, Tuple
+
+class DerivedStore:
+    """
+    Per-table entries shared by all sessions of the process. An entry (any object with a `version`
+    attribute) is built from the table on first use; afterwards a write moving the table from the
+    version it reflects updates it with the written rows only, and a full save rebuilds it from the
+    frame it saved. Entries reflecting another version (e.g. after a write from another process)
+    are rebuilt on next use.
+
+    Subclasses implement `_build` and `_update`, and may prepare the written rows outside the lock in `_delta`.
+    """
+
+    def __init__(self):
+        self._entries: Dict[Tuple, Any] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(backend, table_name: str) -> Tuple:
+        return (type(backend).__name__, str(getattr(backend, 'data_dir', '')), table_name)
+
+    def _build(self, version, dataframe: pd.DataFrame):
+        """New entry for a table frame at `version`"""
+        raise NotImplementedError
+
+    def _delta(self, added: Optional[pd.DataFrame], removed: Optional[pd.DataFrame]):
+        """What `_update` applies for a write's rows (computed before taking the lock)"""
+        return added, removed
+
+    def _update(self, entry, delta) -> bool:
+        """Applies a write's delta to an entry, under the lock. False drops the entry instead."""
+        raise NotImplementedError
+
+    def _current(self, table_manager, section: str, subsection: str,
+                 table: Optional[Tuple[Any, pd.DataFrame]] = None):
+        """
+        Entry of a section/subsection at the table's current version, built if missing or stale.
+        With `table` (version, frame), the entry is the one of that version, built from that frame.
+        """
+        table_name = f"{subsection}_{section}".lower()
+        key = self._key(table_manager.backend, table_name)
+        version, df = table if table is not None else (table_manager.get_version(section, subsection), None)
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None or entry.version != version:
+            entry = self._build(version, df if df is not None else table_manager.get_dataframe(section, subsection))
+            with self._lock:
+                self._entries[key] = entry
+        return entry
+
+    def is_current(self, backend, table_name: str, version) -> bool:
+        """True if the table has an entry reflecting `version` (i.e. a write can be applied as a delta)"""
+        with self._lock:
+            entry = self._entries.get(self._key(backend, table_name))
+        return entry is not None and entry.version == version
+
+    def apply(self, backend, table_name: str, before, after,
+              added: Optional[pd.DataFrame] = None, removed: Optional[pd.DataFrame] = None):
+        """Applies a committed write (rows added/removed) moving the table from version `before` to `after`"""
+        if not self.is_current(backend, table_name, before):
+            self.invalidate(backend, table_name)
+            return
+        delta = self._delta(added, removed)
+        key = self._key(backend, table_name)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.version != before or not self._update(entry, delta):
+                self._entries.pop(key, None)
+                return
+            entry.version = after
+
+    def replace(self, backend, table_name: str, after, dataframe: pd.DataFrame):
+        """Rebuilds a table's entry from the frame just saved in full (only if the entry is in use)"""
+        key = self._key(backend, table_name)
+        with self._lock:
+            if key not in self._entries:
+                return
+        entry = self._build(after, dataframe)
+        with self._lock:
+            self._entries[key] = entry
+
+    def invalidate(self, backend, table_name: str):
+        """Drops the entry of a table; it is rebuilt on next use"""
+        with self._lock:
+            self._entries.pop(self._key(backend, table_name), None)
@@ -0,0 +1,407 @@
+"""
+Export module for DemoERP
+Streams a table chunk by chunk (TableManager.iter_chunks) to CSV, XLSX or paginated PDF order
+sheets, so memory stays bounded by a few chunks whatever the table size. CSV chunks and PDF pages
+are rendered in a process pool and written in order; XLSX rows go through xlsxwriter's
+constant-memory mode, which writes one sheet sequentially from the calling process.
+"""
+import importlib.util
+import itertools
+import os
+import tempfile
+import zlib
+from collections import deque
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from config import APP_INFO, EXPORT_CONFIG
+from database import COLUMN_SCHEMA, to_display_frame
+from modules.dates import DATE_COLUMNS
+from modules.instrumentation import count, timed
+from modules.write_coordinator import atomic_write
+
+# Output formats: (file extension, MIME type)
+EXPORT_FORMATS = {
+    'csv': ('.csv', 'text/csv'),
+    'xlsx': ('.xlsx', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+    'pdf': ('.pdf', 'application/pdf')
+}
+
+# Column headers of the XLSX export (as in the table view); CSV keeps the column names so it can be imported back
+COLUMN_LABELS = {
+    'Num_Pedido': 'Order Number',
+    'Nombre_Emisor': 'Sender Name',
+    'Cod_Emisor': 'Sender Code',
+    'Fecha_Pedido': 'Order Date',
+    'Fecha_Entrega': 'Delivery Date',
+    'Cod_Art_EAN': 'EAN Code',
+    'Cod_Art_Comprador': 'Buyer Code',
+    'Descripcion': 'Description',
+    'Cantidad': 'Quantity',
+    'Tipo': 'Product Type',
+    'Tipo_Cliche': 'Cliché Type',
+    'Papel': 'Paper',
+    'Cod_IPG': 'Internal Code',
+    'PDF_Link': 'PDF Link'
+}
+
+# Rows per worksheet (Excel's limit, the header row included); longer exports continue on a new sheet
+XLSX_MAX_ROWS = 1_048_576
+
+# PDF order sheets: A4 landscape in points, Courier text so the line columns align
+PAGE_WIDTH, PAGE_HEIGHT = 842, 595
+MARGIN = 36
+FONT_SIZE = 8
+LEADING = 10
+CHAR_WIDTH = FONT_SIZE * 0.6
+# Text lines below the page title and the column headers
+LINES_PER_PAGE = (PAGE_HEIGHT - 2 * MARGIN - 40) // LEADING
+
+# Order line columns of the PDF sheets: (column, header, width in characters, right-aligned)
+PDF_LINE_COLUMNS = [
+    ('Cod_Art_EAN', 'EAN Code', 15, False),
+    ('Cod_Art_Comprador', 'Buyer Code', 15, False),
+    ('Descripcion', 'Description', 44, False),
+    ('Cantidad', 'Quantity', 9, True),
+    ('Tipo', 'Product Type', 16, False),
+    ('Tipo_Cliche', 'Cliché Type', 14, False),
+    ('Papel', 'Paper', 14, False),
+    ('Cod_IPG', 'Internal Code', 13, False)
+]
+
+def available_formats() -> List[str]:
+    """Export formats whose optional dependencies are installed (XLSX needs xlsxwriter)"""
+    return [fmt for fmt in EXPORT_FORMATS if fmt != 'xlsx' or importlib.util.find_spec('xlsxwriter')]
+
+def export_file_name(section: str, subsection: str, fmt: str) -> str:
+    """Default file name of an export, e.g. orders_customers_2024-05-01.xlsx"""
+    table_name = f"{subsection}_{section}".lower().replace(' ', '_')
+    return f"{table_name}_{datetime.now():%Y-%m-%d}{EXPORT_FORMATS[fmt][0]}"
+
+def _worker_count(workers: Optional[int]) -> int:
+    cpus = getattr(os, 'process_cpu_count', os.cpu_count)()  # CPUs usable by this process (Python 3.13+)
+    return max(1, workers or EXPORT_CONFIG['workers'] or cpus or 1)
+
+def render_in_order(render: Callable, jobs: Iterable, workers: int) -> Iterator:
+    """
+    Yields render(job) for each job, in order. With more than one worker and more than one job,
+    the jobs run in a process pool with at most two jobs per worker in flight, so only a few
+    chunks are held in memory while the rest of the table is still being read.
+    """
+    jobs = iter(jobs)
+    started = list(itertools.islice(jobs, 2))
+    if workers <= 1 or len(started) < 2:
+        for job in started:
+            yield render(job)
+        for job in jobs:
+            yield render(job)
+        return
+    # imported here: the app imports this module at startup but only large exports start a pool
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+    # spawn: the calling process may be running threads (Streamlit, the table loaders)
+    pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+    try:
+        pending = deque(pool.submit(render, job) for job in started)
+        for job in jobs:
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+            pending.append(pool.submit(render, job))
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+def _display(chunk: pd.DataFrame) -> pd.DataFrame:
+    """Schema columns of a chunk as display values (DD/MM/YYYY dates, '' for missing text)"""
+    return to_display_frame(chunk.reindex(columns=list(COLUMN_SCHEMA.values())))
+
+def _render_csv(job: Tuple[pd.DataFrame, bool]) -> Tuple[int, bytes]:
+    """CSV text of a chunk (with the header row for the first one), in the CSVBackend layout"""
+    chunk, header = job
+    return len(chunk), _display(chunk).to_csv(index=False, header=header, lineterminator='\n').encode('utf-8')
+
+def _write_csv(handle, chunks: Iterator[pd.DataFrame], workers: int, progress: Optional[Callable]) -> int:
+    rows = 0
+    jobs = ((chunk, index == 0) for index, chunk in enumerate(chunks))
+    for chunk_rows, data in render_in_order(_render_csv, jobs, workers):
+        handle.write(data)
+        rows += chunk_rows
+        if progress:
+            progress(rows)
+    if not rows:
+        handle.write((','.join(COLUMN_SCHEMA.values()) + '\n').encode('utf-8'))
+    return rows
+
+# Excel stores dates as days since this epoch
+EXCEL_EPOCH = pd.Timestamp('1899-12-30')
+
+def _xlsx_columns(chunk: pd.DataFrame) -> List[list]:
+    """Cell values of a chunk per column: Excel day numbers for dates (NaN if missing), ints and plain text"""
+    frame = _display(chunk)
+    columns = []
+    for col in COLUMN_SCHEMA.values():
+        if col in DATE_COLUMNS and col in chunk.columns:
+            columns.append(((pd.to_datetime(chunk[col]) - EXCEL_EPOCH) / pd.Timedelta(days=1)).tolist())
+        else:
+            columns.append(frame[col].tolist())
+    return columns
+
+def _write_xlsx(handle, chunks: Iterator[pd.DataFrame], title: str, progress: Optional[Callable]) -> int:
+    """
+    Writes the chunks to a workbook in constant-memory mode: each row is flushed to the sheet's
+    temporary file as soon as it is written, so only the current chunk is held in memory.
+    Cells are written with the typed writers (no per-cell type detection).
+    """
+    import xlsxwriter
+    workbook = xlsxwriter.Workbook(handle, {'constant_memory': True, 'strings_to_formulas': False, 'strings_to_urls': False})
+    header_format = workbook.add_format({'bold': True, 'bg_color': '#00356B', 'font_color': '#ffffff'})
+    date_format = workbook.add_format({'num_format': 'dd/mm/yyyy'})
+    labels = [COLUMN_LABELS[col] for col in COLUMN_SCHEMA.values()]
+    kinds = ['date' if col in DATE_COLUMNS else 'number' if col == 'Cantidad' else 'text' for col in COLUMN_SCHEMA.values()]
+    worksheet, row, rows = None, XLSX_MAX_ROWS, 0
+
+    def add_sheet():
+        sheet = workbook.add_worksheet(title[:31] if not workbook.worksheets() else f"{title[:25]} ({len(workbook.worksheets()) + 1})")
+        sheet.write_row(0, 0, labels, header_format)
+        sheet.freeze_panes(1, 0)
+        for position, label in enumerate(labels):
+            sheet.set_column(position, position, 30 if label in ('Sender Name', 'Description') else 14)
+        return sheet
+
+    for chunk in chunks:
+        for values in zip(*_xlsx_columns(chunk)):
+            if row >= XLSX_MAX_ROWS:
+                worksheet, row = add_sheet(), 1
+                write_string, write_number = worksheet.write_string, worksheet.write_number
+            for position, value in enumerate(values):
+                kind = kinds[position]
+                if kind == 'text':
+                    if value:
+                        write_string(row, position, value)
+                elif kind == 'number':
+                    write_number(row, position, value)
+                elif value == value:  # NaN for a missing date
+                    write_number(row, position, value, date_format)
+            row += 1
+        rows += len(chunk)
+        if progress:
+            progress(rows)
+    if worksheet is None:
+        add_sheet()
+    workbook.close()
+    return rows
+
+def _order_keys(df: pd.DataFrame) -> np.ndarray:
+    """Order of each row: rows of one order share the sender code and order number"""
+    return (df['Cod_Emisor'].astype(str) + '\x1f' + df['Num_Pedido'].astype(str)).to_numpy()
+
+def _order_chunks(chunks: Iterator[pd.DataFrame]) -> Iterator[pd.DataFrame]:
+    """Re-cuts the chunks at order boundaries, so the lines of an order are rendered on one sheet"""
+    carry = None
+    for chunk in chunks:
+        if not len(chunk):
+            continue
+        if carry is not None:
+            chunk = pd.concat([carry, chunk])
+        keys = _order_keys(chunk)
+        others = np.flatnonzero(keys != keys[-1])
+        if len(others) == 0:
+            carry = chunk
+            continue
+        cut = others[-1] + 1
+        carry = chunk.iloc[cut:]
+        yield chunk.iloc[:cut]
+    if carry is not None and len(carry):
+        yield carry
+
+def _pdf_text(value: str) -> str:
+    """Escapes a string for a PDF literal"""
+    return value.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)').replace('\r', ' ').replace('\n', ' ')
+
+def _fit(value, width: int, right: bool = False) -> str:
+    text = str(value)
+    if len(text) > width:
+        text = text[:width - 1] + '…'
+    return text.rjust(width) if right else text.ljust(width)
+
+def _line_header() -> str:
+    return '  '.join(_fit(header, width, right) for _, header, width, right in PDF_LINE_COLUMNS).rstrip()
+
+def _page_stream(title: str, lines: List[Tuple[str, str]]) -> bytes:
+    """Content stream of one sheet: the title, the column headers and (font, text) lines"""
+    top = PAGE_HEIGHT - MARGIN
+    rule = top - 26
+    parts = [f"BT /F3 11 Tf {MARGIN} {top - 11} Td ({_pdf_text(title)}) Tj ET",
+             f"BT /F2 {FONT_SIZE} Tf {MARGIN} {rule + 4} Td ({_pdf_text(_line_header())}) Tj ET",
+             f"0.5 w {MARGIN} {rule} m {PAGE_WIDTH - MARGIN} {rule} l S",
+             f"BT {LEADING} TL {MARGIN} {rule - 14} Td"]
+    for font, text in lines:
+        parts.append(f"/{font} {FONT_SIZE} Tf ({_pdf_text(text)}) Tj T*" if text else "T*")
+    parts.append("ET")
+    return '\n'.join(parts).encode('cp1252', errors='replace')
+
+def _render_pdf(job: Tuple[pd.DataFrame, str]) -> Tuple[int, List[bytes]]:
+    """
+    Compressed content streams of the order sheets of a chunk (whole orders, see _order_chunks).
+    Each chunk starts on a new page, so the pages can be rendered independently.
+    """
+    chunk, title = job
+    frame = _display(chunk)
+    pages, lines = [], []
+
+    def new_page():
+        if lines:
+            pages.append(zlib.compress(_page_stream(title, lines)))
+            lines.clear()
+
+    keys = _order_keys(frame)
+    starts = np.flatnonzero(np.append(True, keys[1:] != keys[:-1]))
+    stops = np.append(starts[1:], len(frame))
+    units = np.add.reduceat(frame['Cantidad'].to_numpy(), starts) if len(frame) else []
+    order_columns = {col: frame[col].tolist() for col in ['Num_Pedido', 'Nombre_Emisor', 'Cod_Emisor', 'Fecha_Pedido', 'Fecha_Entrega']}
+    line_columns = [[_fit(value, width, right) for value in frame[col].tolist()] for col, _, width, right in PDF_LINE_COLUMNS]
+    order_lines = ['  '.join(values).rstrip() for values in zip(*line_columns)]
+    header_width = int((PAGE_WIDTH - 2 * MARGIN) / CHAR_WIDTH)
+    for start, stop, total in zip(starts.tolist(), stops.tolist(), units):
+        number, sender, code, ordered, delivery = (order_columns[col][start] for col in order_columns)
+        header = (f"Order {number}  ·  {sender} ({code})  ·  Ordered {ordered or '-'}  ·  Delivery {delivery or '-'}  ·  "
+                  f"{stop - start} line(s), {total:,} units")[:header_width]
+        # a blank line between orders, and at least one order line under each order header
+        if lines and len(lines) + 3 > LINES_PER_PAGE:
+            new_page()
+        if lines:
+            lines.append(('F1', ''))
+        lines.append(('F2', header))
+        for line in order_lines[start:stop]:
+            if len(lines) >= LINES_PER_PAGE:
+                new_page()
+                lines.append(('F2', f"{header}  (cont.)"))
+            lines.append(('F1', line))
+    new_page()
+    return len(chunk), pages
+
+class PdfWriter:
+    """
+    Minimal streaming PDF writer for pages of text in the standard Type 1 fonts (nothing embedded).
+    Pages are written as soon as they are added; only the object offsets are kept until close().
+    """
+
+    FONTS = {'F1': 'Courier', 'F2': 'Courier-Bold', 'F3': 'Helvetica-Bold'}
+
+    def __init__(self, handle, title: str):
+        self.handle = handle
+        self.title = title
+        self.position = 0
+        self.offsets: Dict[int, int] = {}
+        self.pages: List[int] = []
+        # 1: catalog, 2: page tree and 3: shared resources are numbered up front
+        self.next_number = 4
+        self._write(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+        fonts = ' '.join(f"/{name} {self._object(f'<< /Type /Font /Subtype /Type1 /BaseFont /{base} /Encoding /WinAnsiEncoding >>'.encode())} 0 R"
+                         for name, base in self.FONTS.items())
+        self._object(f"<< /Font << {fonts} >> >>".encode(), number=3)
+        self.footer = f"{APP_INFO['name']}  ·  {title}  ·  exported {datetime.now():%d/%m/%Y %H:%M}"
+
+    def _write(self, data: bytes):
+        self.handle.write(data)
+        self.position += len(data)
+
+    def _object(self, body: bytes, number: Optional[int] = None) -> int:
+        if number is None:
+            number, self.next_number = self.next_number, self.next_number + 1
+        self.offsets[number] = self.position
+        self._write(f"{number} 0 obj\n".encode() + body + b"\nendobj\n")
+        return number
+
+    def _stream(self, data: bytes, compressed: bool = False) -> int:
+        dictionary = f"<< /Length {len(data)}{' /Filter /FlateDecode' if compressed else ''} >>".encode()
+        return self._object(dictionary + b"\nstream\n" + data + b"\nendstream")
+
+    def add_page(self, content: bytes):
+        """Adds a page from a compressed content stream; the footer with the page number is added here"""
+        number = len(self.pages) + 1
+        label = f"Page {number}"
+        footer = (f"BT /F1 {FONT_SIZE} Tf {MARGIN} {MARGIN / 2} Td ({_pdf_text(self.footer)}) Tj ET\n"
+                  f"BT /F1 {FONT_SIZE} Tf {PAGE_WIDTH - MARGIN - len(label) * CHAR_WIDTH:.1f} {MARGIN / 2} Td ({label}) Tj ET")
+        contents = [self._stream(content, compressed=True), self._stream(footer.encode('cp1252', errors='replace'))]
+        self.pages.append(self._object(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {PAGE_WIDTH} {PAGE_HEIGHT}] /Resources 3 0 R "
+            f"/Contents [{contents[0]} 0 R {contents[1]} 0 R] >>".encode()))
+
+    def close(self):
+        """Writes the page tree, the catalog and the cross-reference table"""
+        if not self.pages:
+            self.add_page(zlib.compress(_page_stream(self.title, [('F1', 'No records')])))
+        kids = ' '.join(f"{page} 0 R" for page in self.pages)
+        self._object(f"<< /Type /Pages /Kids [{kids}] /Count {len(self.pages)} >>".encode(), number=2)
+        self._object(b"<< /Type /Catalog /Pages 2 0 R >>", number=1)
+        info = self._object(f"<< /Title ({_pdf_text(self.title)}) /Producer ({APP_INFO['name']}) >>".encode('cp1252', errors='replace'))
+        xref = self.position
+        size = self.next_number
+        entries = ''.join(f"{self.offsets[number]:010d} 00000 n \n" for number in range(1, size))
+        self._write(f"xref\n0 {size}\n0000000000 65535 f \n{entries}".encode())
+        self._write(f"trailer\n<< /Size {size} /Root 1 0 R /Info {info} 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode())
+
+def _write_pdf(handle, chunks: Iterator[pd.DataFrame], title: str, workers: int, progress: Optional[Callable]) -> int:
+    writer = PdfWriter(handle, title)
+    rows = 0
+    jobs = ((chunk, title) for chunk in _order_chunks(chunks))
+    for chunk_rows, pages in render_in_order(_render_pdf, jobs, workers):
+        for content in pages:
+            writer.add_page(content)
+        rows += chunk_rows
+        if progress:
+            progress(rows)
+    writer.close()
+    return rows
+
+@timed('export.table')
+def export_table(table_manager, section: str, subsection: str, fmt: str, path,
+                 filters: Optional[Dict[str, str]] = None, chunk_size: Optional[int] = None,
+                 workers: Optional[int] = None, progress: Optional[Callable[[int], None]] = None) -> int:
+    """
+    Streams a section/subsection (optionally filtered as in the table view) to `path` as 'csv',
+    'xlsx' or 'pdf' (order sheets: the lines of each order under its header, paginated).
+    The file is replaced atomically once complete. `workers` processes render the CSV/PDF chunks
+    (default EXPORT_CONFIG['workers'], one per CPU); `progress` is called with the rows written
+    so far after each chunk. Returns the number of rows exported.
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format {fmt!r} (expected one of {', '.join(EXPORT_FORMATS)})")
+    chunks = table_manager.iter_chunks(section, subsection, filters, chunk_size or EXPORT_CONFIG['chunk_size'])
+    title = f"{section} - {subsection}"
+    workers = _worker_count(workers)
+    result = {}
+
+    def write(handle):
+        if fmt == 'csv':
+            result['rows'] = _write_csv(handle, chunks, workers, progress)
+        elif fmt == 'xlsx':
+            result['rows'] = _write_xlsx(handle, chunks, title, progress)
+        else:
+            result['rows'] = _write_pdf(handle, chunks, title, workers, progress)
+
+    atomic_write(Path(path), write, mode='wb')
+    count('rows_exported', result['rows'], format=fmt)
+    count('bytes_written', Path(path).stat().st_size, format=fmt)
+    return result['rows']
+
+def export_temp_file(table_manager, section: str, subsection: str, fmt: str,
+                     filters: Optional[Dict[str, str]] = None) -> Path:
+    """
+    export_table to a new temporary file, returned as its path (for download buttons, which open it
+    when clicked instead of keeping the export in memory). The caller deletes it when done.
+    """
+    handle, name = tempfile.mkstemp(prefix='erp-export-', suffix=EXPORT_FORMATS[fmt][0])
+    os.close(handle)
+    path = Path(name)
+    try:
+        table_manager.export(section, subsection, fmt, path, filters)
+    except BaseException:
+        path.unlink(missing_ok=True)
+        raise
+    return path
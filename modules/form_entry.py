@@ -5,11 +5,17 @@ Provides the form UI and logic for adding new records (orders, etc.)
 import streamlit as st
 import pandas as pd
 from datetime import datetime
+from modules.dates import DATE_COLUMNS, format_dates
+from modules.validation import row_messages, validate_frame
+from modules.instrumentation import timed
 
+@st.fragment
+@timed('view.entry_form')
 def show_entry_form(section: str, subsection: str, table_manager):
     """
     Render the entry form for adding a new record to the ERP.
     Handles validation, demo data, and saving logic.
+    Runs as a fragment: a submit with validation errors reruns only the form; saving or clearing reruns the app.
     """
     st.markdown('<div class="section-header"><h3>📝 New Record</h3></div>', unsafe_allow_html=True)
     if st.session_state.get('demo_loaded', False):
@@ -62,56 +68,44 @@ def show_entry_form(section: str, subsection: str, table_manager):
             st.rerun()
         # Submission and validation logic
         if submitted:
-            errors = []
-            # Validate date format DD/MM/YYYY
-            try:
-                order_date_dt = datetime.strptime(order_date, '%d/%m/%Y')
-            except Exception:
-                errors.append("• Order Date (format DD/MM/YYYY)")
-            try:
-                delivery_date_dt = datetime.strptime(delivery_date, '%d/%m/%Y') if delivery_date else None
-            except Exception:
-                errors.append("• Delivery Date (format DD/MM/YYYY)")
-            if not order_number or order_number.strip() == "":
-                errors.append("• Order Number")
-            if not sender_name or sender_name.strip() == "":
-                errors.append("• Sender Name")
-            if not description or description.strip() == "":
-                errors.append("• Description")
-            if quantity <= 0:
-                errors.append("• Quantity (must be greater than 0)")
-            if not order_date:
-                errors.append("• Order Date")
+            new_record = {
+                'Num_Pedido': order_number.strip(),
+                'Nombre_Emisor': sender_name.strip(),
+                'Cod_Emisor': sender_code.strip(),
+                'Fecha_Pedido': order_date.strip(),
+                'Fecha_Entrega': delivery_date.strip(),
+                'Cod_Art_EAN': ean_code.strip(),
+                'Cod_Art_Comprador': buyer_code.strip(),
+                'Descripcion': description.strip(),
+                'Cantidad': int(quantity),
+                'Tipo': product_type.strip(),
+                'Tipo_Cliche': cliche_type.strip(),
+                'Papel': paper.strip(),
+                'Cod_IPG': internal_code.strip(),
+                'PDF_Link': pdf_link.strip()
+            }
+            # Same schema-driven rules as the table editor and bulk imports
+            errors = row_messages(validate_frame(pd.DataFrame([new_record]))).get(0, [])
             if errors:
                 st.error(f"""
-                ❌ **Cannot save record. The following required fields are missing or the date format is incorrect:**
-                {chr(10).join(errors)}
+                ❌ **Cannot save record. The following fields are missing or invalid:**
+                {chr(10).join(f"• {message}" for message in errors)}
                 Please complete all fields marked with * before saving.
                 """)
             else:
-                new_record = {
-                    'Num_Pedido': str(order_number.strip()),
-                    'Nombre_Emisor': str(sender_name.strip()),
-                    'Cod_Emisor': str(sender_code.strip()) if sender_code else '',
-                    'Fecha_Pedido': order_date_dt.strftime('%d/%m/%Y'),
-                    'Fecha_Entrega': delivery_date_dt.strftime('%d/%m/%Y') if delivery_date_dt else '',
-                    'Cod_Art_EAN': str(ean_code.strip()) if ean_code else '',
-                    'Cod_Art_Comprador': str(buyer_code.strip()) if buyer_code else '',
-                    'Descripcion': str(description.strip()),
-                    'Cantidad': int(quantity),
-                    'Tipo': str(product_type.strip()) if product_type else '',
-                    'Tipo_Cliche': str(cliche_type.strip()) if cliche_type else '',
-                    'Papel': str(paper.strip()) if paper else '',
-                    'Cod_IPG': str(internal_code.strip()) if internal_code else '',
-                    'PDF_Link': str(pdf_link.strip()) if pdf_link else ''
-                }
-                df_current = table_manager.get_dataframe(section, subsection)
-                df_new = pd.concat([df_current, pd.DataFrame([new_record])], ignore_index=True)
-                if table_manager.save_dataframe(section, subsection, df_new):
+                for col in DATE_COLUMNS:
+                    new_record[col] = format_dates([new_record[col]]).iloc[0]
+                # the order line is checked by the write itself, so two sessions cannot both save it
+                duplicate = table_manager.append_new_records(section, subsection, [new_record])
+                if duplicate is None:
+                    st.error("❌ **Error saving the record to the database**")
+                elif duplicate[0]:
+                    st.error(f"❌ **Order {new_record['Num_Pedido']} already has this line** "
+                             f"(sender code '{new_record['Cod_Emisor']}', EAN code '{new_record['Cod_Art_EAN']}'). "
+                             "Edit the existing record in the table instead.")
+                else:
                     st.session_state['save_success'] = True
                     st.rerun()
-                else:
-                    st.error("❌ **Error saving the record to the database**") 
     # Show success message after saving, outside the form
     if st.session_state.get('save_success', False):
         st.success("✅ Record added successfully!")
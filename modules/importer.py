@@ -0,0 +1,76 @@
+"""
+Bulk import module for DemoERP
+Streams large CSV order dumps into the active backend chunk by chunk with bounded memory.
+"""
+import time
+import pandas as pd
+from typing import Dict, Iterator, Optional, Tuple
+from database import COLUMN_SCHEMA
+from modules.dates import format_dates, parse_dates
+from modules.dedup import DUPLICATE_MESSAGE
+from modules.validation import validate_records
+
+def normalize_chunk(chunk: pd.DataFrame) -> pd.DataFrame:
+    """Normalizes one chunk: all schema columns present, DD/MM/YYYY dates, integer quantities, trimmed text"""
+    chunk = chunk.copy()
+    for col in COLUMN_SCHEMA.values():
+        if col not in chunk.columns:
+            chunk[col] = ''
+    chunk = chunk[list(COLUMN_SCHEMA.values())].fillna('')
+    for col in chunk.columns:
+        if col not in ['Fecha_Pedido', 'Fecha_Entrega', 'Cantidad']:
+            chunk[col] = chunk[col].astype(str).str.strip()
+    for col in ['Fecha_Pedido', 'Fecha_Entrega']:
+        # Unparseable values are kept as-is so validation reports them
+        original = chunk[col].astype(str).str.strip()
+        formatted = format_dates(parse_dates(original))
+        chunk[col] = formatted.where(formatted != '', original)
+    chunk['Cantidad'] = pd.to_numeric(chunk['Cantidad'], errors='coerce').fillna(0).astype(int)
+    return chunk
+
+def iter_import_chunks(file_path: str, chunk_size: int = 50000) -> Iterator[Tuple[pd.DataFrame, pd.DataFrame]]:
+    """
+    Reads a CSV dump with read_csv(chunksize=...) and yields (valid, rejected) DataFrames per chunk.
+    Rejected rows carry an extra 'Errors' column with the validation messages.
+    """
+    for chunk in pd.read_csv(file_path, dtype=str, chunksize=chunk_size, keep_default_na=False):
+        chunk = normalize_chunk(chunk)
+        errors = validate_records(chunk)
+        invalid = errors != ''
+        rejected = chunk[invalid].assign(Errors=errors[invalid])
+        yield chunk[~invalid], rejected
+
+def import_csv(table_manager, section: str, subsection: str, file_path: str, chunk_size: int = 50000,
+               rejected_path: Optional[str] = None, progress=None) -> Dict[str, float]:
+    """
+    Imports a CSV dump into a section/subsection through the active backend (append path).
+    Invalid rows and rows repeating an order line already saved (or earlier in the dump) are skipped
+    and optionally written to `rejected_path`.
+    `progress` is called with the running report after each chunk.
+    Returns a report with rows read/imported/rejected, elapsed seconds and throughput.
+    """
+    report = {'read': 0, 'imported': 0, 'rejected': 0, 'duplicates': 0, 'failed': 0, 'seconds': 0.0, 'rows_per_second': 0.0}
+    started = time.perf_counter()
+    rejected_header = True
+    for valid, rejected in iter_import_chunks(file_path, chunk_size):
+        report['read'] += len(valid) + len(rejected)
+        if not valid.empty:
+            # duplicates are found and skipped by the write itself, under the backend's write lock
+            duplicate = table_manager.append_new_records(section, subsection, valid)
+            if duplicate is None:
+                report['failed'] += len(valid)
+            else:
+                report['imported'] += int((~duplicate).sum())
+                if duplicate.any():
+                    report['duplicates'] += int(duplicate.sum())
+                    rejected = pd.concat([rejected, valid[duplicate].assign(Errors=f"• {DUPLICATE_MESSAGE}")])
+        if not rejected.empty:
+            report['rejected'] += len(rejected)
+            if rejected_path:
+                rejected.to_csv(rejected_path, mode='w' if rejected_header else 'a', header=rejected_header, index=False)
+                rejected_header = False
+        report['seconds'] = time.perf_counter() - started
+        report['rows_per_second'] = report['read'] / max(report['seconds'], 1e-9)
+        if progress:
+            progress(report)
+    return report
@@ -0,0 +1,195 @@
+"""
+Batch ingestion module for DemoERP
+Validates and writes batches of JSON records (insert or upsert) and serializes query results,
+for headless clients such as RPA bots. Shared by the HTTP API and usable from scripts.
+"""
+import re
+import numpy as np
+import pandas as pd
+from typing import Any, Dict, Iterable, List, Tuple
+from database import COLUMN_SCHEMA, order_line_keys
+from modules.dates import DISPLAY_FORMAT, format_date_columns, parse_dates
+from modules.dedup import DUPLICATE_MESSAGE
+from modules.importer import normalize_chunk
+from modules.reconciliation import KEY_COLUMNS
+from modules.validation import RULES, row_messages, validate_frame
+
+# Records may use the column names (Num_Pedido) or the schema field names (numPedido)
+FIELD_NAMES = {**{col: col for col in COLUMN_SCHEMA.values()}, **COLUMN_SCHEMA}
+
+# Upserts match existing records on the order line (sender code, order number, EAN code)
+UPSERT_KEY = KEY_COLUMNS
+
+# Error of an upserted record whose order line is repeated later in the same batch
+SUPERSEDED_MESSAGE = "Superseded by a later record in the batch"
+
+# Quantities sent as text must be whole numbers ("3", not "1.5")
+WHOLE_NUMBER = re.compile(r'\s*[+-]?\d+\s*')
+
+class IngestError(ValueError):
+    """A batch that cannot be processed at all (as opposed to per-row validation errors)"""
+
+def _whole_number(value) -> bool:
+    if isinstance(value, bool):
+        return False
+    if isinstance(value, int):
+        return True
+    if isinstance(value, float):
+        return value.is_integer()
+    return isinstance(value, str) and WHOLE_NUMBER.fullmatch(value) is not None
+
+def raw_value_errors(raw: pd.DataFrame) -> pd.DataFrame:
+    """
+    Error matrix (as validate_frame) of the values normalization would coerce instead of reject:
+    lists and objects, non-text values in text columns, quantities that are not whole numbers and
+    dates that are not DD/MM/YYYY text. `raw` holds the values as received, '' for missing ones.
+    """
+    matrix = {}
+    for rule in RULES:
+        if rule.column not in raw.columns:
+            continue
+        values = raw[rule.column]
+        nested = values.map(lambda value: isinstance(value, (list, dict))).to_numpy(dtype=bool)
+        matrix[f"{rule.label} (must be a single value)"] = nested
+        if rule.kind == 'integer':
+            wrong = ~values.map(lambda value: value == '' or _whole_number(value)).to_numpy(dtype=bool)
+            matrix[f"{rule.label} (must be a whole number)"] = wrong & ~nested
+        elif rule.kind == 'date':
+            text = values.map(lambda value: value if isinstance(value, str) else None)
+            # strict DD/MM/YYYY, before normalization would accept other layouts (ISO, 20250101...)
+            parsed = parse_dates(text.where(text.str.strip() != '', None), formats=(DISPLAY_FORMAT,), fallback=False)
+            wrong = (text.isna() | (parsed.isna() & (text.str.strip() != ''))).to_numpy(dtype=bool)
+            matrix[f"{rule.label} (format DD/MM/YYYY)"] = wrong & ~nested
+        else:
+            matrix[f"{rule.label} (must be text)"] = ~values.map(lambda value: isinstance(value, (str, list, dict))).to_numpy(dtype=bool)
+    return pd.DataFrame(matrix, index=raw.index)
+
+def merge_errors(matrix: pd.DataFrame, extra: pd.DataFrame) -> pd.DataFrame:
+    """Combines two error matrices of the same rows (checks with the same message are OR-ed)"""
+    matrix = matrix.copy()
+    for col in extra.columns:
+        matrix[col] = (matrix[col].to_numpy(dtype=bool) if col in matrix.columns else False) | extra[col].to_numpy(dtype=bool)
+    return matrix
+
+def records_frame(records: Iterable[Dict[str, Any]]) -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+    """
+    Builds a normalized DataFrame from JSON records and returns it with the fields each record
+    supplied (boolean frame, one column per column present in the batch) and the error matrix of
+    the values rejected before normalization (see raw_value_errors).
+    Raises IngestError for non-object records or unknown fields.
+    """
+    records = list(records)
+    if not all(isinstance(record, dict) for record in records):
+        raise IngestError("Every record must be a JSON object")
+    fields = set().union(*records) if records else set()
+    unknown = sorted(str(name) for name in fields if name not in FIELD_NAMES)
+    if unknown:
+        raise IngestError(f"Unknown fields: {', '.join(unknown)}")
+    if fields <= set(COLUMN_SCHEMA.values()):
+        raw = pd.DataFrame(records)
+    else:
+        # some records use schema field names: rename per record (clients may mix both)
+        renamed = [{FIELD_NAMES[name]: value for name, value in record.items()} for record in records]
+        if any(len(row) < len(record) for row, record in zip(renamed, records)):
+            raise IngestError("A field is given under both its column and its schema name")
+        raw = pd.DataFrame(renamed)
+    raw = raw.reindex(columns=[col for col in COLUMN_SCHEMA.values() if col in raw.columns])
+    supplied = pd.DataFrame([{FIELD_NAMES[name]: True for name in record} for record in records],
+                            index=raw.index, columns=raw.columns).fillna(False).astype(bool)
+    raw = raw.astype(object).where(raw.notna(), '')
+    errors = raw_value_errors(raw)
+    # lists and objects are rejected above: blank them so normalization does not trip over them
+    raw = raw.mask(raw.map(lambda value: isinstance(value, (list, dict))), '')
+    return normalize_chunk(raw), supplied, errors
+
+def row_errors(matrix: pd.DataFrame) -> List[Dict[str, Any]]:
+    """Per-row error list ({'row': position in the batch, 'errors': [...]}) from the validation error matrix"""
+    return [{'row': int(pos), 'errors': messages} for pos, messages in row_messages(matrix).items()]
+
+def insert_records(table_manager, section: str, subsection: str, records: Iterable[Dict[str, Any]],
+                   all_or_nothing: bool = False) -> Dict[str, Any]:
+    """
+    Validates a batch and appends the valid records in one write. Records repeating a saved order line
+    (or an earlier record of the batch) are rejected too, so retried batches are not saved twice.
+    With `all_or_nothing`, a single invalid record rejects the whole batch.
+    Returns {'received', 'inserted', 'rejected', 'errors'}.
+    """
+    df, _, raw_errors = records_frame(records)
+    matrix = merge_errors(validate_frame(df), raw_errors)
+    invalid = matrix.any(axis=1)
+    matrix[DUPLICATE_MESSAGE] = False
+    valid = df[~invalid]
+    report = {'received': len(df), 'inserted': 0, 'rejected': int(invalid.sum()), 'errors': row_errors(matrix)}
+    if valid.empty or (all_or_nothing and report['rejected']):
+        return report
+    # the order lines are checked by the write itself, under the backend's write lock
+    duplicate = table_manager.append_new_records(section, subsection, valid, all_or_nothing)
+    if duplicate is None:
+        raise IOError(f"Could not write to {section} - {subsection}")
+    if duplicate.any():
+        matrix.loc[valid.index[duplicate], DUPLICATE_MESSAGE] = True
+        report['rejected'] += int(duplicate.sum())
+        report['errors'] = row_errors(matrix)
+        if all_or_nothing:
+            return report
+    report['inserted'] = int((~duplicate).sum())
+    return report
+
+def supplied_errors(df: pd.DataFrame, supplied: pd.DataFrame, raw_errors: pd.DataFrame) -> pd.DataFrame:
+    """Error matrix (as validate_frame) checking each record only on the fields it supplied"""
+    matrix = {}
+    for rule in RULES:
+        given = supplied[rule.column].to_numpy() if rule.column in supplied.columns else np.zeros(len(df), dtype=bool)
+        for message, failed in validate_frame(df, [rule]).items():
+            matrix[message] = (matrix[message] if message in matrix else False) | (failed.to_numpy() & given)
+    return merge_errors(pd.DataFrame(matrix, index=df.index), raw_errors)
+
+def upsert_records(table_manager, section: str, subsection: str, records: Iterable[Dict[str, Any]],
+                   all_or_nothing: bool = False) -> Dict[str, Any]:
+    """
+    Validates a batch and inserts or updates each record by its order line (UPSERT_KEY).
+    Matched records only get (and are only checked on) the fields they supplied; records inserted
+    must pass every check, so an unmatched record missing a required field is rejected. The last record
+    wins within a batch: earlier ones with the same order line are rejected as superseded. The backend matches the order lines and writes the batch under its write lock
+    (see TableManager.upsert_records).
+    Returns {'received', 'inserted', 'updated', 'rejected', 'errors'}.
+    """
+    df, supplied, raw_errors = records_frame(records)
+    missing_keys = [col for col in UPSERT_KEY if col not in supplied.columns or not supplied[col].all()]
+    if missing_keys:
+        raise IngestError(f"Upserts need the key fields: {', '.join(missing_keys)}")
+    partial = supplied_errors(df, supplied, raw_errors)
+    invalid = partial.any(axis=1).to_numpy()
+    report = {'received': len(df), 'inserted': 0, 'updated': 0, 'rejected': int(invalid.sum()),
+              'errors': row_errors(partial)}
+    if invalid.all() or (all_or_nothing and report['rejected']):
+        return report
+    valid = df[~invalid]
+    superseded = order_line_keys(valid).duplicated(keep='last').to_numpy()
+    if superseded.any():
+        partial[SUPERSEDED_MESSAGE] = False
+        partial.loc[valid.index[superseded], SUPERSEDED_MESSAGE] = True
+        report['rejected'] += int(superseded.sum())
+        report['errors'] = row_errors(partial)
+        valid = valid[~superseded]
+    full = merge_errors(validate_frame(valid), raw_errors.loc[valid.index])
+    insertable = ~full.any(axis=1).to_numpy()
+    fields = supplied.loc[valid.index, [col for col in supplied.columns if col not in UPSERT_KEY]]
+    matched = table_manager.upsert_records(section, subsection, valid, fields, insertable, all_or_nothing)
+    # records matching no saved line would be inserted: they fail on the fields they left out
+    unmatched = ~matched & ~insertable
+    if unmatched.any():
+        report['rejected'] += int(unmatched.sum())
+        failed = pd.concat([partial[partial.any(axis=1)], full[unmatched]]).fillna(False).astype(bool)
+        report['errors'] = row_errors(failed.sort_index())
+        if all_or_nothing:
+            return report
+    report['inserted'] = int((~matched & insertable).sum())
+    report['updated'] = int(matched.sum())
+    return report
+
+def records_payload(df: pd.DataFrame) -> List[Dict[str, Any]]:
+    """JSON-ready records: DD/MM/YYYY dates, None for missing values, plain Python numbers"""
+    df = format_date_columns(df.copy())
+    df = df.astype(object).where(df.notna(), None)
+    return df.to_dict(orient='records')
@@ -0,0 +1,209 @@
+"""
+Instrumentation module for DemoERP
+Timing spans and row/byte counters for the hot paths (TableManager, backends, views). They are
+collected per unit of work (one Streamlit rerun) and aggregated per process. A rerun can also
+capture cProfile and tracemalloc. Exported to the sidebar debug panel and to JSON or
+Prometheus text (dump files and the API's /metrics).
+"""
+import contextvars
+import cProfile
+import functools
+import io
+import json
+import pstats
+import threading
+import time
+import tracemalloc
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from config import INSTRUMENTATION_CONFIG
+
+# Prefix of the exported Prometheus metric names
+METRIC_PREFIX = 'erp'
+
+@dataclass
+class SpanStats:
+    """Aggregated durations of one span name; `recent` keeps the latest ones for percentiles"""
+    count: int = 0
+    total: float = 0.0
+    max: float = 0.0
+    recent: deque = field(default_factory=lambda: deque(maxlen=INSTRUMENTATION_CONFIG['recent_spans']))
+
+    def summary(self) -> Dict[str, float]:
+        recent = np.fromiter(self.recent, dtype='float64')
+        p50, p95 = np.percentile(recent, [50, 95]) if len(recent) else (0.0, 0.0)
+        return {'count': self.count, 'total_seconds': round(self.total, 6), 'max_seconds': round(self.max, 6),
+                'p50_seconds': round(float(p50), 6), 'p95_seconds': round(float(p95), 6)}
+
+class Metrics:
+    """Process-wide span timings and counters, shared by all sessions and threads"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._spans: Dict[str, SpanStats] = {}
+        self._counters: Dict[Tuple[str, Tuple], float] = {}
+        self.started = datetime.now()
+
+    def observe(self, name: str, seconds: float):
+        with self._lock:
+            stats = self._spans.setdefault(name, SpanStats())
+            stats.count += 1
+            stats.total += seconds
+            stats.max = max(stats.max, seconds)
+            stats.recent.append(seconds)
+
+    def add(self, name: str, value: float, labels: Dict[str, str]):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def snapshot(self) -> Dict[str, Any]:
+        """JSON-ready copy: {'started', 'spans': {name: summary}, 'counters': [{'name', 'labels', 'value'}]}"""
+        with self._lock:
+            spans = {name: stats.summary() for name, stats in sorted(self._spans.items())}
+            counters = [{'name': name, 'labels': dict(labels), 'value': value}
+                        for (name, labels), value in sorted(self._counters.items())]
+        return {'started': self.started.isoformat(timespec='seconds'), 'spans': spans, 'counters': counters}
+
+    def to_prometheus(self) -> str:
+        """Prometheus text exposition: one summary for the spans, one counter per counter name"""
+        snapshot = self.snapshot()
+        lines = [f"# HELP {METRIC_PREFIX}_span_seconds Duration of instrumented operations",
+                 f"# TYPE {METRIC_PREFIX}_span_seconds summary"]
+        for name, stats in snapshot['spans'].items():
+            label = f'span="{_escape(name)}"'
+            lines.append(f'{METRIC_PREFIX}_span_seconds{{{label},quantile="0.5"}} {stats["p50_seconds"]}')
+            lines.append(f'{METRIC_PREFIX}_span_seconds{{{label},quantile="0.95"}} {stats["p95_seconds"]}')
+            lines.append(f'{METRIC_PREFIX}_span_seconds_sum{{{label}}} {stats["total_seconds"]}')
+            lines.append(f'{METRIC_PREFIX}_span_seconds_count{{{label}}} {stats["count"]}')
+        typed = set()
+        for counter in snapshot['counters']:
+            metric = f"{METRIC_PREFIX}_{counter['name']}_total"
+            if metric not in typed:
+                lines.append(f"# TYPE {metric} counter")
+                typed.add(metric)
+            labels = ','.join(f'{key}="{_escape(value)}"' for key, value in counter['labels'].items())
+            lines.append(f"{metric}{{{labels}}} {counter['value']}" if labels else f"{metric} {counter['value']}")
+        return '\n'.join(lines) + '\n'
+
+    def reset(self):
+        with self._lock:
+            self._spans.clear()
+            self._counters.clear()
+            self.started = datetime.now()
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+@dataclass
+class Trace:
+    """
+    Spans and counters of one unit of work (e.g. a Streamlit rerun), in the order they finished.
+    Spans started in other threads (load_many, the API thread pool) only go to the process metrics.
+    """
+    spans: List[Dict[str, Any]] = field(default_factory=list)
+    counters: Dict[str, float] = field(default_factory=dict)
+    seconds: float = 0.0
+    profile: Optional[str] = None
+    memory: Optional[Dict[str, Any]] = None
+
+# Shared by every session of the process
+metrics = Metrics()
+
+_current_trace: contextvars.ContextVar = contextvars.ContextVar('trace', default=None)
+_depth: contextvars.ContextVar = contextvars.ContextVar('span_depth', default=0)
+
+@contextmanager
+def span(name: str):
+    """Times the enclosed block as `name` (nested spans are recorded with their depth)"""
+    if not INSTRUMENTATION_CONFIG['enabled']:
+        yield
+        return
+    depth = _depth.get()
+    token = _depth.set(depth + 1)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - started
+        _depth.reset(token)
+        metrics.observe(name, seconds)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.spans.append({'name': name, 'depth': depth, 'seconds': seconds})
+
+def timed(name: Optional[str] = None):
+    """Decorator running a function inside a span (named after its qualified name by default)"""
+    def decorate(func):
+        label = name or func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(label):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+def count(name: str, value: float, **labels):
+    """Adds to a counter (e.g. rows_read, bytes_written), per label combination"""
+    if not INSTRUMENTATION_CONFIG['enabled'] or not value:
+        return
+    metrics.add(name, value, labels)
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.counters[name] = trace.counters.get(name, 0) + value
+
+@contextmanager
+def trace(profile: bool = False, memory: bool = False):
+    """
+    Collects the spans and counters of the enclosed block into the yielded Trace.
+    With `profile`, a cProfile capture of the block (top functions by cumulative time) is stored in
+    trace.profile; with `memory`, tracemalloc's peak and top allocation sites in trace.memory.
+    """
+    current = Trace()
+    token = _current_trace.set(current)
+    profiler = cProfile.Profile() if profile else None
+    own_tracemalloc = memory and not tracemalloc.is_tracing()
+    if own_tracemalloc:
+        tracemalloc.start()
+    elif memory:
+        tracemalloc.reset_peak()
+    started = time.perf_counter()
+    try:
+        if profiler:
+            try:
+                profiler.enable()
+            except ValueError:  # another profiler is active on this thread
+                profiler = None
+        yield current
+    finally:
+        if profiler:
+            profiler.disable()
+        current.seconds = time.perf_counter() - started
+        if profiler:
+            text = io.StringIO()
+            pstats.Stats(profiler, stream=text).sort_stats('cumulative').print_stats(INSTRUMENTATION_CONFIG['profile_top'])
+            current.profile = text.getvalue()
+        if memory:
+            _, peak = tracemalloc.get_traced_memory()
+            top = tracemalloc.take_snapshot().statistics('lineno')[:INSTRUMENTATION_CONFIG['memory_top']]
+            current.memory = {'peak_bytes': peak,
+                              'top': [{'site': str(stat.traceback), 'bytes': stat.size, 'count': stat.count} for stat in top]}
+            if own_tracemalloc:
+                tracemalloc.stop()
+        _current_trace.reset(token)
+
+def dump(directory: Optional[str] = None) -> List[Path]:
+    """Writes the process metrics to metrics.json and metrics.prom in `directory` (default: the configured dump_dir)"""
+    target = Path(directory or INSTRUMENTATION_CONFIG['dump_dir'])
+    target.mkdir(parents=True, exist_ok=True)
+    json_path, prom_path = target / 'metrics.json', target / 'metrics.prom'
+    json_path.write_text(json.dumps(metrics.snapshot(), indent=2))
+    prom_path.write_text(metrics.to_prometheus())
+    return [json_path, prom_path]
@@ -0,0 +1,255 @@
+"""
+Write-ahead journal module for DemoERP
+Append-only log of record-level changes (inserts, updates, deletes) next to a table snapshot.
+Writes append and fsync journal entries (group commit through the append coordinator);
+reads replay the journal tail over the snapshot; a background compactor folds it back in.
+"""
+import json
+import os
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+import pandas as pd
+
+from config import DATABASE_CONFIG
+from modules.write_coordinator import append_coordinator, atomic_write, file_lock
+
+def journal_path(snapshot_path: Path) -> Path:
+    """Journal file of a table snapshot (`<table>.csv.wal`)"""
+    return Path(f"{snapshot_path}.wal")
+
+def snapshot_signature(snapshot_path: Path) -> Optional[List[int]]:
+    """
+    Identity of the snapshot a journal applies to: (inode, mtime, size).
+    Snapshots are always replaced atomically, so any rewrite changes it.
+    """
+    try:
+        stat = Path(snapshot_path).stat()
+    except FileNotFoundError:
+        return None
+    return [stat.st_ino, stat.st_mtime_ns, stat.st_size]
+
+def make_entry(updates: Optional[Dict] = None, deletes: Optional[List] = None, inserts: Optional[List[Dict]] = None) -> Dict:
+    """
+    Builds one journal entry from text values in the snapshot layout.
+    Update and delete keys are row positions before the entry is applied; inserts go to the end.
+    """
+    entry = {}
+    if updates:
+        entry['updates'] = {str(int(pos)): values for pos, values in updates.items()}
+    if deletes:
+        entry['deletes'] = sorted(int(pos) for pos in deletes)
+    if inserts:
+        entry['inserts'] = inserts
+    return entry
+
+def _read_header(snapshot_path: Path):
+    """(header dict or None, header line length, journal size) of a journal, read from one open handle"""
+    try:
+        with open(journal_path(snapshot_path), 'rb') as f:
+            line = f.readline()
+            size = os.fstat(f.fileno()).st_size
+    except FileNotFoundError:
+        return None, 0, 0
+    try:
+        header = json.loads(line)
+    except ValueError:
+        header = None
+    return (header if isinstance(header, dict) else None), len(line), size
+
+def reset(snapshot_path: Path, changed: bool = False):
+    """
+    Starts an empty journal bound to the current snapshot; the caller holds the exclusive lock.
+    The table version (see table_version) is carried over, so folding the journal into the snapshot
+    does not change it; `changed` moves it on, for a snapshot rewritten with new content.
+    """
+    previous, header_length, size = _read_header(snapshot_path)
+    previous = previous or {}
+    header = json.dumps({'base': snapshot_signature(snapshot_path),
+                         'epoch': previous.get('epoch') or uuid.uuid4().hex,
+                         'version': previous.get('version', 0) + max(size - header_length, 0) + int(changed)})
+    atomic_write(journal_path(snapshot_path), lambda f: f.write(header + '\n'))
+
+def table_version(snapshot_path: Path) -> Optional[Tuple[str, int]]:
+    """
+    Logical version of a journaled table: (journal epoch, bytes of entries written since the epoch began).
+    It moves on with every entry appended and stays the same when the journal is compacted.
+    None without a journal.
+    """
+    header, header_length, size = _read_header(snapshot_path)
+    if header is None or 'epoch' not in header:
+        return None
+    return (header['epoch'], header.get('version', 0) + size - header_length)
+
+def _header_matches(snapshot_path: Path, line: str) -> bool:
+    try:
+        return json.loads(line).get('base') == snapshot_signature(snapshot_path)
+    except (ValueError, AttributeError):
+        return False
+
+def read_entries(snapshot_path: Path) -> List[Dict]:
+    """
+    Journal entries not yet folded into the snapshot, in order.
+    A journal whose header names another snapshot was already compacted (crash between the
+    snapshot replace and the journal reset) and is ignored; a torn last line is skipped.
+    """
+    path = journal_path(snapshot_path)
+    if not path.exists():
+        return []
+    with open(path, encoding='utf-8') as f:
+        lines = f.read().split('\n')
+    if not lines or not _header_matches(snapshot_path, lines[0]):
+        return []
+    entries = []
+    for line in lines[1:]:
+        if not line:
+            continue
+        try:
+            entries.append(json.loads(line))
+        except ValueError:
+            break
+    return entries
+
+def journal_size(snapshot_path: Path) -> int:
+    """Size of the journal in bytes (0 when there is none)"""
+    try:
+        return journal_path(snapshot_path).stat().st_size
+    except FileNotFoundError:
+        return 0
+
+def _repair(snapshot_path: Path):
+    """
+    Makes the journal ready for appending: starts a new one if it is missing or bound to an
+    older snapshot (compaction interrupted after the snapshot replace), and cuts a torn last line.
+    """
+    path = journal_path(snapshot_path)
+    if not path.exists():
+        reset(snapshot_path)
+        return
+    with open(path, 'rb') as f:
+        content = f.read()
+    if not _header_matches(snapshot_path, content.split(b'\n', 1)[0].decode('utf-8', errors='replace')):
+        reset(snapshot_path)
+    elif not content.endswith(b'\n'):
+        os.truncate(path, content.rfind(b'\n') + 1)
+
+def _flush_entries(snapshot_path: Path, batches: List[List[Dict]]):
+    """
+    Group commit: writes every queued entry with a single fsync.
+    Runs in the append coordinator thread while it holds the table's exclusive lock.
+    """
+    _repair(snapshot_path)
+    lines = ''.join(json.dumps(entry) + '\n' for batch in batches for entry in batch)
+    with open(journal_path(snapshot_path), 'a', encoding='utf-8') as f:
+        f.write(lines)
+        f.flush()
+        os.fsync(f.fileno())
+
+def append_entries(snapshot_path: Path, entries: List[Dict]):
+    """Appends entries durably; blocks until the group commit holding them is fsynced"""
+    append_coordinator.append(Path(snapshot_path), entries, _flush_entries)
+
+def append_entries_locked(snapshot_path: Path, entries: List[Dict]):
+    """append_entries for a caller already holding the table's exclusive lock (written and fsynced directly)"""
+    _flush_entries(Path(snapshot_path), [entries])
+
+def replay(snapshot: pd.DataFrame, entries: List[Dict]) -> pd.DataFrame:
+    """
+    Applies journal entries to a text snapshot (as read by read_csv(dtype=str)).
+    Consecutive inserts are concatenated in one go; empty values become missing values.
+    """
+    df = snapshot.reset_index(drop=True)
+    pending: List[Dict] = []
+
+    def flush_inserts(df):
+        if not pending:
+            return df
+        inserts = pd.DataFrame(pending, dtype=str).replace('', None)
+        pending.clear()
+        return pd.concat([df, inserts], ignore_index=True)
+
+    for entry in entries:
+        if entry.get('updates') or entry.get('deletes'):
+            df = flush_inserts(df)
+            for pos, values in entry.get('updates', {}).items():
+                pos = int(pos)
+                for col, value in values.items():
+                    if col in df.columns and 0 <= pos < len(df):
+                        df.at[pos, col] = value if value != '' else None
+            deletes = [pos for pos in entry.get('deletes', []) if 0 <= pos < len(df)]
+            if deletes:
+                df = df.drop(index=deletes).reset_index(drop=True)
+        pending.extend(entry.get('inserts', []))
+    return flush_inserts(df)
+
+class Compactor:
+    """
+    Background thread folding journals into their snapshots.
+    A journal is compacted once it holds `max_entries` entries or `max_bytes` bytes, or has been
+    idle for `interval` seconds (checked at that interval); `compact(snapshot_path)` is supplied by the backend.
+    """
+
+    def __init__(self, interval: float, max_entries: int, max_bytes: int):
+        self.interval = interval
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._watched: Dict[str, Callable[[Path], None]] = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def watch(self, snapshot_path: Path, compact: Callable[[Path], None]):
+        """Registers a journaled table and starts the compactor thread if needed"""
+        with self._lock:
+            self._watched[str(snapshot_path)] = compact
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="journal-compactor", daemon=True)
+                self._thread.start()
+
+    def needs_compaction(self, snapshot_path: Path) -> bool:
+        """Full journals are compacted, and so are idle ones, so reads get back to the indexed snapshot"""
+        path = journal_path(snapshot_path)
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            return False
+        if stat.st_size >= self.max_bytes:
+            return True
+        with open(path, 'rb') as f:
+            entries = f.read().count(b'\n') - 1
+        return entries >= self.max_entries or (entries > 0 and time.time() - stat.st_mtime >= self.interval)
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                watched = list(self._watched.items())
+            for path, compact in watched:
+                try:
+                    if self.needs_compaction(Path(path)):
+                        compact(Path(path))
+                except Exception as e:
+                    print(f"Error compacting journal of {Path(path).name}: {e}")
+
+def compact_with(snapshot_path: Path, read_snapshot: Callable[[Path], pd.DataFrame],
+                 write_snapshot: Callable[[Path, pd.DataFrame], None]) -> int:
+    """
+    Folds the journal into the snapshot under the exclusive lock and returns the entries folded.
+    The snapshot is replaced atomically before the journal is reset, so a crash in between
+    leaves a journal bound to the old snapshot, which readers then ignore. The table version
+    stays the same, so caches and derived state of the table remain valid.
+    """
+    with file_lock(snapshot_path):
+        entries = read_entries(snapshot_path)
+        if not entries:
+            return 0
+        write_snapshot(snapshot_path, replay(read_snapshot(snapshot_path), entries))
+        reset(snapshot_path)
+        return len(entries)
+
+# Shared by every journaled table in the process
+compactor = Compactor(DATABASE_CONFIG['journal_compact_interval'],
+                      DATABASE_CONFIG['journal_compact_entries'],
+                      DATABASE_CONFIG['journal_compact_bytes'])
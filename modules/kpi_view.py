@@ -0,0 +1,58 @@
+"""
+KPI view module for DemoERP
+Renders the automated reports from the materialized rollups (no table scan per render).
+"""
+import pandas as pd
+import streamlit as st
+from config import KPI_CONFIG
+from modules.rollups import DIMENSIONS, GRAINS, on_time_rate, rollup_store, summarize_by
+from modules.instrumentation import timed
+
+# Display names of the rollup group columns
+DIMENSION_LABELS = {
+    'Nombre_Emisor': 'Sender',
+    'Tipo': 'Type',
+    'Papel': 'Paper'
+}
+
+@timed('view.kpis')
+def show_kpis(section: str, subsection: str, table_manager):
+    """
+    Render quantity and on-time KPIs for a section/subsection.
+    Reads the rollups kept up to date by every save, so each render only touches one row per group.
+    """
+    st.markdown('<div class="section-header"><h3>📈 Automated Reports</h3></div>', unsafe_allow_html=True)
+    col_grain, col_dimension = st.columns([1, 1])
+    with col_grain:
+        grain = st.radio("Period", GRAINS, format_func=str.capitalize, horizontal=True, key=f"kpi_grain_{section}_{subsection}")
+    with col_dimension:
+        dimension = st.selectbox("Breakdown", DIMENSIONS, format_func=DIMENSION_LABELS.get, key=f"kpi_dimension_{section}_{subsection}")
+    rollup = rollup_store.get(table_manager, section, subsection, grain)
+    if rollup.empty:
+        st.info("ℹ️ No records available for reports")
+        return
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Total Quantity", f"{int(rollup['Quantity'].sum()):,}")
+    col2.metric("Order Lines", f"{int(rollup['Lines'].sum()):,}")
+    col3.metric(f"On-Time Rate (≤ {KPI_CONFIG['on_time_days']} days)", f"{on_time_rate(rollup):.1%}")
+    # Quantity per period, one series per value of the breakdown
+    dated = rollup[rollup['Period'].notna()]
+    if not dated.empty:
+        chart = summarize_by(dated, ['Period', dimension]).pivot(index='Period', columns=dimension, values='Quantity').fillna(0)
+        st.bar_chart(chart)
+    summary = summarize_by(rollup, [dimension]).sort_values('Quantity', ascending=False)
+    st.dataframe(
+        summary[[dimension, 'Quantity', 'Lines', 'On_Time_Rate']],
+        use_container_width=True,
+        hide_index=True,
+        column_config={
+            dimension: st.column_config.TextColumn(DIMENSION_LABELS[dimension]),
+            "Quantity": st.column_config.NumberColumn("Quantity", format="%d"),
+            "Lines": st.column_config.NumberColumn("Order Lines", format="%d"),
+            "On_Time_Rate": st.column_config.ProgressColumn("On-Time Rate", min_value=0.0, max_value=1.0, format="percent")
+        }
+    )
+    periods = summarize_by(rollup, ['Period']).sort_values('Period', ascending=False)
+    periods['Period'] = pd.to_datetime(periods['Period']).dt.strftime('%d/%m/%Y').fillna('No date')
+    with st.expander(f"📅 Totals per {grain}"):
+        st.dataframe(periods[['Period', 'Quantity', 'Lines', 'On_Time_Rate']], use_container_width=True, hide_index=True)
@@ -0,0 +1,882 @@
+"""
+PostgreSQL backend module for DemoERP
+SQLAlchemy models, the process-wide engines and PgBackend. Imported only when the PostgreSQL
+backend is selected (or by the PostgreSQL maintenance commands), so CSV and columnar sessions
+never load SQLAlchemy.
+"""
+import io
+import os
+import threading
+import numpy as np
+import pandas as pd
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+import sqlalchemy as sa
+from sqlalchemy import create_engine, Column, Computed, Integer, String, Date, Text, Index, DDL
+from sqlalchemy.dialects.postgresql import TSVECTOR
+from sqlalchemy.orm import declarative_base, declared_attr, sessionmaker
+from config import DATABASE_CONFIG
+from database import COLUMN_SCHEMA, COLUMN_TYPES, order_line_keys, to_table_model
+from modules.dates import parse_dates
+from modules.dedup import find_duplicates
+from modules.instrumentation import count, timed
+from modules.reconciliation import KEY_COLUMNS, MISSING_KEY
+from modules.search import SEARCH_COLUMNS, parse_query
+
+# SQLAlchemy Base for PostgreSQL
+Base = declarative_base()
+
+# Trigram indexes (used by ILIKE '%...%' filters) need the pg_trgm extension
+sa.event.listen(
+    Base.metadata,
+    'before_create',
+    DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm").execute_if(dialect='postgresql')
+)
+
+# Columns with a B-tree index
+INDEXED_COLUMNS = ['numPedido', 'nombreEmisor', 'codEmisor', 'fechaPedido', 'fechaEntrega']
+
+# Words of the searched columns, kept by PostgreSQL in a generated tsvector column ('simple': no stemming,
+# no stop words, like the in-memory index of the file backends)
+SEARCH_VECTOR_SQL = "to_tsvector('simple', {})".format(" || ' ' || ".join(
+    f"coalesce(\"{attr}\", '')" for attr, col in COLUMN_SCHEMA.items() if col in SEARCH_COLUMNS
+))
+
+def _record_column(attr: str) -> Column:
+    """SQLAlchemy column for a COLUMN_TYPES entry"""
+    kind, length = COLUMN_TYPES[attr]
+    column_type = {'date': Date, 'integer': Integer}.get(kind) or (String(length) if length else Text)
+    return Column(column_type, index=attr in INDEXED_COLUMNS)
+
+class ERPRecord(Base):
+    """Base model for DemoERP records"""
+    __abstract__ = True
+    
+    id = Column(Integer, primary_key=True)
+    numPedido = _record_column('numPedido')
+    nombreEmisor = _record_column('nombreEmisor')
+    codEmisor = _record_column('codEmisor')
+    fechaPedido = _record_column('fechaPedido')
+    fechaEntrega = _record_column('fechaEntrega')
+    codArtEan = _record_column('codArtEan')
+    codArtComprador = _record_column('codArtComprador')
+    descripcion = _record_column('descripcion')
+    cantidad = _record_column('cantidad')
+    tipo = _record_column('tipo')
+    tipoCliche = _record_column('tipoCliche')
+    papel = _record_column('papel')
+    codIpg = _record_column('codIpg')
+    pdfLink = _record_column('pdfLink')
+    searchVector = Column(TSVECTOR, Computed(SEARCH_VECTOR_SQL, persisted=True))
+    
+    @declared_attr
+    def __table_args__(cls):
+        # GIN trigram indexes for the case-insensitive "contains" filters
+        return tuple(
+            Index(
+                f"ix_{cls.__tablename__}_{col}_trgm",
+                col,
+                postgresql_using='gin',
+                postgresql_ops={col: 'gin_trgm_ops'}
+            )
+            for col in ('numPedido', 'nombreEmisor')
+        ) + (
+            # GIN index for the full-text search
+            Index(f"ix_{cls.__tablename__}_search", 'searchVector', postgresql_using='gin'),
+        )
+
+def _record_columns(table) -> list:
+    """The id and record columns of a table (without the search vector)"""
+    return [table.c.id] + [table.c[attr] for attr in COLUMN_SCHEMA]
+
+# Specific models for each table
+class OrdersCustomers(ERPRecord):
+    __tablename__ = 'pedidos_clientes'
+
+class DeliveryNotesCustomers(ERPRecord):
+    __tablename__ = 'albaranes_clientes'
+
+class InvoicesCustomers(ERPRecord):
+    __tablename__ = 'facturas_clientes'
+
+class OrdersSuppliers(ERPRecord):
+    __tablename__ = 'pedidos_proveedores'
+
+class DeliveryNotesSuppliers(ERPRecord):
+    __tablename__ = 'albaranes_proveedores'
+
+class InvoicesSuppliers(ERPRecord):
+    __tablename__ = 'facturas_proveedores'
+
+RECORD_MODELS = (OrdersCustomers, DeliveryNotesCustomers, InvoicesCustomers,
+                 OrdersSuppliers, DeliveryNotesSuppliers, InvoicesSuppliers)
+
+# Change counter per record table, bumped by a statement trigger on every INSERT, UPDATE, DELETE or TRUNCATE
+# (also by other processes): it is the table's version, probed without touching the table itself
+table_versions = sa.Table(
+    'erp_table_versions', Base.metadata,
+    Column('table_name', String(63), primary_key=True),
+    Column('version', sa.BigInteger, nullable=False, server_default='0')
+)
+
+BUMP_VERSION_FUNCTION = """
+CREATE OR REPLACE FUNCTION erp_bump_table_version() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO erp_table_versions (table_name, version) VALUES (TG_TABLE_NAME, 1)
+    ON CONFLICT (table_name) DO UPDATE SET version = erp_table_versions.version + 1;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql
+"""
+
+BUMP_VERSION_TRIGGER = """
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_trigger WHERE tgname = 'erp_bump_version' AND tgrelid = '{table}'::regclass) THEN
+        CREATE TRIGGER erp_bump_version AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON {table}
+        FOR EACH STATEMENT EXECUTE FUNCTION erp_bump_table_version();
+    END IF;
+END
+$$
+"""
+
+# Order lines are unique in the orders tables. Missing key parts count as '' (NULLs would never conflict).
+ORDER_LINE_INDEXES = {
+    model.__table__.name: Index(
+        f"uq_{model.__table__.name}_order_line",
+        *[sa.func.coalesce(model.__table__.c[attr], '') for attr, col in COLUMN_SCHEMA.items() if col in KEY_COLUMNS],
+        unique=True
+    )
+    for model in (OrdersCustomers, OrdersSuppliers)
+}
+
+def _pool_settings() -> Dict[str, Any]:
+    """Connection pool settings from DATABASE_CONFIG, overridable through environment variables"""
+    def env(name, default, cast):
+        value = os.getenv(name)
+        return default if value is None else cast(value)
+    return {
+        'pool_size': env('PG_POOL_SIZE', DATABASE_CONFIG['pg_pool_size'], int),
+        'max_overflow': env('PG_MAX_OVERFLOW', DATABASE_CONFIG['pg_max_overflow'], int),
+        'pool_pre_ping': env('PG_POOL_PRE_PING', DATABASE_CONFIG['pg_pool_pre_ping'], lambda v: v.lower() in ('1', 'true', 'yes')),
+        'pool_recycle': env('PG_POOL_RECYCLE', DATABASE_CONFIG['pg_pool_recycle'], int),
+        'query_cache_size': DATABASE_CONFIG['pg_query_cache_size']
+    }
+
+# One engine (connection pool) and session factory per database URL for the whole process
+_engines = {}
+_session_factories = {}
+_engines_lock = threading.Lock()
+# URLs whose schema was created by this process
+_migrated = set()
+
+def _auto_migrate() -> bool:
+    setting = os.getenv('PG_AUTO_MIGRATE')
+    return DATABASE_CONFIG['pg_auto_migrate'] if setting is None else setting.lower() in ('1', 'true', 'yes')
+
+def _create_schema(engine):
+    """
+    Creates the missing tables, search vector columns, version triggers and indexes
+    (existing ones are left as they are)
+    """
+    Base.metadata.create_all(engine)
+    # tables created before the full-text search get the generated column (filled for every row)
+    inspector = sa.inspect(engine)
+    quote = engine.dialect.identifier_preparer.quote
+    for table in (model.__table__ for model in RECORD_MODELS):
+        if 'searchVector' not in {column['name'] for column in inspector.get_columns(table.name)}:
+            with engine.begin() as conn:
+                conn.execute(sa.text(f'ALTER TABLE {quote(table.name)} ADD COLUMN "searchVector" tsvector '
+                                     f'GENERATED ALWAYS AS ({SEARCH_VECTOR_SQL}) STORED'))
+    with engine.begin() as conn:
+        conn.exec_driver_sql(BUMP_VERSION_FUNCTION)
+        for model in RECORD_MODELS:
+            conn.exec_driver_sql(BUMP_VERSION_TRIGGER.format(table=quote(model.__table__.name)))
+    # create_all skips existing tables, so add any missing indexes to them
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            try:
+                index.create(engine, checkfirst=True)
+            except sa.exc.IntegrityError:
+                # unique order lines: the table already holds duplicates
+                print(f"⚠️ {index.name} not created: {table.name} has duplicate order lines "
+                      f"(list them with `python manage.py find-duplicates`)")
+
+def get_engine(url: str):
+    """
+    Returns the process-wide engine for a database URL, creating it on first use.
+    The schema is created along with it unless automatic migration is disabled (see migrate).
+    """
+    with _engines_lock:
+        engine = _engines.get(url)
+        if engine is None:
+            engine = create_engine(url, **_pool_settings())
+            if _auto_migrate():
+                _create_schema(engine)
+                _migrated.add(url)
+            _engines[url] = engine
+            _session_factories[url] = sessionmaker(bind=engine)
+        return engine
+
+def migrate(url: str):
+    """Creates the missing tables and indexes of a database, once per process"""
+    engine = get_engine(url)
+    with _engines_lock:
+        if url not in _migrated:
+            _create_schema(engine)
+            _migrated.add(url)
+
+# Async engines (asyncpg) for concurrent reads, keyed by the sync database URL.
+# Their pools are bound to the event loop of `async_runner`, the only loop they are used from.
+_async_engines = {}
+
+def async_driver_available() -> bool:
+    """True when the optional asyncpg driver (and greenlet, needed by SQLAlchemy's asyncio layer) are installed"""
+    import importlib.util
+    return all(importlib.util.find_spec(module) is not None for module in ('asyncpg', 'greenlet'))
+
+def get_async_engine(url: str):
+    """Returns the process-wide asyncpg engine for a psycopg2 database URL (schema creation is left to get_engine)"""
+    from sqlalchemy.ext.asyncio import create_async_engine
+    with _engines_lock:
+        engine = _async_engines.get(url)
+        if engine is None:
+            engine = create_async_engine(url.replace('postgresql+psycopg2://', 'postgresql+asyncpg://', 1), **_pool_settings())
+            _async_engines[url] = engine
+        return engine
+
+class PgBackend:
+    """Persistence backend using PostgreSQL (Neon)"""
+    
+    # Appends of at least this many rows use COPY instead of INSERT
+    copy_threshold = 1000
+    # Rows per CSV buffer streamed to COPY ... FROM STDIN
+    copy_chunk_size = 100000
+    
+    def __init__(self, url: Optional[str] = None):
+        # Environment variables for connection (unless a SQLAlchemy URL is given, e.g. a scratch database)
+        self.host = os.getenv('PGHOST')
+        self.user = os.getenv('PGUSER') 
+        self.password = os.getenv('PGPASSWORD')
+        self.database = os.getenv('PGDATABASE')
+        
+        if url is None and not all([self.host, self.user, self.password, self.database]):
+            raise ValueError("Missing environment variables for PostgreSQL connection")
+        
+        # Shared engine and session factory (no long-lived session per backend)
+        self.url = url or f"postgresql+psycopg2://{self.user}:{self.password}@{self.host}/{self.database}"
+        self.engine = get_engine(self.url)
+        self.Session = _session_factories[self.url]
+    
+    @contextmanager
+    def _session(self):
+        """Short-lived session for one operation: commits on success, rolls back on error, always closes"""
+        with self.Session.begin() as session:
+            yield session
+    
+    def get_model_class(self, table_name: str):
+        """Returns the model class corresponding to the table name"""
+        model_map = {
+            'pedidos_clientes': OrdersCustomers,
+            'albaranes_clientes': DeliveryNotesCustomers,
+            'facturas_clientes': InvoicesCustomers,
+            'pedidos_proveedores': OrdersSuppliers,
+            'albaranes_proveedores': DeliveryNotesSuppliers,
+            'facturas_proveedores': InvoicesSuppliers,
+            # Names built by TableManager from (section, subsection)
+            'orders_customers': OrdersCustomers,
+            'delivery notes_customers': DeliveryNotesCustomers,
+            'invoices_customers': InvoicesCustomers,
+            'orders_suppliers': OrdersSuppliers,
+            'delivery notes_suppliers': DeliveryNotesSuppliers,
+            'invoices_suppliers': InvoicesSuppliers
+        }
+        return model_map.get(table_name)
+    
+    @staticmethod
+    def _version_select(table):
+        """Change counter of a table (0 before its first write): a primary key lookup of one counter row"""
+        counter = sa.select(table_versions.c.version).where(table_versions.c.table_name == table.name).scalar_subquery()
+        return sa.select(sa.func.coalesce(counter, 0))
+
+    def get_version(self, table_name: str):
+        """Returns the table's change counter, a cheap probe used to detect table changes"""
+        try:
+            model_class = self.get_model_class(table_name)
+            if model_class is None:
+                return None
+            with self.engine.connect() as conn:
+                return conn.execute(self._version_select(model_class.__table__)).scalar_one()
+        except Exception as e:
+            print(f"Error probing PostgreSQL {table_name}: {e}")
+            return None
+
+    @timed()
+    def load_data(self, table_name: str) -> pd.DataFrame:
+        """Loads data from PostgreSQL"""
+        try:
+            model_class = self.get_model_class(table_name)
+            if model_class is None:
+                return pd.DataFrame(columns=list(COLUMN_SCHEMA.values()))
+            # Bulk export through COPY, read back like a CSV table
+            buffer = io.StringIO()
+            self.copy_to(table_name, buffer)
+            buffer.seek(0)
+            return self._read_export(buffer)
+        except Exception as e:
+            print(f"Error loading from PostgreSQL {table_name}: {e}")
+            return pd.DataFrame(columns=list(COLUMN_SCHEMA.values()))
+
+    @staticmethod
+    def _read_export(buffer) -> pd.DataFrame:
+        """Parses a COPY export (CSVBackend layout plus id) into a typed DataFrame"""
+        df = pd.read_csv(buffer, dtype=str)
+        df['id'] = df['id'].astype(int)
+        return to_table_model(df)
+
+    @property
+    def supports_async(self) -> bool:
+        return async_driver_available()
+
+    async def get_version_async(self, table_name: str):
+        """get_version on the async engine"""
+        model_class = self.get_model_class(table_name)
+        if model_class is None:
+            return None
+        async with get_async_engine(self.url).connect() as conn:
+            return (await conn.execute(self._version_select(model_class.__table__))).scalar_one()
+
+    async def load_data_async(self, table_name: str) -> pd.DataFrame:
+        """
+        load_data on the async engine: the same COPY export, streamed through asyncpg,
+        so several tables can be exported at once from one event loop.
+        """
+        model_class = self.get_model_class(table_name)
+        if model_class is None:
+            return pd.DataFrame(columns=list(COLUMN_SCHEMA.values()))
+        select_sql = str(self._display_select(model_class.__table__).compile(
+            dialect=self.engine.dialect, compile_kwargs={'literal_binds': True}
+        ))
+        chunks = []
+
+        async def sink(data: bytes):
+            chunks.append(data)
+
+        async with get_async_engine(self.url).connect() as conn:
+            raw = await conn.get_raw_connection()
+            await raw.driver_connection.copy_from_query(select_sql, output=sink, format='csv', header=True)
+        df = self._read_export(io.BytesIO(b''.join(chunks)))
+        count('rows_read', len(df), backend='postgres')
+        count('bytes_read', sum(len(chunk) for chunk in chunks), backend='postgres')
+        return df
+    
+    @timed()
+    def query(self, table_name: str, filters: Optional[Dict[str, str]] = None, order_by: Optional[str] = None,
+              offset: int = 0, limit: Optional[int] = None):
+        """Returns (page, total_matches) with filters compiled to parameterized ILIKE and LIMIT/OFFSET SQL"""
+        try:
+            model_class = self.get_model_class(table_name)
+            if model_class is None:
+                return pd.DataFrame(columns=list(COLUMN_SCHEMA.values())), 0
+            table = model_class.__table__
+            reverse_mapping = {v: k for k, v in COLUMN_SCHEMA.items()}
+            conditions = self._filter_conditions(table, filters)
+            if order_by and order_by.lstrip('-') in reverse_mapping:
+                order_column = table.c[reverse_mapping[order_by.lstrip('-')]]
+                order_clause = [order_column.desc() if order_by.startswith('-') else order_column.asc(), table.c.id]
+            else:
+                order_clause = [table.c.id]
+            stmt = sa.select(*_record_columns(table)).where(*conditions).order_by(*order_clause).offset(offset)
+            if limit is not None:
+                stmt = stmt.limit(limit)
+            count_stmt = sa.select(sa.func.count()).select_from(table).where(*conditions)
+            with self.engine.connect() as conn:
+                total = conn.execute(count_stmt).scalar()
+                df = pd.read_sql(stmt, conn) if limit != 0 else pd.DataFrame(columns=[c.name for c in _record_columns(table)])
+            count('rows_read', len(df), backend='postgres')
+            column_rename = {k: v for k, v in COLUMN_SCHEMA.items() if k in df.columns}
+            return to_table_model(df.rename(columns=column_rename)), total
+        except Exception as e:
+            print(f"Error querying PostgreSQL {table_name}: {e}")
+            return pd.DataFrame(columns=list(COLUMN_SCHEMA.values())), 0
+    
+    @timed()
+    def search(self, table_name: str, text: str, filters: Optional[Dict[str, str]] = None,
+               offset: int = 0, limit: Optional[int] = None):
+        """
+        Returns (page, total_matches) of the rows whose search vector holds every word of `text`
+        (the last one as a prefix), ranked by ts_rank; answered from the GIN index, with the query filters.
+        """
+        try:
+            model_class = self.get_model_class(table_name)
+            terms, prefix = parse_query(text)
+            if model_class is None or not terms:
+                return pd.DataFrame(columns=list(COLUMN_SCHEMA.values())), 0
+            table = model_class.__table__
+            # words are runs of letters, digits and underscores: nothing to escape in the tsquery
+            query = sa.func.to_tsquery('simple', ' & '.join(terms[:-1] + [terms[-1] + (':*' if prefix else '')]))
+            conditions = [table.c.searchVector.op('@@')(query), *self._filter_conditions(table, filters)]
+            stmt = (sa.select(*_record_columns(table)).where(*conditions)
+                    .order_by(sa.func.ts_rank(table.c.searchVector, query).desc(), table.c.id).offset(offset))
+            if limit is not None:
+                stmt = stmt.limit(limit)
+            count_stmt = sa.select(sa.func.count()).select_from(table).where(*conditions)
+            with self.engine.connect() as conn:
+                total = conn.execute(count_stmt).scalar()
+                df = pd.read_sql(stmt, conn) if limit != 0 else pd.DataFrame(columns=[c.name for c in _record_columns(table)])
+            count('rows_read', len(df), backend='postgres')
+            column_rename = {k: v for k, v in COLUMN_SCHEMA.items() if k in df.columns}
+            return to_table_model(df.rename(columns=column_rename)), total
+        except Exception as e:
+            print(f"Error searching PostgreSQL {table_name}: {e}")
+            return pd.DataFrame(columns=list(COLUMN_SCHEMA.values())), 0
+
+    @staticmethod
+    def _filter_conditions(table, filters: Optional[Dict[str, str]]) -> list:
+        """Case-insensitive 'contains' filters as parameterized ILIKE conditions (empty values are ignored)"""
+        reverse_mapping = {v: k for k, v in COLUMN_SCHEMA.items()}
+        conditions = []
+        for col, value in (filters or {}).items():
+            if not value or col not in reverse_mapping:
+                continue
+            column = table.c[reverse_mapping[col]]
+            if not isinstance(column.type, String):
+                column = sa.cast(column, String)
+            escaped = value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+            conditions.append(column.ilike(f"%{escaped}%", escape='\\'))
+        return conditions
+
+    def iter_chunks(self, table_name: str, filters: Optional[Dict[str, str]] = None,
+                    chunk_size: Optional[int] = None) -> Iterator[pd.DataFrame]:
+        """
+        Yields the rows matching `filters` in id order, at most chunk_size rows at a time, from a
+        server-side cursor (one read-only transaction, so the chunks form a consistent snapshot).
+        """
+        model_class = self.get_model_class(table_name)
+        if model_class is None:
+            return
+        table = model_class.__table__
+        chunk_size = chunk_size or self.copy_chunk_size
+        stmt = sa.select(*_record_columns(table)).where(*self._filter_conditions(table, filters)).order_by(table.c.id)
+        column_rename = {k: v for k, v in COLUMN_SCHEMA.items()}
+        with self.engine.connect() as conn:
+            result = conn.execution_options(stream_results=True, max_row_buffer=chunk_size).execute(stmt)
+            columns = list(result.keys())
+            for rows in result.partitions(chunk_size):
+                count('rows_read', len(rows), backend='postgres')
+                yield to_table_model(pd.DataFrame(rows, columns=columns).rename(columns=column_rename))
+
+    @timed()
+    def aggregate(self, table_name: str, keys: List[str], value: str, labels: Optional[List[str]] = None) -> pd.DataFrame:
+        """aggregate_frame pushed down to SQL (GROUP BY on the key columns, empty keys as MISSING_KEY, min() for labels)"""
+        labels = labels or []
+        model_class = self.get_model_class(table_name)
+        if model_class is None:
+            return pd.DataFrame(columns=keys + [value] + labels)
+        table = model_class.__table__
+        db_columns = {col: db_col for db_col, col in COLUMN_SCHEMA.items()}
+        key_columns = [sa.func.coalesce(sa.func.nullif(sa.func.trim(table.c[db_columns[col]]), ''), MISSING_KEY) for col in keys]
+        stmt = (
+            sa.select(
+                *[column.label(col) for column, col in zip(key_columns, keys)],
+                sa.func.coalesce(sa.func.sum(table.c[db_columns[value]]), 0).label(value),
+                *[sa.func.min(table.c[db_columns[col]]).label(col) for col in labels]
+            )
+            .group_by(*key_columns)
+        )
+        with self.engine.connect() as conn:
+            df = pd.read_sql(stmt, conn)
+        df[value] = df[value].astype('int64')
+        return df
+
+    @timed()
+    def save_data(self, table_name: str, dataframe: pd.DataFrame) -> bool:
+        """Saves DataFrame to PostgreSQL"""
+        try:
+            model_class = self.get_model_class(table_name)
+            if model_class is None:
+                return False
+            # Clear table and bulk load new data in one transaction
+            self.copy_from(table_name, self._chunks(dataframe, self.copy_chunk_size), replace=True)
+            return True
+        except Exception as e:
+            print(f"Error saving to PostgreSQL {table_name}: {e}")
+            return False
+
+    @staticmethod
+    def _to_db_columns(records: pd.DataFrame) -> pd.DataFrame:
+        """Renames display columns to DB columns and parses dates (datetime64) and quantities"""
+        reverse_mapping = {v: k for k, v in COLUMN_SCHEMA.items()}
+        df_db = records.rename(columns=reverse_mapping)
+        df_db = df_db[[c for c in df_db.columns if c in COLUMN_SCHEMA]]
+        for col in ['fechaPedido', 'fechaEntrega']:
+            if col in df_db.columns:
+                df_db[col] = parse_dates(df_db[col])
+        if 'cantidad' in df_db.columns:
+            df_db['cantidad'] = pd.to_numeric(df_db['cantidad'], errors='coerce').fillna(0).astype(int)
+        return df_db
+
+    def _to_db_frame(self, records: pd.DataFrame) -> pd.DataFrame:
+        """Converts display columns/values to DB columns with native dates and NULLs"""
+        df_db = self._to_db_columns(records)
+        for col in ['fechaPedido', 'fechaEntrega']:
+            if col in df_db.columns:
+                df_db[col] = df_db[col].dt.date
+        return df_db.astype(object).where(df_db.notna(), None)
+
+    def _display_select(self, table):
+        """SELECT returning display column names, with dates formatted as DD/MM/YYYY"""
+        columns = [table.c.id]
+        for db_col, col in COLUMN_SCHEMA.items():
+            if isinstance(table.c[db_col].type, Date):
+                columns.append(sa.func.to_char(table.c[db_col], 'DD/MM/YYYY').label(col))
+            else:
+                columns.append(table.c[db_col].label(col))
+        return sa.select(*columns).order_by(table.c.id)
+
+    @timed()
+    def copy_to(self, table_name: str, file_obj) -> int:
+        """
+        Streams a whole table to a text file object with COPY ... TO STDOUT, in the CSV layout
+        used by CSVBackend (display column names, DD/MM/YYYY dates, plus the id column).
+        Returns the number of rows exported.
+        """
+        model_class = self.get_model_class(table_name)
+        if model_class is None:
+            raise ValueError(f"Unknown table {table_name}")
+        select_sql = str(self._display_select(model_class.__table__).compile(
+            dialect=self.engine.dialect, compile_kwargs={'literal_binds': True}
+        ))
+        raw = self.engine.raw_connection()
+        try:
+            with raw.cursor() as cursor:
+                start = file_obj.tell() if file_obj.seekable() else 0
+                cursor.copy_expert(f"COPY ({select_sql}) TO STDOUT WITH (FORMAT csv, HEADER)", file_obj)
+                rows = cursor.rowcount
+            raw.commit()
+            count('rows_read', rows, backend='postgres')
+            if file_obj.seekable():
+                count('bytes_read', file_obj.tell() - start, backend='postgres')
+            return rows
+        finally:
+            raw.close()
+
+    @timed()
+    def copy_from(self, table_name: str, chunks, replace: bool = False) -> int:
+        """
+        Bulk loads an iterable of display DataFrames with COPY ... FROM STDIN in one transaction,
+        streaming one CSV buffer per chunk. With replace=True the table is truncated first.
+        Returns the number of rows loaded.
+        """
+        model_class = self.get_model_class(table_name)
+        if model_class is None:
+            raise ValueError(f"Unknown table {table_name}")
+        quote = self.engine.dialect.identifier_preparer.quote
+        table_sql = quote(model_class.__table__.name)
+        raw = self.engine.raw_connection()
+        loaded = written = 0
+        try:
+            with raw.cursor() as cursor:
+                if replace:
+                    cursor.execute(f"TRUNCATE {table_sql}")
+                for chunk in chunks:
+                    df_db = self._to_db_columns(chunk)
+                    if df_db.empty:
+                        continue
+                    buffer = io.StringIO()
+                    df_db.to_csv(buffer, index=False, header=False, date_format='%Y-%m-%d')
+                    buffer.seek(0)
+                    column_sql = ", ".join(quote(col) for col in df_db.columns)
+                    cursor.copy_expert(f"COPY {table_sql} ({column_sql}) FROM STDIN WITH (FORMAT csv)", buffer)
+                    loaded += len(df_db)
+                    written += buffer.tell()
+            raw.commit()
+            count('rows_written', loaded, backend='postgres')
+            count('bytes_written', written, backend='postgres')
+            return loaded
+        except Exception:
+            raw.rollback()
+            raise
+        finally:
+            raw.close()
+
+    @staticmethod
+    def _chunks(dataframe: pd.DataFrame, chunk_size: int):
+        for start in range(0, len(dataframe), chunk_size):
+            yield dataframe.iloc[start:start + chunk_size]
+
+    @timed()
+    def append_records(self, table_name: str, records: pd.DataFrame) -> bool:
+        """Inserts records into PostgreSQL with a single batched INSERT (COPY for large batches)"""
+        try:
+            model_class = self.get_model_class(table_name)
+            if model_class is None:
+                return False
+            if len(records) >= self.copy_threshold:
+                self.copy_from(table_name, self._chunks(records, self.copy_chunk_size))
+                return True
+            rows = self._to_db_frame(records).to_dict(orient='records')
+            if rows:
+                with self._session() as session:
+                    session.execute(sa.insert(model_class.__table__), rows)
+            count('rows_written', len(rows), backend='postgres')
+            return True
+        except Exception as e:
+            print(f"Error appending to PostgreSQL {table_name}: {e}")
+            return False
+
+    @timed()
+    def apply_changes(self, table_name: str, changes, unique_lines: bool = False) -> bool:
+        """
+        Applies a ChangeSet (keyed on `id`) as batched UPDATE/INSERT/DELETE statements in one transaction.
+        Returns False without writing if the table changed since `changes.base_version`, or with
+        `unique_lines` if an insert repeats a saved order line (or an earlier insert). Without the unique
+        order-line index, the table is locked against other writers for that check.
+        """
+        try:
+            model_class = self.get_model_class(table_name)
+            if model_class is None:
+                return False
+            table = model_class.__table__
+            check_lines = unique_lines and not changes.inserts.empty
+            with self._session() as session:
+                if check_lines and not self.has_order_line_index(table_name):
+                    # before the counter row lock, in the order other writers take them
+                    quote = self.engine.dialect.identifier_preparer.quote
+                    session.execute(sa.text(f"LOCK TABLE {quote(table.name)} IN SHARE ROW EXCLUSIVE MODE"))
+                if changes.base_version is not None and changes.is_stale(self._lock_version(session, table)):
+                    print(f"Not applying changes to PostgreSQL {table_name}: the table changed since it was read")
+                    return False
+                if check_lines and self._saved_lines(session, table, changes.inserts).any():
+                    print(f"Not applying changes to PostgreSQL {table_name}: a new row repeats a saved order line")
+                    return False
+                self._apply_changes(session, table, changes)
+            count('rows_written', len(changes.updates) + len(changes.inserts), backend='postgres')
+            return True
+        except Exception as e:
+            print(f"Error applying changes to PostgreSQL {table_name}: {e}")
+            return False
+
+    def _lock_version(self, session, table):
+        """
+        Locks the table's change counter row until the transaction ends and returns it (the version).
+        Other writers bump that row at the end of each statement, so they wait for this transaction.
+        """
+        from sqlalchemy.dialects.postgresql import insert
+        session.execute(insert(table_versions).values(table_name=table.name, version=0).on_conflict_do_nothing())
+        return session.execute(
+            sa.select(table_versions.c.version).where(table_versions.c.table_name == table.name).with_for_update()
+        ).scalar_one()
+
+    def _saved_lines(self, session, table, records: pd.DataFrame) -> np.ndarray:
+        """True for records whose order line is in the table or repeats an earlier record"""
+        keys = order_line_keys(records)
+        reverse_mapping = {v: k for k, v in COLUMN_SCHEMA.items()}
+        columns = [sa.func.coalesce(table.c[reverse_mapping[col]], '') for col in KEY_COLUMNS]
+        wanted = [tuple(key.split('\x1f')) for key in keys.unique()]
+        saved = {'\x1f'.join(row) for row in session.execute(sa.select(*columns).where(sa.tuple_(*columns).in_(wanted)))}
+        return keys.duplicated().to_numpy() | keys.isin(saved).to_numpy()
+
+    def _apply_changes(self, session, table, changes):
+        """Runs the DELETE, UPDATE and INSERT batches of a ChangeSet inside an open session"""
+        if changes.deletes:
+            session.execute(sa.delete(table).where(table.c.id.in_([int(k) for k in changes.deletes])))
+        if changes.updates:
+            # Group rows by the set of edited columns so each group is one executemany UPDATE
+            updates = pd.DataFrame.from_dict(changes.updates, orient='index')
+            db_updates = self._to_db_frame(updates)
+            groups = {}
+            for key, row in zip(updates.index, db_updates.to_dict(orient='records')):
+                edited = {col: row[col] for col in row if COLUMN_SCHEMA[col] in changes.updates[key]}
+                params = {f"v_{col}": val for col, val in edited.items()}
+                groups.setdefault(tuple(sorted(edited)), []).append({'_id': int(key), **params})
+            for columns, rows in groups.items():
+                stmt = (
+                    sa.update(table)
+                    .where(table.c.id == sa.bindparam('_id'))
+                    .values({col: sa.bindparam(f"v_{col}") for col in columns})
+                )
+                session.execute(stmt, rows)
+        rows = self._to_db_frame(changes.inserts).to_dict(orient='records')
+        if rows:
+            session.execute(sa.insert(table), rows)
+
+    def has_order_line_index(self, table_name: str) -> bool:
+        """True if the table has its unique order-line index (not created while the table holds duplicates)"""
+        model_class = self.get_model_class(table_name)
+        index = ORDER_LINE_INDEXES.get(model_class.__table__.name) if model_class is not None else None
+        if index is None:
+            return False
+        with self.engine.connect() as conn:
+            return bool(conn.execute(sa.text("SELECT to_regclass(:name) IS NOT NULL"), {'name': index.name}).scalar())
+
+    def _stage(self, cursor, table, records: pd.DataFrame, fields: Optional[np.ndarray] = None) -> List[str]:
+        """
+        Copies records into a temporary table (dropped at commit) with their batch position in `_pos`
+        (and `fields`, a per-record integer, in `_fields` if given). Returns the DB columns staged.
+        """
+        quote = self.engine.dialect.identifier_preparer.quote
+        df_db = self._to_db_columns(records)
+        columns = list(df_db.columns)
+        column_sql = ", ".join(quote(col) for col in columns)
+        extra = {'_pos': np.arange(len(df_db))}
+        if fields is not None:
+            extra['_fields'] = fields
+        cursor.execute(f"CREATE TEMP TABLE erp_staging ON COMMIT DROP AS "
+                       f"SELECT {column_sql} FROM {quote(table.name)} WITH NO DATA")
+        for name in extra:
+            cursor.execute(f"ALTER TABLE erp_staging ADD COLUMN {name} bigint")
+        buffer = io.StringIO()
+        df_db.assign(**extra).to_csv(buffer, index=False, header=False, date_format='%Y-%m-%d')
+        buffer.seek(0)
+        cursor.copy_expert(f"COPY erp_staging ({column_sql}, {', '.join(extra)}) FROM STDIN WITH (FORMAT csv)", buffer)
+        count('bytes_written', buffer.tell(), backend='postgres')
+        return columns
+
+    @timed()
+    def upsert_records(self, table_name: str, records: pd.DataFrame, fields: pd.DataFrame,
+                       insertable: Optional[np.ndarray] = None, all_or_nothing: bool = False) -> np.ndarray:
+        """
+        Updates the rows holding each record's order line with the fields it supplied (True in `fields`,
+        one column per updatable column) and inserts the unmatched records `insertable` allows (default: all),
+        in one transaction: the batch is staged with COPY, matched rows are updated with one UPDATE ... FROM,
+        and the others inserted with one INSERT ... SELECT. With the unique order-line index, a line inserted
+        meanwhile by another transaction is skipped (ON CONFLICT DO NOTHING) and updated afterwards; without
+        it, the table is locked against other writers for the transaction. With `all_or_nothing`, the
+        transaction is rolled back if an unmatched record is not insertable.
+        Each order line at most once per batch. Returns a mask of the matched (updated) records.
+        """
+        model_class = self.get_model_class(table_name)
+        if model_class is None:
+            raise IOError(f"Unknown table {table_name}")
+        table = model_class.__table__
+        if insertable is None:
+            insertable = np.ones(len(records), dtype=bool)
+        quote = self.engine.dialect.identifier_preparer.quote
+        table_sql = quote(table.name)
+        reverse_mapping = {v: k for k, v in COLUMN_SCHEMA.items()}
+        key_attrs = [reverse_mapping[col] for col in KEY_COLUMNS]
+        columns = [col for col in fields.columns if col in reverse_mapping]
+        # one bit per updatable column supplied by the record
+        bits = np.zeros(len(records), dtype='int64')
+        for bit, col in enumerate(columns):
+            bits |= fields[col].to_numpy(dtype='int64') << bit
+        # a record supplying no field still reports its matched row (no-op update of a key column)
+        set_sql = ", ".join([f"{quote(reverse_mapping[col])} = CASE WHEN s._fields & {1 << bit} <> 0 "
+                             f"THEN s.{quote(reverse_mapping[col])} ELSE t.{quote(reverse_mapping[col])} END"
+                             for bit, col in enumerate(columns)] or [f"{quote(key_attrs[0])} = t.{quote(key_attrs[0])}"])
+        match_sql = " AND ".join(f"coalesce(t.{quote(attr)}, '') = coalesce(s.{quote(attr)}, '')" for attr in key_attrs)
+        update_sql = f"UPDATE {table_sql} t SET {set_sql} FROM erp_staging s WHERE {match_sql} AND s._pos = ANY(%s) RETURNING s._pos"
+        has_index = self.has_order_line_index(table_name)
+        matched = np.zeros(len(records), dtype=bool)
+        raw = self.engine.raw_connection()
+        try:
+            with raw.cursor() as cursor:
+                if not has_index:
+                    cursor.execute(f"LOCK TABLE {table_sql} IN SHARE ROW EXCLUSIVE MODE")
+                db_columns = self._stage(cursor, table, records, bits)
+                cursor.execute(update_sql, (list(range(len(records))),))
+                matched[[row[0] for row in cursor.fetchall()]] = True
+                if all_or_nothing and (~matched & ~insertable).any():
+                    raw.rollback()
+                    return matched
+                column_sql = ", ".join(quote(col) for col in db_columns)
+                staged_sql = ", ".join(f"s.{quote(col)}" for col in db_columns)
+                returning_sql = ", ".join(f"coalesce({quote(attr)}, '')" for attr in key_attrs)
+                conflict_sql = ""
+                if has_index:
+                    index_sql = ", ".join(f"coalesce({quote(attr)}, '')" for attr in key_attrs)
+                    conflict_sql = f" ON CONFLICT ({index_sql}) DO NOTHING"
+                positions = np.flatnonzero(~matched & insertable)
+                cursor.execute(f"INSERT INTO {table_sql} ({column_sql}) SELECT {staged_sql} FROM erp_staging s "
+                               f"WHERE s._pos = ANY(%s) ORDER BY s._pos{conflict_sql} "
+                               f"RETURNING {returning_sql}", (positions.tolist(),))
+                inserted_keys = ['\x1f'.join(row) for row in cursor.fetchall()]
+                # lines inserted meanwhile by another transaction (skipped above): update them now
+                keys = order_line_keys(records).to_numpy()
+                conflicted = positions[~pd.Index(keys[positions]).isin(inserted_keys)]
+                if len(conflicted):
+                    cursor.execute(update_sql, (conflicted.tolist(),))
+                    matched[[row[0] for row in cursor.fetchall()]] = True
+            raw.commit()
+        except Exception as e:
+            raw.rollback()
+            print(f"Error upserting into PostgreSQL {table_name}: {e}")
+            raise IOError(f"Could not upsert into {table_name}: {e}") from e
+        finally:
+            raw.close()
+        count('rows_written', len(records), backend='postgres')
+        return matched
+
+    @timed()
+    def append_unique(self, table_name: str, records: pd.DataFrame, all_or_nothing: bool = False) -> Optional[np.ndarray]:
+        """
+        Inserts the records whose order line is not saved yet and does not repeat an earlier record of
+        the batch, checked by the INSERT itself: ON CONFLICT DO NOTHING with the unique order-line index,
+        or NOT EXISTS under a SHARE ROW EXCLUSIVE table lock without it. With `all_or_nothing`, the
+        transaction is rolled back if a record was skipped.
+        Returns the mask of the duplicate records, None if the write failed.
+        """
+        model_class = self.get_model_class(table_name)
+        if model_class is None:
+            return None
+        table = model_class.__table__
+        quote = self.engine.dialect.identifier_preparer.quote
+        table_sql = quote(table.name)
+        reverse_mapping = {v: k for k, v in COLUMN_SCHEMA.items()}
+        key_attrs = [reverse_mapping[col] for col in KEY_COLUMNS]
+        keys = order_line_keys(records).to_numpy()
+        first = np.flatnonzero(~pd.Series(keys).duplicated().to_numpy())
+        has_index = self.has_order_line_index(table_name)
+        raw = self.engine.raw_connection()
+        try:
+            with raw.cursor() as cursor:
+                if has_index:
+                    index_sql = ", ".join(f"coalesce({quote(attr)}, '')" for attr in key_attrs)
+                    check_sql, conflict_sql = "", f" ON CONFLICT ({index_sql}) DO NOTHING"
+                else:
+                    cursor.execute(f"LOCK TABLE {table_sql} IN SHARE ROW EXCLUSIVE MODE")
+                    match_sql = " AND ".join(f"coalesce(t.{quote(attr)}, '') = coalesce(s.{quote(attr)}, '')" for attr in key_attrs)
+                    check_sql, conflict_sql = f" AND NOT EXISTS (SELECT 1 FROM {table_sql} t WHERE {match_sql})", ""
+                db_columns = self._stage(cursor, table, records)
+                column_sql = ", ".join(quote(col) for col in db_columns)
+                staged_sql = ", ".join(f"s.{quote(col)}" for col in db_columns)
+                returning_sql = ", ".join(f"coalesce({quote(attr)}, '')" for attr in key_attrs)
+                cursor.execute(f"INSERT INTO {table_sql} ({column_sql}) SELECT {staged_sql} FROM erp_staging s "
+                               f"WHERE s._pos = ANY(%s){check_sql} ORDER BY s._pos{conflict_sql} "
+                               f"RETURNING {returning_sql}", (first.tolist(),))
+                inserted_keys = ['\x1f'.join(row) for row in cursor.fetchall()]
+                duplicate = np.ones(len(records), dtype=bool)
+                duplicate[first] = ~pd.Index(keys[first]).isin(inserted_keys)
+                if all_or_nothing and duplicate.any():
+                    raw.rollback()
+                    return duplicate
+            raw.commit()
+        except Exception as e:
+            raw.rollback()
+            print(f"Error appending to PostgreSQL {table_name}: {e}")
+            return None
+        finally:
+            raw.close()
+        count('rows_written', len(inserted_keys), backend='postgres')
+        return duplicate
+
+    @timed()
+    def find_duplicates(self, table_name: str) -> pd.DataFrame:
+        """Rows sharing their order line with another row (as modules.dedup.find_duplicates), counted in SQL"""
+        model_class = self.get_model_class(table_name)
+        if model_class is None:
+            return find_duplicates(pd.DataFrame(columns=list(COLUMN_SCHEMA.values())))
+        table = model_class.__table__
+        key = [sa.func.coalesce(table.c[attr], '') for attr, col in COLUMN_SCHEMA.items() if col in KEY_COLUMNS]
+        lines = self._display_select(table).add_columns(
+            sa.func.count().over(partition_by=key).label('Copies'),
+            sa.func.min(table.c.id).over(partition_by=key).label('first_id')
+        ).subquery()
+        stmt = sa.select(lines).where(lines.c.Copies > 1).order_by(lines.c.first_id, lines.c.id)
+        with self.engine.connect() as conn:
+            df = pd.read_sql(stmt, conn)
+        df = to_table_model(df.drop(columns='first_id'))
+        df['Copies'] = df['Copies'].astype('int64')
+        return df
+
@@ -0,0 +1,65 @@
+"""
+Reconciliation view module for DemoERP
+Provides the UI for matching orders with delivery notes and invoices.
+"""
+import streamlit as st
+from config import LIMITS
+from modules.reconciliation import STATUSES, STATUS_MATCHED, reconciler, summarize
+from modules.instrumentation import timed
+
+@timed('view.reconciliation')
+def show_reconciliation(section: str, table_manager):
+    """
+    Render the order-to-invoice reconciliation for a section.
+    Each run only re-reads the documents changed since the previous one.
+    """
+    st.markdown('<div class="section-header"><h3>🔗 Order Reconciliation</h3></div>', unsafe_allow_html=True)
+    st.caption("Order lines (sender code, order number, EAN code) matched against delivery notes and invoices.")
+    col_run, col_reset = st.columns([1, 1])
+    with col_run:
+        run_clicked = st.button("🔄 Reconcile", key=f"reconcile_{section}")
+    with col_reset:
+        if st.button("♻️ Full Re-run", key=f"reconcile_reset_{section}", type="secondary"):
+            reconciler.reset(table_manager, section)
+            run_clicked = True
+    result_key = f"reconciliation_{section}"
+    if run_clicked:
+        with st.spinner("Reconciling documents..."):
+            st.session_state[result_key] = reconciler.run(table_manager, section)
+    if result_key not in st.session_state:
+        st.info("ℹ️ Press 'Reconcile' to match orders, delivery notes and invoices")
+        return
+    lines, stats = st.session_state[result_key]
+    if lines.empty:
+        st.info(f"ℹ️ No order lines in {section}")
+        return
+    counts = summarize(lines)
+    for column, status in zip(st.columns(len(STATUSES)), STATUSES):
+        column.metric(status, f"{counts[status]:,}")
+    documents = ", ".join(stats['documents_read']) or "none (no changes)"
+    st.caption(f"Documents re-read: {documents} • {stats['lines_reclassified']:,} lines re-classified in {stats['seconds']:.2f}s")
+    selected = st.multiselect(
+        "Show statuses",
+        STATUSES,
+        default=[status for status in STATUSES if status != STATUS_MATCHED],
+        key=f"reconciliation_statuses_{section}"
+    )
+    shown = lines[lines['Status'].isin(selected)]
+    limit = LIMITS['max_records_display']
+    if len(shown) > limit:
+        st.markdown(f"**Showing {limit:,} of {len(shown):,} lines**")
+    st.dataframe(
+        shown.head(limit),
+        use_container_width=True,
+        hide_index=True,
+        column_config={
+            "Cod_Emisor": st.column_config.TextColumn("Sender Code"),
+            "Num_Pedido": st.column_config.TextColumn("Order Number"),
+            "Cod_Art_EAN": st.column_config.TextColumn("EAN Code"),
+            "Nombre_Emisor": st.column_config.TextColumn("Sender Name"),
+            "Ordered": st.column_config.NumberColumn("Ordered", format="%d"),
+            "Delivered": st.column_config.NumberColumn("Delivered", format="%d"),
+            "Invoiced": st.column_config.NumberColumn("Invoiced", format="%d"),
+            "Status": st.column_config.TextColumn("Status")
+        }
+    )
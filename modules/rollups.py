@@ -0,0 +1,178 @@
+"""
+KPI rollups module for DemoERP
+Materialized aggregates per table: quantity and on-time lines by sender, type and paper
+per day/week/month of the order date, kept up to date on every save/append so reports
+read one row per group instead of scanning the table.
+"""
+import numpy as np
+import pandas as pd
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from config import KPI_CONFIG
+from modules.dates import parse_dates
+from modules.derived_store import DerivedStore
+
+# Group columns of every rollup (the period comes first)
+DIMENSIONS = ['Nombre_Emisor', 'Tipo', 'Papel']
+GROUP_COLUMNS = ['Period'] + DIMENSIONS
+
+# Additive measures: summed quantity, order lines, lines with both dates, lines delivered on time
+MEASURES = ['Quantity', 'Lines', 'Dated', 'On_Time']
+
+GRAINS = KPI_CONFIG['grains']
+
+def period_start(dates: pd.Series, grain: str) -> np.ndarray:
+    """First day of the day/week (Monday)/month period of each date (NaT stays NaT)"""
+    days = pd.Series(dates).to_numpy(dtype='datetime64[ns]').astype('datetime64[D]')
+    if grain == 'month':
+        start = days.astype('datetime64[M]').astype('datetime64[D]')
+    elif grain == 'week':
+        # 1970-01-01 was a Thursday: (days since epoch + 3) % 7 is the weekday with Monday = 0
+        start = days - ((days.astype('int64') + 3) % 7).astype('timedelta64[D]')
+    elif grain == 'day':
+        start = days
+    else:
+        raise ValueError(f"Unknown grain: {grain}")
+    start[np.isnat(days)] = np.datetime64('NaT')
+    return start.astype('datetime64[ns]')
+
+def empty_rollup() -> pd.DataFrame:
+    """Rollup with no groups"""
+    frame = pd.DataFrame({col: pd.Series(dtype=object) for col in DIMENSIONS})
+    frame.insert(0, 'Period', pd.Series(dtype='datetime64[ns]'))
+    for col in MEASURES:
+        frame[col] = pd.Series(dtype='int64')
+    return frame
+
+def _group(frame: pd.DataFrame) -> pd.DataFrame:
+    """Sums the measures per group; dimension values are plain strings ('' when missing)"""
+    if frame.empty:
+        return empty_rollup()
+    grouped = frame.groupby(GROUP_COLUMNS, dropna=False, observed=True, sort=False)[MEASURES].sum().reset_index()
+    for col in DIMENSIONS:
+        grouped[col] = grouped[col].astype(object).where(grouped[col].notna(), '').astype(str).astype(object)
+    if grouped.duplicated(GROUP_COLUMNS).any():
+        # missing and empty dimension values only become the same group once normalized
+        grouped = grouped.groupby(GROUP_COLUMNS, dropna=False, sort=False)[MEASURES].sum().reset_index()
+    return grouped
+
+def rollup_frame(df: pd.DataFrame, grain: str = 'day', on_time_days: Optional[int] = None) -> pd.DataFrame:
+    """
+    Aggregates order lines into a rollup (GROUP_COLUMNS + MEASURES) at a grain.
+    A line is on time when Fecha_Entrega falls within `on_time_days` days of Fecha_Pedido.
+    """
+    if df is None or df.empty:
+        return empty_rollup()
+    on_time_days = KPI_CONFIG['on_time_days'] if on_time_days is None else on_time_days
+    missing = pd.Series(pd.NaT, index=df.index, dtype='datetime64[ns]')
+    ordered = parse_dates(df['Fecha_Pedido']) if 'Fecha_Pedido' in df.columns else missing
+    delivered = parse_dates(df['Fecha_Entrega']) if 'Fecha_Entrega' in df.columns else missing
+    lead_days = (delivered - ordered).dt.days
+    dated = lead_days.notna()
+    quantity = pd.to_numeric(df['Cantidad'], errors='coerce') if 'Cantidad' in df.columns else pd.Series(0, index=df.index)
+    frame = pd.DataFrame({
+        'Period': period_start(ordered, grain),
+        **{col: (df[col] if col in df.columns else pd.Series('', index=df.index)).to_numpy() for col in DIMENSIONS},
+        'Quantity': quantity.fillna(0).astype('int64').to_numpy(),
+        'Lines': np.ones(len(df), dtype='int64'),
+        'Dated': dated.astype('int64').to_numpy(),
+        'On_Time': (dated & lead_days.between(0, on_time_days)).astype('int64').to_numpy()
+    })
+    return _group(frame)
+
+def coarsen(rollup: pd.DataFrame, grain: str) -> pd.DataFrame:
+    """Re-aggregates a finer rollup (e.g. per day) to a coarser grain, in O(groups)"""
+    if rollup.empty:
+        return empty_rollup()
+    frame = rollup.copy()
+    frame['Period'] = period_start(frame['Period'], grain)
+    return _group(frame)
+
+def combine(rollup: pd.DataFrame, delta: pd.DataFrame) -> pd.DataFrame:
+    """Adds a (possibly negative) delta rollup; groups left without lines are dropped"""
+    if delta.empty:
+        return rollup
+    combined = _group(pd.concat([rollup, delta], ignore_index=True))
+    return combined[combined['Lines'] > 0].reset_index(drop=True)
+
+def build_rollups(df: pd.DataFrame) -> Dict[str, pd.DataFrame]:
+    """Rollups of a table at every grain (the coarser grains are derived from the daily one)"""
+    day = rollup_frame(df, 'day')
+    return {grain: day if grain == 'day' else coarsen(day, grain) for grain in GRAINS}
+
+def _delta(added: Optional[pd.DataFrame], removed: Optional[pd.DataFrame]) -> Dict[str, pd.DataFrame]:
+    parts = []
+    if added is not None and not added.empty:
+        parts.append(rollup_frame(added, 'day'))
+    if removed is not None and not removed.empty:
+        negative = rollup_frame(removed, 'day')
+        negative[MEASURES] = -negative[MEASURES]
+        parts.append(negative)
+    day = _group(pd.concat(parts, ignore_index=True)) if parts else empty_rollup()
+    return {grain: day if grain == 'day' else coarsen(day, grain) for grain in GRAINS}
+
+def changed_rows(current: pd.DataFrame, changes) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Rows a ChangeSet removes and adds, given the table before it is applied.
+    Updated rows count as removed with their old values and added with their new ones;
+    keys are matched on the `id` column (PostgreSQL) or the row position (CSV/columnar).
+    Both frames are indexed by row key; inserts are numbered on from the length of the table.
+    """
+    table = current.set_index('id', drop=False) if 'id' in current.columns else current.reset_index(drop=True)
+    updated_keys = [key for key in changes.updates if key in table.index]
+    deleted_keys = [key for key in changes.deletes if key in table.index]
+    removed = table.loc[updated_keys + deleted_keys]
+    updated = table.loc[updated_keys].astype(object)
+    for key in updated_keys:
+        for col, value in changes.updates[key].items():
+            if col in updated.columns:
+                updated.at[key, col] = value
+    inserts = changes.inserts.astype(object).set_axis(pd.RangeIndex(len(table), len(table) + len(changes.inserts)))
+    added = pd.concat([updated, inserts]) if not inserts.empty else updated
+    return removed, added
+
+def on_time_rate(rollup: pd.DataFrame) -> float:
+    """Share of dated order lines delivered on time (0 when no line has both dates)"""
+    dated = rollup['Dated'].sum()
+    return float(rollup['On_Time'].sum() / dated) if dated else 0.0
+
+def summarize_by(rollup: pd.DataFrame, by: List[str]) -> pd.DataFrame:
+    """Totals of a rollup per the given group columns, with the on-time rate of each group"""
+    if rollup.empty:
+        summary = pd.DataFrame(columns=by + MEASURES)
+    else:
+        summary = rollup.groupby(by, dropna=False, sort=True)[MEASURES].sum().reset_index()
+    dated = summary['Dated'].astype('float64')
+    summary['On_Time_Rate'] = (summary['On_Time'].astype('float64') / dated.where(dated > 0)).fillna(0.0)
+    return summary
+
+@dataclass
+class TableRollups:
+    """Materialized rollups of one table, per grain, and the table version they reflect"""
+    version: Any
+    grains: Dict[str, pd.DataFrame] = field(default_factory=dict)
+
+class RollupStore(DerivedStore):
+    """
+    Materialized rollups shared by all sessions of the process (see DerivedStore).
+    Tables are aggregated on first read; afterwards appends and record edits apply a delta
+    computed from the written rows only, and a full save re-aggregates the frame it saved.
+    """
+
+    def _build(self, version, dataframe: pd.DataFrame) -> TableRollups:
+        return TableRollups(version, build_rollups(dataframe))
+
+    def _delta(self, added: Optional[pd.DataFrame], removed: Optional[pd.DataFrame]) -> Dict[str, pd.DataFrame]:
+        return _delta(added, removed)
+
+    def _update(self, entry: TableRollups, delta: Dict[str, pd.DataFrame]) -> bool:
+        entry.grains = {grain: combine(entry.grains[grain], delta[grain]) for grain in GRAINS}
+        return True
+
+    def get(self, table_manager, section: str, subsection: str, grain: str = 'day') -> pd.DataFrame:
+        """Rollup of a section/subsection at a grain, aggregating the table only if it changed elsewhere"""
+        return self._current(table_manager, section, subsection).grains[grain]
+
+# Shared by every TableManager in the process
+rollup_store = RollupStore()
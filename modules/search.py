@@ -0,0 +1,340 @@
+"""
+Full-text search module for DemoERP
+Ranked search over the free-text columns of a table (descriptions, codes, names). File tables
+(CSV, columnar) get an in-memory inverted index per table, built on first search and updated with
+the rows of every write; PostgreSQL searches a tsvector column with a GIN index instead (see pg_backend).
+"""
+import bisect
+import math
+import re
+import numpy as np
+import pandas as pd
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+from config import SEARCH_CONFIG
+from modules.derived_store import DerivedStore
+
+SEARCH_COLUMNS = SEARCH_CONFIG['columns']
+
+# BM25 parameters: term frequency saturation and document length normalization
+K1 = 1.2
+B = 0.75
+
+# Words in at most this share of the rows are looked up through the rows grouped by value
+# (cost proportional to the matches); more frequent ones are counted over every row
+SPARSE_RATIO = 0.05
+
+# Rows grouped by value are regrouped once the rows appended since exceed this share of the table
+GROUPED_TAIL_RATIO = 0.1
+
+# New words sorted into the prefix list one by one up to this many; past it the list is re-sorted
+_INSORT_LIMIT = 1000
+
+_WORD = re.compile(r'\w+')
+
+def tokenize(text) -> List[str]:
+    """Lowercase words (runs of letters, digits and underscores) of a text, as indexed and searched"""
+    return _WORD.findall(str(text).lower())
+
+def parse_query(text: str) -> Tuple[List[str], bool]:
+    """
+    Distinct words of a search text and whether the last one also matches longer words
+    (search as you type: it may not be finished yet).
+    """
+    terms = list(dict.fromkeys(tokenize(text)))
+    return terms, bool(terms) and len(terms[-1]) >= SEARCH_CONFIG['min_prefix_length']
+
+def top_positions(rows: np.ndarray, scores: np.ndarray, offset: int = 0, limit: Optional[int] = None) -> np.ndarray:
+    """
+    Rows of a ranked page: by descending score, ties in row order (rows must be ascending).
+    Only the rows up to the end of the page are sorted.
+    """
+    end = len(rows) if limit is None else min(offset + limit, len(rows))
+    if end <= offset:
+        return rows[:0]
+    if end < len(rows):
+        threshold = np.partition(scores, len(scores) - end)[len(scores) - end]
+        above = np.flatnonzero(scores > threshold)
+        ties = np.flatnonzero(scores == threshold)[:end - len(above)]
+        selected = np.concatenate([above, ties])
+    else:
+        selected = np.arange(len(rows))
+    order = selected[np.lexsort((rows[selected], -scores[selected]))]
+    return rows[order[offset:end]]
+
+class ColumnText:
+    """
+    Words of one column, indexed per distinct value: the value code of each row, and for each word
+    the codes of the values containing it (a code is repeated for each occurrence of the word).
+    Rows grouped by value code are built on demand for selective words; rows appended since are scanned.
+    """
+
+    def __init__(self):
+        self.codes = np.zeros(0, dtype='int32')
+        self.value_codes: Dict[str, int] = {}
+        self.lengths: List[int] = []
+        self.postings: Dict[int, List[int]] = {}
+        self._grouped = None
+
+    def encode(self, values: pd.Series, term_id) -> Tuple[np.ndarray, np.ndarray]:
+        """Value codes of `values` (-1 when missing) and their word counts, indexing unseen values"""
+        local_codes, uniques = pd.factorize(values)
+        mapped = np.empty(len(uniques) + 1, dtype='int32')
+        mapped[-1] = -1
+        for i, value in enumerate(pd.Series(uniques, dtype=object).astype(str).tolist()):
+            code = self.value_codes.get(value)
+            if code is None:
+                code = self.value_codes[value] = len(self.lengths)
+                words = tokenize(value)
+                self.lengths.append(len(words))
+                for word in words:
+                    self.postings.setdefault(term_id(word), []).append(code)
+            mapped[i] = code
+        codes = mapped[local_codes]
+        lengths = np.append(np.asarray(self.lengths, dtype='int32'), 0)[codes]
+        return codes, lengths
+
+    def extend(self, codes: np.ndarray):
+        self.codes = np.concatenate([self.codes, codes])
+
+    def assign(self, positions: np.ndarray, codes: np.ndarray):
+        self.codes[positions] = codes
+        self._grouped = None
+
+    def remove(self, positions: np.ndarray):
+        self.codes = np.delete(self.codes, positions)
+        self._grouped = None
+
+    def _rows_by_value(self) -> Tuple[np.ndarray, np.ndarray, int]:
+        """(rows ordered by value code, start of each code in them, rows covered)"""
+        if self._grouped is None or len(self.codes) - self._grouped[2] > GROUPED_TAIL_RATIO * len(self.codes):
+            order = np.argsort(self.codes, kind='stable')
+            starts = np.searchsorted(self.codes[order], np.arange(len(self.lengths) + 1))
+            self._grouped = (order, starts, len(self.codes))
+        return self._grouped
+
+    def frequencies(self, terms: List[int], max_rows: int):
+        """
+        Occurrences of the words per value code and the number of rows holding them, plus those rows and
+        their occurrences when there are at most max_rows of them (else None); None if no value contains them.
+        """
+        codes = [code for term in terms for code in self.postings.get(term, ())]
+        if not codes:
+            return None
+        values, counts = np.unique(np.asarray(codes, dtype='int64'), return_counts=True)
+        # one slot past the last value, so rows with a missing value (-1) read 0
+        per_value = np.zeros(len(self.lengths) + 1, dtype='int64')
+        per_value[values] = counts
+        order, starts, grouped = self._rows_by_value()
+        covered = len(starts) - 1
+        first = starts[np.minimum(values, covered)]
+        sizes = starts[np.minimum(values + 1, covered)] - first
+        # rows appended since the rows were grouped are scanned
+        tail = per_value[self.codes[grouped:]]
+        appended = np.flatnonzero(tail)
+        matched = int(sizes.sum()) + len(appended)
+        if matched > max_rows:
+            return per_value, matched, None
+        # concatenated slices of the grouped rows
+        rows = order[np.arange(sizes.sum()) + np.repeat(first - (np.cumsum(sizes) - sizes), sizes)]
+        return per_value, matched, (np.concatenate([rows, appended + grouped]),
+                                    np.concatenate([np.repeat(counts, sizes), tail[appended]]))
+
+class TermRows:
+    """
+    Rows containing a search term (any of its words) and its occurrences in them, summed over the
+    columns: listed rows for the columns where the term is selective, counts per value code for the others.
+    """
+
+    def __init__(self, total_rows: int, matches: List[Tuple[np.ndarray, np.ndarray, int, Optional[tuple]]]):
+        self.total_rows = total_rows
+        self.counted = [(per_value, codes) for codes, per_value, _, listed in matches if listed is None]
+        listed = [listed for _, _, _, listed in matches if listed is not None]
+        if listed:
+            self.rows, inverse = np.unique(np.concatenate([rows for rows, _ in listed]), return_inverse=True)
+            self.counts = np.bincount(inverse, weights=np.concatenate([counts for _, counts in listed]))
+        else:
+            self.rows, self.counts = np.zeros(0, dtype='int64'), np.zeros(0, dtype='float64')
+        # rows holding the term in several columns are counted once per column
+        self.matched = min(total_rows, len(self.rows) + sum(matched for _, _, matched, listed in matches if listed is None))
+
+    def positions(self) -> np.ndarray:
+        """All the rows containing the term, ascending"""
+        if not self.counted:
+            return self.rows
+        occurrences = np.zeros(self.total_rows, dtype='float64')
+        occurrences[self.rows] = self.counts
+        for per_value, codes in self.counted:
+            occurrences += per_value[codes]
+        return np.flatnonzero(occurrences)
+
+    def at(self, rows: np.ndarray) -> np.ndarray:
+        """Occurrences in the given rows (0 where the term is absent)"""
+        occurrences = np.zeros(len(rows), dtype='float64')
+        if len(self.rows):
+            found = np.minimum(np.searchsorted(self.rows, rows), len(self.rows) - 1)
+            occurrences += np.where(self.rows[found] == rows, self.counts[found], 0)
+        for per_value, codes in self.counted:
+            occurrences += per_value[codes[rows]]
+        return occurrences
+
+class TextIndex:
+    """
+    Inverted index of the SEARCH_COLUMNS of one table, by row position.
+    Searches match rows containing every word (the last one as a prefix) and score them with BM25,
+    each row being the words of all its searched columns.
+    """
+
+    def __init__(self, frame: pd.DataFrame):
+        self.vocabulary: Dict[str, int] = {}
+        self._sorted_words: List[str] = []
+        self._unsorted_words: List[str] = []
+        self.columns = {col: ColumnText() for col in SEARCH_COLUMNS}
+        self.row_lengths = np.zeros(0, dtype='int32')
+        self.append(frame)
+
+    def __len__(self) -> int:
+        return len(self.row_lengths)
+
+    def _term_id(self, word: str) -> int:
+        term = self.vocabulary.get(word)
+        if term is None:
+            term = self.vocabulary[word] = len(self.vocabulary)
+            self._unsorted_words.append(word)
+        return term
+
+    def _encode(self, frame: pd.DataFrame) -> Tuple[Dict[str, np.ndarray], np.ndarray]:
+        codes = {}
+        lengths = np.zeros(len(frame), dtype='int32')
+        for col, column in self.columns.items():
+            values = frame[col] if col in frame.columns else pd.Series(np.nan, index=frame.index, dtype=object)
+            codes[col], column_lengths = column.encode(values, self._term_id)
+            lengths += column_lengths
+        return codes, lengths
+
+    def append(self, frame: pd.DataFrame):
+        """Indexes rows added at the end of the table"""
+        codes, lengths = self._encode(frame)
+        for col, column in self.columns.items():
+            column.extend(codes[col])
+        self.row_lengths = np.concatenate([self.row_lengths, lengths])
+
+    def update(self, positions: np.ndarray, frame: pd.DataFrame):
+        """Re-indexes the rows at `positions` with their new values (one frame row per position)"""
+        codes, lengths = self._encode(frame)
+        for col, column in self.columns.items():
+            column.assign(positions, codes[col])
+        self.row_lengths[positions] = lengths
+
+    def delete(self, positions: np.ndarray):
+        """Drops the rows at `positions`; the rows after them move up, as in the table"""
+        for column in self.columns.values():
+            column.remove(positions)
+        self.row_lengths = np.delete(self.row_lengths, positions)
+
+    def _matching_terms(self, word: str, prefix: bool) -> List[int]:
+        if not prefix:
+            term = self.vocabulary.get(word)
+            return [] if term is None else [term]
+        if len(self._unsorted_words) > _INSORT_LIMIT:
+            self._sorted_words = sorted(self.vocabulary)
+        else:
+            for new_word in self._unsorted_words:
+                bisect.insort(self._sorted_words, new_word)
+        self._unsorted_words = []
+        start = bisect.bisect_left(self._sorted_words, word)
+        end = bisect.bisect_left(self._sorted_words, word + '\U0010ffff')
+        return [self.vocabulary[match] for match in self._sorted_words[start:end]]
+
+    def _term_rows(self, terms: List[int]) -> Optional[TermRows]:
+        """Rows containing any of the words, or None if no row does"""
+        max_rows = int(len(self) * SPARSE_RATIO)
+        matches = []
+        for column in self.columns.values():
+            found = column.frequencies(terms, max_rows)
+            if found is not None:
+                matches.append((column.codes,) + found)
+        return TermRows(len(self), matches) if matches else None
+
+    def search(self, text: str) -> Tuple[np.ndarray, np.ndarray]:
+        """Positions (ascending) of the rows matching `text` and their BM25 scores"""
+        terms, prefix = parse_query(text)
+        nothing = np.zeros(0, dtype='int64'), np.zeros(0, dtype='float64')
+        if not terms or not len(self):
+            return nothing
+        matches = []
+        for i, word in enumerate(terms):
+            matching = self._matching_terms(word, prefix and i == len(terms) - 1)
+            match = self._term_rows(matching) if matching else None
+            if match is None:
+                return nothing
+            matches.append(match)
+        # candidates from the rarest word, narrowed by the others
+        matches.sort(key=lambda match: match.matched)
+        rows = matches[0].positions()
+        for match in matches[1:]:
+            rows = rows[match.at(rows) > 0]
+        total_rows = len(self)
+        average_length = max(float(self.row_lengths.mean()), 1.0)
+        norm = K1 * (1 - B + B * self.row_lengths[rows] / average_length)
+        scores = np.zeros(len(rows), dtype='float64')
+        for match in matches:
+            idf = math.log(1 + (total_rows - match.matched + 0.5) / (match.matched + 0.5))
+            tf = match.at(rows)
+            scores += idf * tf * (K1 + 1) / (tf + norm)
+        return rows, scores
+
+@dataclass
+class TableText:
+    """Search index of one table and the table version it reflects"""
+    version: Any
+    index: TextIndex
+
+class SearchStore(DerivedStore):
+    """
+    Search indexes shared by all sessions of the process, one per file table (see DerivedStore).
+    A table is indexed on its first search; afterwards appends and record edits re-index only the
+    written rows (edits in place, deleted rows dropped, inserts at the end, as the file backends
+    write them), and a full save re-indexes the frame it saved.
+    """
+
+    def _build(self, version, dataframe: pd.DataFrame) -> TableText:
+        return TableText(version, TextIndex(dataframe))
+
+    def _update(self, entry: TableText, delta) -> bool:
+        """
+        Without removed rows, the added rows were appended at the end. Otherwise both are indexed by row
+        position before the write (as from rollups.changed_rows): removed rows not in `added` were
+        deleted, and added rows past the end of the table were inserted.
+        """
+        added, removed = delta
+        index = entry.index
+        if removed is None:
+            if added is not None and not added.empty:
+                index.append(added)
+            return True
+        keys = np.asarray(added.index if added is not None else [], dtype='int64')
+        updated = keys < len(index)
+        if updated.any():
+            index.update(keys[updated], added[updated])
+        deleted = np.setdiff1d(np.asarray(removed.index, dtype='int64'), keys[updated])
+        if len(deleted):
+            index.delete(deleted)
+        if not updated.all():
+            index.append(added[~updated])
+        return True
+
+    def search(self, table_manager, section: str, subsection: str, text: str,
+               table: Optional[Tuple[Any, pd.DataFrame]] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Positions of the rows of a section/subsection matching `text` and their scores (see TextIndex.search).
+        With `table` (version, frame), the positions are those of that frame: an index of another version
+        is rebuilt from it.
+        """
+        entry = self._current(table_manager, section, subsection, table)
+        with self._lock:
+            return entry.index.search(text)
+
+# Shared by every TableManager in the process
+search_store = SearchStore()
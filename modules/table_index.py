@@ -0,0 +1,399 @@
+"""
+Secondary index module for DemoERP
+Persisted sidecar indexes for CSV tables: row byte offsets, sorted hash indexes on
+lookup columns and trigram indexes for case-insensitive "contains" filters.
+"""
+import csv
+import io
+import json
+import threading
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from typing import Dict, List, Optional
+from modules.write_coordinator import atomic_write
+
+# Columns with a value + trigram index
+INDEXED_COLUMNS = ['Num_Pedido', 'Nombre_Emisor', 'Cod_Emisor']
+
+# Appended rows are kept in a small delta until it grows past this share of the table
+DELTA_REBUILD_RATIO = 0.1
+
+def iter_csv_records(file_obj, position: int = 0):
+    """
+    Yields (byte_offset, raw_record) for each CSV record from the current position of a binary file.
+    A record may span several physical lines when a quoted field contains newlines:
+    it is complete once it holds an even number of quote characters. Blank lines are skipped, as pandas does.
+    """
+    offset = position
+    record = b''
+    record_offset = offset
+    for line in iter(file_obj.readline, b''):
+        if not record:
+            record_offset = offset
+        record += line
+        offset += len(line)
+        if record.count(b'"') % 2 == 0:
+            if record.strip():
+                yield record_offset, record
+            record = b''
+    if record.strip():
+        yield record_offset, record
+
+def parse_record(raw: bytes) -> List[str]:
+    """Parses one raw CSV record into its fields"""
+    return next(csv.reader(io.StringIO(raw.decode('utf-8'))), [])
+
+def record_offsets(file_path: Path, chunk_size: int = 64 * 1024 * 1024) -> np.ndarray:
+    """
+    Byte offsets of every non-blank CSV record (header included), computed with NumPy.
+    A newline ends a record only when the number of quotes seen so far is even.
+    """
+    size = Path(file_path).stat().st_size
+    if size == 0:
+        return np.empty(0, dtype=np.int64)
+    data = np.memmap(file_path, dtype=np.uint8, mode='r')
+    starts = [np.zeros(1, dtype=np.int64)]
+    parity = 0
+    for begin in range(0, size, chunk_size):
+        chunk = data[begin:begin + chunk_size]
+        quote_parity = np.bitwise_xor.accumulate(chunk == ord('"')) ^ bool(parity)
+        newlines = np.flatnonzero((chunk == ord('\n')) & ~quote_parity)
+        starts.append(newlines.astype(np.int64) + begin + 1)
+        parity = quote_parity[-1]
+    starts = np.concatenate(starts)
+    starts = starts[starts < size]
+    first = data[starts]
+    second = data[np.minimum(starts + 1, size - 1)]
+    blank = (first == ord('\n')) | ((first == ord('\r')) & (second == ord('\n')))
+    return starts[~blank]
+
+def _pack_strings(name: str, values: List[str]) -> Dict[str, np.ndarray]:
+    """Strings as one UTF-8 byte array plus end offsets (no object arrays, so no pickle)"""
+    encoded = [value.encode('utf-8') for value in values]
+    return {
+        f"{name}_data": np.frombuffer(b''.join(encoded), dtype=np.uint8),
+        f"{name}_ends": np.cumsum([len(value) for value in encoded], dtype=np.int64),
+    }
+
+def _unpack_strings(arrays, name: str) -> List[str]:
+    data = arrays[f"{name}_data"].tobytes()
+    ends = arrays[f"{name}_ends"].tolist()
+    return [data[start:end].decode('utf-8') for start, end in zip([0] + ends[:-1], ends)]
+
+class ColumnIndex:
+    """
+    Index for one column.
+    Distinct values are kept sorted (`uniques`) so exact lookups are a binary search;
+    `order`/`starts` list the row positions of each value (CSR layout), and `grams`
+    maps each lowercase trigram to the ids of the distinct values that contain it.
+    Rows appended after the last build live in `delta` until the next rebuild.
+    """
+
+    def __init__(self, values: pd.Series):
+        codes, uniques = pd.factorize(values, sort=True)
+        self.uniques = np.asarray(uniques, dtype=object)
+        self.lowered = pd.Series(self.uniques, dtype=object).str.casefold()
+        self.order = np.argsort(codes, kind='stable').astype(np.int64)
+        self.starts = np.searchsorted(codes[self.order], np.arange(len(self.uniques) + 1)).astype(np.int64)
+        self.grams = self._build_grams(self.lowered)
+        self.delta: Dict[str, List[int]] = {}
+
+    @staticmethod
+    def _build_grams(lowered: pd.Series) -> Dict[str, np.ndarray]:
+        lengths = lowered.str.len().fillna(0).to_numpy()
+        pieces = []
+        for start in range(int(lengths.max(initial=0)) - 2):
+            ids = np.flatnonzero(lengths >= start + 3)
+            grams = lowered.iloc[ids].str.slice(start, start + 3).to_numpy()
+            pieces.append(pd.DataFrame({'gram': grams, 'id': ids}))
+        if not pieces:
+            return {}
+        pairs = pd.concat(pieces, ignore_index=True)
+        ids = pairs['id'].to_numpy()
+        return {gram: np.unique(ids[rows]) for gram, rows in pairs.groupby('gram').indices.items()}
+
+    def to_arrays(self, prefix: str) -> Dict[str, np.ndarray]:
+        """Plain numeric arrays of the index (strings as UTF-8 bytes + offsets), for the sidecar file"""
+        grams = sorted(self.grams)
+        postings = [self.grams[gram] for gram in grams]
+        return {
+            **_pack_strings(f"{prefix}uniques", list(self.uniques)),
+            f"{prefix}order": self.order,
+            f"{prefix}starts": self.starts,
+            **_pack_strings(f"{prefix}grams", grams),
+            f"{prefix}gram_starts": np.cumsum([0] + [len(p) for p in postings], dtype=np.int64),
+            f"{prefix}gram_ids": np.concatenate(postings).astype(np.int64) if postings else np.empty(0, dtype=np.int64),
+        }
+
+    @classmethod
+    def from_arrays(cls, arrays, prefix: str, delta: Dict[str, List[int]]) -> 'ColumnIndex':
+        """Rebuilds a column index from the arrays written by `to_arrays`"""
+        index = cls.__new__(cls)
+        index.uniques = np.asarray(_unpack_strings(arrays, f"{prefix}uniques"), dtype=object)
+        index.lowered = pd.Series(index.uniques, dtype=object).str.casefold()
+        index.order = arrays[f"{prefix}order"]
+        index.starts = arrays[f"{prefix}starts"]
+        gram_starts, gram_ids = arrays[f"{prefix}gram_starts"], arrays[f"{prefix}gram_ids"]
+        index.grams = {gram: gram_ids[gram_starts[i]:gram_starts[i + 1]]
+                       for i, gram in enumerate(_unpack_strings(arrays, f"{prefix}grams"))}
+        index.delta = delta
+        return index
+
+    def _rows_of(self, ids: np.ndarray) -> np.ndarray:
+        """Row positions of the given value ids (vectorized CSR gather)"""
+        lengths = self.starts[ids + 1] - self.starts[ids]
+        relative = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        return self.order[np.repeat(self.starts[ids], lengths) + relative]
+
+    def lookup(self, value: str) -> np.ndarray:
+        """Row positions whose value equals `value` exactly"""
+        i = np.searchsorted(self.uniques, value)
+        base = self._rows_of(np.array([i])) if i < len(self.uniques) and self.uniques[i] == value else np.empty(0, dtype=np.int64)
+        return np.sort(np.concatenate([base, np.asarray(self.delta.get(value, []), dtype=np.int64)]))
+
+    def contains(self, text: str) -> np.ndarray:
+        """Sorted row positions whose value contains `text` (case-insensitive)"""
+        needle = text.casefold()
+        if len(needle) >= 3:
+            postings = sorted((self.grams.get(needle[i:i + 3], np.empty(0, dtype=np.int64)) for i in range(len(needle) - 2)), key=len)
+            candidates = postings[0]
+            for posting in postings[1:]:
+                candidates = np.intersect1d(candidates, posting, assume_unique=True)
+        else:
+            # Needles shorter than a trigram scan the distinct values, not the rows
+            candidates = np.arange(len(self.uniques))
+        matched = candidates[self.lowered.iloc[candidates].str.contains(needle, regex=False).to_numpy(dtype=bool)]
+        delta = [positions for value, positions in self.delta.items() if needle in value.casefold()]
+        rows = np.concatenate([self._rows_of(matched)] + [np.asarray(p, dtype=np.int64) for p in delta])
+        return np.sort(rows)
+
+class TableIndex:
+    """
+    Secondary indexes for one CSV table.
+    `offsets` maps row positions to byte offsets so pages can be read with seeks.
+    """
+
+    def __init__(self, header: List[str], offsets: np.ndarray, columns: Dict[str, ColumnIndex], signature):
+        self.header = header
+        self.offsets = offsets
+        self.columns = columns
+        self.signature = signature
+
+    @property
+    def row_count(self) -> int:
+        return len(self.offsets)
+
+    @classmethod
+    def build(cls, file_path: Path, columns: Optional[List[str]] = None) -> 'TableIndex':
+        """Builds the index from the CSV file (vectorized offsets + one pandas read of the indexed columns)"""
+        file_path = Path(file_path)
+        signature = file_signature(file_path)
+        offsets = record_offsets(file_path)
+        if len(offsets) == 0:
+            return cls([], offsets, {}, signature)
+        with open(file_path, 'rb') as f:
+            f.seek(offsets[0])
+            header = parse_record(next(iter_csv_records(f, int(offsets[0])))[1])
+        wanted = [col for col in (columns or INDEXED_COLUMNS) if col in header]
+        values = pd.read_csv(file_path, usecols=wanted, dtype=str, keep_default_na=False)
+        if len(values) != len(offsets) - 1:
+            raise ValueError(f"Row count mismatch while indexing {file_path.name}")
+        column_indexes = {col: ColumnIndex(values[col]) for col in wanted}
+        return cls(header, offsets[1:], column_indexes, signature)
+
+    def extend(self, file_path: Path, from_offset: int) -> Dict:
+        """
+        Indexes the records appended after `from_offset` (the previous file size) into the deltas.
+        Returns the change as a delta log entry (see apply_delta).
+        """
+        positions = {col: self.header.index(col) for col in self.columns}
+        new_offsets = []
+        added = {col: {} for col in self.columns}
+        with open(file_path, 'rb') as f:
+            f.seek(from_offset)
+            for offset, raw in iter_csv_records(f, from_offset):
+                fields = parse_record(raw)
+                row = self.row_count + len(new_offsets)
+                new_offsets.append(offset)
+                for col, i in positions.items():
+                    if i < len(fields) and fields[i]:
+                        added[col].setdefault(fields[i], []).append(row)
+        entry = {'previous': list(self.signature), 'signature': list(file_signature(file_path)),
+                 'offsets': new_offsets, 'deltas': added}
+        self.apply_delta(entry)
+        return entry
+
+    def apply_delta(self, entry: Dict):
+        """Applies a delta log entry: appended row offsets and their values per indexed column"""
+        self.offsets = np.concatenate([self.offsets, np.asarray(entry['offsets'], dtype=np.int64)])
+        for col, added in entry['deltas'].items():
+            if col in self.columns:
+                for value, rows in added.items():
+                    self.columns[col].delta.setdefault(value, []).extend(rows)
+        self.signature = tuple(entry['signature'])
+
+    def delta_size(self) -> int:
+        return max((sum(len(p) for p in c.delta.values()) for c in self.columns.values()), default=0)
+
+    def search(self, filters: Optional[Dict[str, str]]) -> Optional[np.ndarray]:
+        """
+        Sorted row positions matching all 'contains' filters, or None when a filter column is not indexed.
+        With no active filters every row matches.
+        """
+        active = {col: value for col, value in (filters or {}).items() if value}
+        if any(col not in self.columns for col in active):
+            return None
+        result = None
+        for col, value in active.items():
+            hits = self.columns[col].contains(value)
+            result = hits if result is None else np.intersect1d(result, hits, assume_unique=True)
+        if result is None:
+            return np.arange(self.row_count, dtype=np.int64)
+        return result
+
+    def read_rows(self, file_path: Path, positions: np.ndarray) -> List[List[str]]:
+        """Reads the given rows from the CSV file by seeking to their byte offsets"""
+        rows = []
+        with open(file_path, 'rb') as f:
+            for position in positions:
+                offset = int(self.offsets[int(position)])
+                f.seek(offset)
+                rows.append(parse_record(next(iter_csv_records(f, offset))[1]))
+        return rows
+
+def file_signature(file_path: Path):
+    """(mtime, size) of a file, used to detect indexes that are out of date"""
+    stat = Path(file_path).stat()
+    return (stat.st_mtime_ns, stat.st_size)
+
+def index_path(file_path: Path) -> Path:
+    """Sidecar path of the index for a CSV file"""
+    return Path(f"{file_path}.idx")
+
+def delta_path(file_path: Path) -> Path:
+    """
+    Append-only log of the rows indexed since the sidecar was written (one JSON line per append),
+    so an append does not rewrite the whole sidecar
+    """
+    return Path(f"{file_path}.idx.delta")
+
+# Indexes already loaded in this process, keyed by CSV path
+_loaded: Dict[str, TableIndex] = {}
+_lock = threading.Lock()
+
+# Bumped when the sidecar layout changes (older sidecars are rebuilt)
+SIDECAR_FORMAT = 1
+
+def _write_sidecar(f, index: TableIndex):
+    """
+    Writes the index as an .npz archive: numeric/byte arrays plus a JSON metadata entry
+    (header, signature, column names and deltas). Nothing in it is unpickled when loading.
+    """
+    names = list(index.columns)
+    meta = {
+        'format': SIDECAR_FORMAT,
+        'header': index.header,
+        'signature': list(index.signature) if index.signature is not None else None,
+        'columns': names,
+        'deltas': [index.columns[col].delta for col in names],
+    }
+    arrays = {'meta': np.frombuffer(json.dumps(meta).encode('utf-8'), dtype=np.uint8), 'offsets': index.offsets}
+    for i, col in enumerate(names):
+        arrays.update(index.columns[col].to_arrays(f"c{i}_"))
+    np.savez(f, **arrays)
+
+def save_index(file_path: Path, index: TableIndex):
+    """Persists the whole index next to the CSV file (emptying the delta log) and keeps it in memory"""
+    atomic_write(index_path(file_path), lambda f: _write_sidecar(f, index), mode='wb')
+    # delta entries chain from the signature they were appended at, so stale ones would not apply anyway
+    delta_path(file_path).unlink(missing_ok=True)
+    with _lock:
+        _loaded[str(file_path)] = index
+
+def _append_delta(file_path: Path, entry: Dict):
+    """Adds an append to the delta log; the caller holds the CSV file's exclusive lock"""
+    with open(delta_path(file_path), 'a', encoding='utf-8') as f:
+        f.write(json.dumps(entry) + '\n')
+
+def _replay_deltas(file_path: Path, index: TableIndex) -> TableIndex:
+    """Applies the delta log entries that follow on from the index's signature (a torn last line ends it)"""
+    try:
+        with open(delta_path(file_path), encoding='utf-8') as f:
+            lines = f.read().split('\n')
+    except FileNotFoundError:
+        return index
+    for line in lines:
+        try:
+            entry = json.loads(line)
+        except ValueError:
+            break
+        if index.signature is None or tuple(entry['previous']) != tuple(index.signature):
+            continue
+        index.apply_delta(entry)
+    return index
+
+def _load_sidecar(file_path: Path) -> Optional[TableIndex]:
+    sidecar = index_path(file_path)
+    if not sidecar.exists():
+        return None
+    try:
+        with np.load(sidecar, allow_pickle=False) as archive:
+            arrays = {name: archive[name] for name in archive.files}
+        meta = json.loads(arrays['meta'].tobytes().decode('utf-8'))
+        if meta.get('format') != SIDECAR_FORMAT:
+            return None
+        columns = {col: ColumnIndex.from_arrays(arrays, f"c{i}_", {value: [int(p) for p in positions] for value, positions in delta.items()})
+                   for i, (col, delta) in enumerate(zip(meta['columns'], meta['deltas']))}
+        signature = tuple(meta['signature']) if meta['signature'] is not None else None
+        return _replay_deltas(file_path, TableIndex(meta['header'], arrays['offsets'].astype(np.int64), columns, signature))
+    except Exception as e:
+        # Unreadable or pre-npz sidecar: treated as missing, the caller rebuilds it
+        print(f"Error reading index {sidecar}: {e}")
+        return None
+
+def get_index(file_path: Path) -> Optional[TableIndex]:
+    """
+    Returns an up-to-date index for a CSV file: from memory, from the sidecar file,
+    or rebuilt (and persisted) when the CSV changed outside the indexed write paths.
+    """
+    file_path = Path(file_path)
+    if not file_path.exists():
+        return None
+    signature = file_signature(file_path)
+    with _lock:
+        index = _loaded.get(str(file_path))
+    if index is not None and index.signature == signature:
+        return index
+    index = _load_sidecar(file_path)
+    if index is not None and index.signature == signature:
+        with _lock:
+            _loaded[str(file_path)] = index
+        return index
+    index = TableIndex.build(file_path)
+    save_index(file_path, index)
+    return index
+
+def refresh_after_append(file_path: Path, previous_size: int):
+    """Updates the index incrementally after rows were appended at `previous_size`"""
+    file_path = Path(file_path)
+    with _lock:
+        index = _loaded.get(str(file_path))
+    if index is None or index.signature is None or index.signature[1] != previous_size:
+        # Another process may have appended since: its sidecar is newer than our copy
+        index = _load_sidecar(file_path)
+    if index is None or index.signature is None or index.signature[1] != previous_size:
+        save_index(file_path, TableIndex.build(file_path))
+        return
+    entry = index.extend(file_path, previous_size)
+    if index.delta_size() > max(1000, DELTA_REBUILD_RATIO * index.row_count):
+        # the delta is folded back into the sorted indexes (and the sidecar rewritten) once it grows
+        save_index(file_path, TableIndex.build(file_path))
+        return
+    _append_delta(file_path, entry)
+    with _lock:
+        _loaded[str(file_path)] = index
+
+def rebuild_index(file_path: Path):
+    """Rebuilds the index after the CSV file was rewritten"""
+    save_index(file_path, TableIndex.build(file_path))
@@ -4,30 +4,26 @@ Provides the UI and logic for displaying and editing existing records.
 """
 import streamlit as st
 import pandas as pd
+from functools import partial
+from config import LIMITS
+from modules.changeset import changeset_from_editor_state
+from database import to_display_frame
+from modules.export import EXPORT_FORMATS, available_formats, export_file_name, export_temp_file
+from modules.validation import validate_changes
+from modules.instrumentation import span, timed
 
+@st.fragment
+@timed('view.records')
 def show_existing_records(section: str, subsection: str, table_manager):
     """
     Render the table view for existing records in the ERP.
-    Allows filtering, inline editing, and saving changes.
+    Allows full-text search, filtering, inline editing, and saving changes.
+    Runs as a fragment: filters, paging and edits rerun only this view (a save reruns the app),
+    and only the current page of rows is sent to the browser.
     """
     st.markdown('<div class="section-header"><h3>📊 Existing Records</h3></div>', unsafe_allow_html=True)
-    df = table_manager.get_dataframe(section, subsection)
-    if df.empty:
-        st.info(f"ℹ️ No records in {section} - {subsection}")
-        return
-    # Format columns for display
-    if 'Fecha_Pedido' in df.columns:
-        df['Fecha_Pedido'] = pd.to_datetime(df['Fecha_Pedido'], errors='coerce', dayfirst=True).dt.strftime('%d/%m/%Y')
-    if 'Fecha_Entrega' in df.columns:
-        df['Fecha_Entrega'] = pd.to_datetime(df['Fecha_Entrega'], errors='coerce', dayfirst=True).dt.strftime('%d/%m/%Y')
-    if 'Cantidad' in df.columns:
-        df['Cantidad'] = pd.to_numeric(df['Cantidad'], errors='coerce').fillna(0).astype(int)
-    text_columns = ['Num_Pedido', 'Nombre_Emisor', 'Cod_Emisor', 'Cod_Art_EAN', 'Cod_Art_Comprador', 'Descripcion', 'Tipo', 'Tipo_Cliche', 'Papel', 'Cod_IPG', 'PDF_Link']
-    for col in text_columns:
-        if col in df.columns:
-            df[col] = df[col].astype(str).replace('nan', '').replace('""', '').replace('"', '')
-            df[col] = df[col].replace('""', '').replace("''", '')
-    df = df.fillna('')
+    # Full-text search over descriptions, codes and names (best matches first)
+    search_text = st.text_input("🔎 Search", key="records_search", placeholder="Words from descriptions, codes, names...").strip()
     # Filter controls
     col_filter1, col_filter2, col_filter3 = st.columns(3)
     with col_filter1:
@@ -35,52 +31,98 @@ def show_existing_records(section: str, subsection: str, table_manager):
     with col_filter2:
         filter_sender = st.text_input("🔍 Filter by Sender", key="filter_sender_search", placeholder="Type to filter...")
     with col_filter3:
-        if filter_order or filter_sender:
+        if filter_order or filter_sender or search_text:
             st.info("🔍 Active filters")
         else:
             st.info("👀 No filters")
-    df_filtered = df.copy()
-    if filter_order:
-        df_filtered = df_filtered[df_filtered['Num_Pedido'].str.contains(filter_order, case=False, na=False)]
-    if filter_sender:
-        df_filtered = df_filtered[df_filtered['Nombre_Emisor'].str.contains(filter_sender, case=False, na=False)]
-    st.markdown(f"**Total records:** {len(df_filtered)} of {len(df)}")
+    # Filtering and paging run in the backend; only the current page is loaded
+    filters = {'Num_Pedido': filter_order, 'Nombre_Emisor': filter_sender}
+    page_size = LIMITS['max_records_display']
+    page_key = f"page_{section}_{subsection}"
+    page = st.session_state.get(page_key, 1)
+    # Version of the table before the rows are read: edits are only saved if it is still current
+    loaded_version = table_manager.base_version(section, subsection)
+
+    def load_page(page):
+        offset = (page - 1) * page_size
+        if search_text:
+            return table_manager.search(section, subsection, search_text, filters, offset=offset, limit=page_size)
+        return table_manager.query(section, subsection, filters, offset=offset, limit=page_size)
+
+    df_filtered, total_matches = load_page(page)
+    total_pages = max(1, -(-total_matches // page_size))
+    if page > total_pages:
+        page = total_pages
+        st.session_state[page_key] = page
+        df_filtered, total_matches = load_page(page)
+    if filter_order or filter_sender or search_text:
+        total_records = table_manager.query(section, subsection, {}, limit=0)[1]
+    else:
+        total_records = total_matches
+    if total_records == 0:
+        st.info(f"ℹ️ No records in {section} - {subsection}")
+        return
+    # Only the page leaves the compact table model, as plain editable values (DD/MM/YYYY dates, '' for missing text)
+    with span('view.records.display_frame'):
+        df_filtered = to_display_frame(df_filtered)
+    # Row keys: the database id in PostgreSQL, the row position in CSV
+    if 'id' in df_filtered.columns:
+        df_filtered = df_filtered.set_index('id')
+    st.markdown(f"**Total records:** {total_matches} of {total_records}")
+    if total_pages > 1:
+        st.number_input(f"Page (of {total_pages}, {page_size} records per page)", min_value=1, max_value=total_pages, step=1, key=page_key)
     if len(df_filtered) > 0:
         st.info("💡 **Table editing:** You can edit cells directly, add rows with ➕ or delete rows by selecting the checkbox ☑️ and pressing ❌ (delete button). Changes are saved permanently to the CSV when you press 'Save Changes'!")
     if not df_filtered.empty:
-        df_edited = st.data_editor(
-            df_filtered,
-            use_container_width=True,
-            hide_index=True,
-            num_rows="dynamic",
-            column_config={
-                "Num_Pedido": st.column_config.TextColumn("Order Number", help="Order number"),
-                "Nombre_Emisor": st.column_config.TextColumn("Sender Name", help="Customer sender name"),
-                "Cod_Emisor": st.column_config.TextColumn("Sender Code", help="Sender code"),
-                "Fecha_Pedido": st.column_config.TextColumn("Order Date", help="Order date (DD/MM/YYYY)"),
-                "Fecha_Entrega": st.column_config.TextColumn("Delivery Date", help="Delivery date (DD/MM/YYYY)"),
-                "Cod_Art_EAN": st.column_config.TextColumn("EAN Code", help="Article EAN code"),
-                "Cod_Art_Comprador": st.column_config.TextColumn("Buyer Code", help="Buyer's article code"),
-                "Descripcion": st.column_config.TextColumn("Description", help="Product description"),
-                "Cantidad": st.column_config.NumberColumn("Quantity", min_value=0, step=1, format="%d"),
-                "Tipo": st.column_config.TextColumn("Product Type", help="Product type"),
-                "Tipo_Cliche": st.column_config.TextColumn("Cliché Type", help="Cliché type"),
-                "Papel": st.column_config.TextColumn("Paper", help="Paper type"),
-                "Cod_IPG": st.column_config.TextColumn("Internal Code", help="Internal code"),
-                "PDF_Link": st.column_config.LinkColumn("PDF Link", help="Order PDF link - Click to open", display_text="🔗 View PDF")
-            }
-        )
+        # The editor key changes after each save and with the filters, so edit state always
+        # refers to the rows currently displayed and is never replayed on stale data
+        version_key = f"editor_version_{section}_{subsection}"
+        editor_key = f"editor_{section}_{subsection}_{st.session_state.get(version_key, 0)}_{hash((search_text, filter_order, filter_sender, page))}"
+        # Table version the editor's rows were first read at (kept while the same editor is shown)
+        base_key = f"editor_base_{section}_{subsection}"
+        if st.session_state.get(base_key, (None,))[0] != editor_key:
+            st.session_state[base_key] = (editor_key, loaded_version)
+        base_version = st.session_state[base_key][1]
+        with span('view.records.data_editor'):
+            st.data_editor(
+                df_filtered,
+                key=editor_key,
+                use_container_width=True,
+                hide_index=True,
+                num_rows="dynamic",
+                column_config={
+                    "Num_Pedido": st.column_config.TextColumn("Order Number", help="Order number"),
+                    "Nombre_Emisor": st.column_config.TextColumn("Sender Name", help="Customer sender name"),
+                    "Cod_Emisor": st.column_config.TextColumn("Sender Code", help="Sender code"),
+                    "Fecha_Pedido": st.column_config.TextColumn("Order Date", help="Order date (DD/MM/YYYY)"),
+                    "Fecha_Entrega": st.column_config.TextColumn("Delivery Date", help="Delivery date (DD/MM/YYYY)"),
+                    "Cod_Art_EAN": st.column_config.TextColumn("EAN Code", help="Article EAN code"),
+                    "Cod_Art_Comprador": st.column_config.TextColumn("Buyer Code", help="Buyer's article code"),
+                    "Descripcion": st.column_config.TextColumn("Description", help="Product description"),
+                    "Cantidad": st.column_config.NumberColumn("Quantity", min_value=0, step=1, format="%d"),
+                    "Tipo": st.column_config.TextColumn("Product Type", help="Product type"),
+                    "Tipo_Cliche": st.column_config.TextColumn("Cliché Type", help="Cliché type"),
+                    "Papel": st.column_config.TextColumn("Paper", help="Paper type"),
+                    "Cod_IPG": st.column_config.TextColumn("Internal Code", help="Internal code"),
+                    "PDF_Link": st.column_config.LinkColumn("PDF Link", help="Order PDF link - Click to open", display_text="🔗 View PDF")
+                }
+            )
         # Save and info controls
         col_save, col_info = st.columns([2, 3])
         with col_save:
             if st.button("💾 Save Changes", key=f"save_{section}_{subsection}"):
-                original_records = len(df)
-                edited_records = len(df_edited)
-                deleted_records = original_records - edited_records
-                added_records = max(0, edited_records - original_records)
-                df_to_save = df_edited.copy()
-                # No need to convert dates, already strings in DD/MM/YYYY format
-                if table_manager.save_dataframe(section, subsection, df_to_save):
+                # Only the edited, added and deleted rows are persisted; rows hidden by filters are untouched
+                changes = changeset_from_editor_state(df_filtered, st.session_state.get(editor_key, {}), base_version)
+                deleted_records = len(changes.deletes)
+                added_records = len(changes.inserts)
+                # Edited and added rows follow the same rules as the entry form
+                errors = validate_changes(df_filtered, changes)
+                if errors:
+                    st.error("❌ **Cannot save changes. The following rows have missing or invalid fields:**\n" +
+                             "\n".join(f"- **{row}:** {', '.join(messages)}" for row, messages in errors.items()))
+                # repeated order lines are checked by apply_changes, under the lock it writes with
+                elif table_manager.apply_changes(section, subsection, changes):
+                    st.session_state[version_key] = st.session_state.get(version_key, 0) + 1
                     change_messages = []
                     if deleted_records > 0:
                         change_messages.append(f"🗑️ {deleted_records} record(s) **successfully deleted**")
@@ -88,11 +130,53 @@ def show_existing_records(section: str, subsection: str, table_manager):
                         change_messages.append(f"➕ {added_records} record(s) **successfully added**")
                     if change_messages:
                         st.success(f"✅ **Changes saved successfully!** {' • '.join(change_messages)}")
-                        st.info(f"📊 **Current total records:** {len(df_to_save)}")
+                        st.info(f"📊 **Current total records:** {total_records - deleted_records + added_records}")
                         st.rerun()
                     else:
                         st.success("✅ **Changes saved successfully!** Records have been **updated correctly**")
+                elif changes.is_stale(table_manager.base_version(section, subsection)):
+                    # Rows were written by someone else since this page was loaded: the edits could land on other rows
+                    st.session_state[version_key] = st.session_state.get(version_key, 0) + 1
+                    st.error("❌ **The table was changed by someone else since it was loaded.** Nothing was saved: "
+                             "the current rows are shown again, please apply your changes to them.")
                 else:
-                    st.error("❌ **Error saving changes to the database**")
+                    duplicates = table_manager.duplicate_mask(section, subsection, changes.inserts)
+                    if duplicates.any():
+                        st.error("❌ **Cannot save changes. These new rows repeat an order line already saved:** " +
+                                 ", ".join(f"New row {pos + 1}" for pos in duplicates.nonzero()[0]))
+                    else:
+                        st.error("❌ **Error saving changes to the database**")
         with col_info:
-            st.info("💡 **How to use:** Edit cells directly, use ➕ to add rows, select rows with ☑️ and use ❌ to delete. Press 'Save Changes' to make changes permanent.") 
\ No newline at end of file
+            st.info("💡 **How to use:** Edit cells directly, use ➕ to add rows, select rows with ☑️ and use ❌ to delete. Press 'Save Changes' to make changes permanent.")
+    show_export(section, subsection, table_manager, filters)
+
+def show_export(section: str, subsection: str, table_manager, filters: dict):
+    """
+    Export of the records matching the current filters (CSV, XLSX, PDF order sheets).
+    The file is built on request in a temporary file, offered until the format or the filters change.
+    """
+    with st.expander("📥 Export"):
+        formats = available_formats()
+        export_format = st.radio("Format", formats, key=f"export_format_{section}_{subsection}", horizontal=True,
+                                 format_func=lambda fmt: {'pdf': 'PDF order sheets'}.get(fmt, fmt.upper()))
+        st.caption("Exports every record matching the filters above (the search box is not applied). For very large tables use "
+                   "`python manage.py export`, which writes the file without holding it in memory.")
+        export_key = f"export_{section}_{subsection}"
+        request = (export_format, tuple(sorted(filters.items())))
+        prepared = st.session_state.get(export_key)
+        if prepared and prepared[0] != request:
+            # the format or the filters changed: the prepared file is no longer offered
+            prepared[1].unlink(missing_ok=True)
+            del st.session_state[export_key]
+            prepared = None
+        if st.button("📦 Prepare export", key=f"prepare_{export_key}"):
+            with st.spinner("Exporting..."):
+                path = export_temp_file(table_manager, section, subsection, export_format, filters)
+            if prepared:
+                prepared[1].unlink(missing_ok=True)
+            prepared = st.session_state[export_key] = (request, path)
+        if prepared and prepared[1].exists():
+            file_name = export_file_name(section, subsection, export_format)
+            # the file is opened (and streamed to the browser) only when the button is clicked
+            st.download_button(f"⬇️ Download {file_name}", partial(prepared[1].open, 'rb'), file_name=file_name,
+                               mime=EXPORT_FORMATS[export_format][1], on_click="ignore", key=f"download_{export_key}")
@@ -0,0 +1,189 @@
+"""
+Validation module for DemoERP
+Schema-driven, vectorized record validation shared by the entry form, the table editor,
+bulk imports and the ingestion API.
+"""
+import numpy as np
+import pandas as pd
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+from config import LIMITS
+from database import COLUMN_SCHEMA, COLUMN_TYPES
+from modules.dates import DISPLAY_FORMAT, parse_dates
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+except ImportError:  # pandas string methods are used instead
+    pa = pc = None
+
+# Labels used in the entry form
+FIELD_LABELS = {
+    'Num_Pedido': 'Order Number',
+    'Nombre_Emisor': 'Sender Name',
+    'Cod_Emisor': 'Sender Code',
+    'Fecha_Pedido': 'Order Date',
+    'Fecha_Entrega': 'Delivery Date',
+    'Cod_Art_EAN': 'EAN Code',
+    'Cod_Art_Comprador': 'Buyer Code',
+    'Descripcion': 'Description',
+    'Cantidad': 'Quantity',
+    'Tipo': 'Product Type',
+    'Tipo_Cliche': 'Cliché Type',
+    'Papel': 'Paper',
+    'Cod_IPG': 'Internal Code',
+    'PDF_Link': 'PDF Link'
+}
+
+# Fields marked with * in the entry form
+REQUIRED_FIELDS = ['Num_Pedido', 'Nombre_Emisor', 'Descripcion', 'Fecha_Pedido', 'Cantidad']
+
+# Text columns without a length in the database schema
+TEXT_LIMITS = {'Descripcion': LIMITS['max_description_length']}
+
+@dataclass(frozen=True)
+class FieldRule:
+    """Checks for one column: kind is 'text', 'date' or 'integer'"""
+    column: str
+    label: str
+    kind: str
+    required: bool = False
+    max_length: Optional[int] = None
+    minimum: Optional[int] = None
+
+def build_rules() -> List[FieldRule]:
+    """
+    One rule per COLUMN_SCHEMA column, typed from the database column types (COLUMN_TYPES): text
+    columns get a length limit, dates the DD/MM/YYYY format, integers a positive minimum if required.
+    """
+    rules = []
+    for attr, col in COLUMN_SCHEMA.items():
+        kind, length = COLUMN_TYPES[attr]
+        required = col in REQUIRED_FIELDS
+        if kind == 'date':
+            rules.append(FieldRule(col, FIELD_LABELS[col], 'date', required))
+        elif kind == 'integer':
+            rules.append(FieldRule(col, FIELD_LABELS[col], 'integer', required, minimum=1 if required else None))
+        else:
+            rules.append(FieldRule(col, FIELD_LABELS[col], 'text', required, max_length=length or TEXT_LIMITS.get(col)))
+    return rules
+
+RULES = build_rules()
+
+def _column(df: pd.DataFrame, col: str) -> pd.Series:
+    return df[col] if col in df.columns else pd.Series(None, index=df.index, dtype=object)
+
+def _text(values: pd.Series) -> pd.Series:
+    """Values as strings (missing stays missing); Arrow-backed when pyarrow is installed"""
+    return values.astype('str')
+
+def _blank_and_length(values: pd.Series, max_length: Optional[int]):
+    """
+    (blank, too_long) masks of a text column. With pyarrow, blank strings are found without
+    trimming every value, and characters are only counted if some value exceeds the limit in bytes.
+    """
+    text = _text(values)
+    if pc is None:
+        filled = text.fillna('')
+        too_long = (filled.str.len() > max_length).to_numpy() if max_length else None
+        return (filled.str.strip() == '').to_numpy(), too_long
+    array = pa.array(text, type=pa.large_string(), from_pandas=True)
+    byte_length = pc.binary_length(array)
+    blank = pc.or_kleene(pc.equal(byte_length, 0), pc.utf8_is_space(array)).fill_null(True).to_numpy(zero_copy_only=False)
+    too_long = None
+    if max_length:
+        too_long = pc.greater(byte_length, max_length).fill_null(False).to_numpy(zero_copy_only=False)
+        if too_long.any():
+            # longer in bytes than the limit: count characters (multi-byte characters may still fit)
+            too_long = pc.greater(pc.utf8_length(array), max_length).fill_null(False).to_numpy(zero_copy_only=False)
+    return blank, too_long
+
+def _check(rule: FieldRule, values: pd.Series) -> Dict[str, np.ndarray]:
+    """Boolean failure masks of one column, keyed by error message"""
+    failures = {}
+    if rule.kind == 'date':
+        if pd.api.types.is_datetime64_any_dtype(values.dtype):
+            missing, invalid = values.isna().to_numpy(), np.zeros(len(values), dtype=bool)
+        else:
+            # dates repeat a lot: each distinct value is checked once (missing values get code -1)
+            codes, uniques = pd.factorize(values)
+            uniques = pd.Series(uniques, dtype=object)
+            blank = uniques.map(lambda value: isinstance(value, str) and not value.strip()).to_numpy(dtype=bool)
+            unparsed = ~blank & parse_dates(uniques, formats=(DISPLAY_FORMAT,), fallback=False).isna().to_numpy()
+            missing = np.append(blank, True)[codes]
+            invalid = np.append(unparsed, False)[codes]
+        if rule.required:
+            failures[rule.label] = missing
+        failures[f"{rule.label} (format DD/MM/YYYY)"] = invalid
+    elif rule.kind == 'integer':
+        numbers = pd.to_numeric(values, errors='coerce').to_numpy(dtype='float64', na_value=np.nan)
+        if rule.minimum is not None:
+            # missing or non-numeric quantities count as 0
+            failures[f"{rule.label} (must be greater than {rule.minimum - 1})"] = ~(np.nan_to_num(numbers) >= rule.minimum)
+    else:
+        blank, too_long = _blank_and_length(values, rule.max_length)
+        if rule.required:
+            failures[rule.label] = blank
+        if rule.max_length:
+            failures[f"{rule.label} (max {rule.max_length} characters)"] = too_long
+    return failures
+
+def validate_frame(df: pd.DataFrame, rules: Optional[List[FieldRule]] = None) -> pd.DataFrame:
+    """
+    Validates a DataFrame of records column by column.
+    Returns the error matrix: one boolean column per check (named by its error message),
+    True where the row fails it, indexed like `df`. Dates are DD/MM/YYYY text or datetime64.
+    """
+    matrix = {}
+    for rule in rules or RULES:
+        matrix.update(_check(rule, _column(df, rule.column)))
+    return pd.DataFrame(matrix, index=df.index)
+
+def _failure_patterns(matrix: pd.DataFrame):
+    """
+    Failing rows grouped by their combination of failed checks: returns (failing mask,
+    messages of each distinct combination, combination code of each failing row)
+    """
+    combination = np.zeros(len(matrix), dtype='int64')
+    for bit, col in enumerate(matrix.columns):
+        combination |= matrix[col].to_numpy(dtype='int64') << bit
+    failing = combination != 0
+    codes, patterns = pd.factorize(combination[failing])
+    labels = list(matrix.columns)
+    return failing, [[label for bit, label in enumerate(labels) if pattern >> bit & 1] for pattern in patterns], codes
+
+def row_messages(matrix: pd.DataFrame) -> Dict[Any, List[str]]:
+    """Error messages of each failing row, {row label: [messages]}"""
+    failing, patterns, codes = _failure_patterns(matrix)
+    return {key: patterns[code] for key, code in zip(matrix.index[failing], codes)}
+
+def validate_records(df: pd.DataFrame) -> pd.Series:
+    """
+    Validates a DataFrame of records (dates already normalized to DD/MM/YYYY, empty meaning missing).
+    Returns one string per row listing the errors, empty for valid rows.
+    """
+    failing, patterns, codes = _failure_patterns(validate_frame(df))
+    texts = np.array(['; '.join(f"• {message}" for message in messages) for messages in patterns] or [''], dtype=object)
+    errors = np.full(len(df), '', dtype=object)
+    errors[failing] = texts[codes]
+    return pd.Series(errors, index=df.index, dtype=object)
+
+def validate_changes(source: pd.DataFrame, changes) -> Dict[str, List[str]]:
+    """
+    Validates the rows a ChangeSet would write: edited rows of `source` (indexed by row key)
+    with the edits applied, and inserted rows. Deleted rows are not checked.
+    Returns {row description: [messages]} for the failing rows.
+    """
+    edited_keys = [key for key in changes.updates if key in source.index]
+    edited = source.loc[edited_keys].astype(object)
+    for key in edited_keys:
+        for col, value in changes.updates[key].items():
+            if col in edited.columns:
+                edited.at[key, col] = value
+    positions = source.index.get_indexer(edited_keys)
+    edited.index = [f"Row {pos + 1} (order {order})" if order else f"Row {pos + 1}"
+                    for pos, order in zip(positions, edited.get('Num_Pedido', pd.Series('', index=edited.index)).fillna(''))]
+    inserts = changes.inserts.astype(object).reset_index(drop=True)
+    inserts.index = [f"New row {pos + 1}" for pos in range(len(inserts))]
+    rows = pd.concat([edited, inserts]) if len(inserts) else edited
+    return row_messages(validate_frame(rows)) if len(rows) else {}
@@ -0,0 +1,159 @@
+"""
+Write coordination module for DemoERP
+Advisory file locks, atomic file replacement and a single writer thread that
+coalesces concurrent appends to the same file into one batched flush.
+"""
+import os
+import queue
+import tempfile
+import threading
+from concurrent.futures import Future
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: only the in-process locks apply
+    fcntl = None
+
+# Appends waiting in the queue are flushed together, up to this many requests per batch
+MAX_BATCH_REQUESTS = 500
+
+def lock_path(file_path: Path) -> Path:
+    """Sidecar lock file for a data file (the data file itself is replaced, so it cannot hold the lock)"""
+    return Path(f"{file_path}.lock")
+
+# One in-process lock per file: flock only serializes across processes and file descriptors
+_thread_locks: Dict[str, threading.RLock] = {}
+_thread_locks_guard = threading.Lock()
+
+# Files whose exclusive lock is held by the current thread (nested file_lock calls are no-ops)
+_held = threading.local()
+
+def _thread_lock(file_path: Path) -> threading.RLock:
+    with _thread_locks_guard:
+        return _thread_locks.setdefault(str(file_path), threading.RLock())
+
+def holds_lock(file_path: Path) -> bool:
+    """True if the current thread holds the exclusive lock of a data file"""
+    return str(Path(file_path)) in getattr(_held, 'paths', ())
+
+@contextmanager
+def file_lock(file_path: Path, exclusive: bool = True):
+    """
+    Holds an advisory lock on a data file: exclusive for writers, shared for readers.
+    Writers are also serialized inside the process; shared readers only take the fcntl lock.
+    A thread already holding the exclusive lock can lock the same file again.
+    """
+    file_path = Path(file_path)
+    held = getattr(_held, 'paths', None)
+    if held is None:
+        held = _held.paths = set()
+    if str(file_path) in held:
+        yield
+        return
+    thread_lock = _thread_lock(file_path) if exclusive else None
+    if thread_lock is not None:
+        thread_lock.acquire()
+        held.add(str(file_path))
+    try:
+        if fcntl is None or not file_path.parent.exists():
+            yield
+            return
+        with open(lock_path(file_path), 'a') as handle:
+            fcntl.flock(handle, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(handle, fcntl.LOCK_UN)
+    finally:
+        if thread_lock is not None:
+            held.discard(str(file_path))
+            thread_lock.release()
+
+def atomic_write(file_path: Path, write: Callable, mode: str = 'w', **open_kwargs):
+    """
+    Writes a file atomically: `write(handle)` fills a temp file in the same directory,
+    which is flushed to disk and renamed over `file_path` (readers see the old or the new file, never a partial one).
+    """
+    file_path = Path(file_path)
+    fd, tmp_name = tempfile.mkstemp(dir=file_path.parent, prefix=f".{file_path.name}.", suffix='.tmp')
+    try:
+        # mkstemp creates 0600 files: keep the permissions of the file being replaced (or the umask default)
+        if file_path.exists():
+            os.chmod(tmp_name, file_path.stat().st_mode & 0o777)
+        else:
+            umask = os.umask(0)
+            os.umask(umask)
+            os.chmod(tmp_name, 0o666 & ~umask)
+        with os.fdopen(fd, mode, **open_kwargs) as handle:
+            write(handle)
+            handle.flush()
+            os.fsync(handle.fileno())
+        os.replace(tmp_name, file_path)
+    except BaseException:
+        if os.path.exists(tmp_name):
+            os.remove(tmp_name)
+        raise
+
+class AppendCoordinator:
+    """
+    Single background writer for appends.
+    Callers submit (file, payload, flush) requests and wait on a Future; the writer thread drains
+    everything queued so far and calls `flush(file, payloads)` once per file and flush function
+    under the file's exclusive lock, so N concurrent appends cost one write (and one fsync).
+    """
+
+    def __init__(self):
+        self._queue: "queue.Queue[Tuple[Path, Any, Callable, Future]]" = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def _ensure_started(self):
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="csv-append-writer", daemon=True)
+                self._thread.start()
+
+    def submit(self, file_path: Path, payload: Any, flush: Callable[[Path, List[Any]], None]) -> Future:
+        """Queues an append; the Future resolves once the batch holding it is on disk"""
+        future = Future()
+        self._ensure_started()
+        self._queue.put((Path(file_path), payload, flush, future))
+        return future
+
+    def append(self, file_path: Path, payload: Any, flush: Callable[[Path, List[Any]], None]):
+        """Queues an append and blocks until it is written (re-raises the flush error)"""
+        return self.submit(file_path, payload, flush).result()
+
+    def _drain(self) -> List[Tuple[Path, Any, Callable, Future]]:
+        batch = [self._queue.get()]
+        while len(batch) < MAX_BATCH_REQUESTS:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            groups: Dict[Tuple[str, Callable], List] = {}
+            for request in self._drain():
+                groups.setdefault((str(request[0]), request[2]), []).append(request)
+            for (_, flush), requests in groups.items():
+                requests = [request for request in requests if request[3].set_running_or_notify_cancel()]
+                if not requests:
+                    continue
+                try:
+                    with file_lock(requests[0][0]):
+                        flush(requests[0][0], [payload for _, payload, _, _ in requests])
+                except Exception as e:
+                    for *_, future in requests:
+                        future.set_exception(e)
+                else:
+                    for *_, future in requests:
+                        future.set_result(True)
+
+# Shared by every backend in the process
+append_coordinator = AppendCoordinator()